@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+
+
+class CommonConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'common'
+
+    def ready(self):
+        from .cache import read_cache_options
+        read_cache_options()  # 2段目の設定誤りは起動時に知らせる
+        from .instrumentation import install_serializer_timing
+        install_serializer_timing()
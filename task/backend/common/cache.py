@@ -0,0 +1,242 @@
+"""
+ほとんど変わらない一覧（プロジェクト・ユーザー）のシリアライズ済みレスポンスを持つ読み取りキャッシュ。
+
+1段目はプロセス内の LRU（件数上限 + TTL）、2段目は Django のキャッシュフレームワーク
+（SHARED_ALIAS。Redis などプロセス外のキャッシュの別名。未指定なら2段目を使わない）。
+無効化は世代番号で行う。2段目のキーには世代を含め、invalidate() で世代を進めて
+古いエントリを一括で見えなくする。1段目は同じプロセス内なら即座に消え、
+他プロセスの1段目は LOCAL_TTL 秒以内に追従する。
+2段目に LocMemCache は使えない（世代がプロセスごとになり、他プロセスの無効化が届かない）。
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from rest_framework.response import Response
+
+from . import metrics
+
+DEFAULTS = {
+    'LOCAL_MAX_ENTRIES': 256,
+    'LOCAL_TTL': 5,
+    'SHARED_ALIAS': None,
+    'SHARED_TTL': 300,
+}
+
+lookups = metrics.counter(
+    'read_cache_lookups', '読み取りキャッシュの参照回数（result は hit / miss）', ('cache', 'tier', 'result'),
+)
+invalidations = metrics.counter(
+    'read_cache_invalidations', '読み取りキャッシュを無効化した回数', ('cache',),
+)
+
+_MISSING = object()
+
+PROCESS_LOCAL_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+class LRUCache:
+    """
+    件数上限と TTL を持つスレッドセーフな LRU
+    """
+
+    def __init__(self, max_entries=256, ttl=5, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires <= self.clock():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class TieredCache:
+    def __init__(self, name, local_max_entries=256, local_ttl=5, shared_alias=None, shared_ttl=300):
+        self.name = name
+        self.local = LRUCache(local_max_entries, local_ttl) if local_ttl > 0 else None
+        self.shared_alias = shared_alias
+        self.shared_ttl = shared_ttl
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias] if self.shared_alias else None
+
+    def _generation_key(self):
+        return f'readcache:{self.name}:generation'
+
+    def _generation(self):
+        shared = self.shared
+        if shared is None:
+            return 0
+        generation = shared.get(self._generation_key())
+        if generation is None:
+            # 世代が消えていたら（再起動・追い出し）取り直す。add なので同時に来ても1つに決まる
+            shared.add(self._generation_key(), 1, None)
+            generation = shared.get(self._generation_key(), 1)
+        return generation
+
+    def get(self, key):
+        if self.local is not None:
+            value = self.local.get(key, _MISSING)
+            if value is not _MISSING:
+                lookups.inc(cache=self.name, tier='local', result='hit')
+                return value
+            lookups.inc(cache=self.name, tier='local', result='miss')
+        shared = self.shared
+        if shared is not None:
+            value = shared.get(f'readcache:{self.name}:{self._generation()}:{key}', _MISSING)
+            if value is not _MISSING:
+                lookups.inc(cache=self.name, tier='shared', result='hit')
+                if self.local is not None:
+                    self.local.set(key, value)
+                return value
+            lookups.inc(cache=self.name, tier='shared', result='miss')
+        return None
+
+    def set(self, key, value):
+        if self.local is not None:
+            self.local.set(key, value)
+        shared = self.shared
+        if shared is not None:
+            shared.set(f'readcache:{self.name}:{self._generation()}:{key}', value, self.shared_ttl)
+
+    def invalidate(self):
+        invalidations.inc(cache=self.name)
+        if self.local is not None:
+            self.local.clear()
+        shared = self.shared
+        if shared is not None:
+            try:
+                shared.incr(self._generation_key())
+            except ValueError:
+                shared.set(self._generation_key(), 2, None)
+
+    def invalidate_on_commit(self):
+        """
+        変更直後とコミット後の両方で消す。コミット前に別リクエストが
+        古い内容を詰め直しても、コミット後の無効化で取り除かれる
+        """
+        self.invalidate()
+        transaction.on_commit(self.invalidate)
+
+    def stats(self):
+        tiers = {}
+        for tier in ('local', 'shared'):
+            hits = lookups.value(cache=self.name, tier=tier, result='hit')
+            misses = lookups.value(cache=self.name, tier=tier, result='miss')
+            total = hits + misses
+            tiers[tier] = {'hits': hits, 'misses': misses, 'hit_ratio': round(hits / total, 4) if total else None}
+        return {
+            'name': self.name,
+            'local_entries': len(self.local) if self.local is not None else 0,
+            'invalidations': invalidations.value(cache=self.name),
+            **tiers,
+        }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def read_cache(name):
+    with _caches_lock:
+        cache = _caches.get(name)
+        if cache is None:
+            options = read_cache_options()
+            cache = _caches[name] = TieredCache(
+                name,
+                local_max_entries=options['LOCAL_MAX_ENTRIES'],
+                local_ttl=options['LOCAL_TTL'],
+                shared_alias=options['SHARED_ALIAS'],
+                shared_ttl=options['SHARED_TTL'],
+            )
+        return cache
+
+
+def read_cache_options():
+    options = {**DEFAULTS, **getattr(settings, 'READ_CACHE', {})}
+    alias = options['SHARED_ALIAS']
+    if alias and settings.CACHES.get(alias, {}).get('BACKEND') in PROCESS_LOCAL_BACKENDS:
+        raise ImproperlyConfigured(
+            f"READ_CACHE['SHARED_ALIAS'] の {alias!r} はプロセス内のキャッシュです。"
+            'プロセス間で共有できるキャッシュを指定するか None にしてください'
+        )
+    return options
+
+
+def all_read_caches():
+    with _caches_lock:
+        return list(_caches.values())
+
+
+@receiver(setting_changed)
+def reset_read_caches(setting, **kwargs):
+    if setting in ('READ_CACHE', 'CACHES'):
+        with _caches_lock:
+            _caches.clear()
+
+
+class CachedListMixin:
+    """
+    一覧のシリアライズ結果を read_cache(list_cache_name) に持つ。ヒットすれば DB には問い合わせない。
+    ConditionalGetMixin と組み合わせた場合は ETag の材料も一緒に持つ。
+    キーは get_list_cache_scope()（利用者ごとに見える範囲が違うならその単位）と URL
+    """
+    list_cache_name = None
+
+    def get_list_cache_scope(self):
+        return 'all'
+
+    def list(self, request, *args, **kwargs):
+        cache = read_cache(self.list_cache_name)
+        key = f'{self.get_list_cache_scope()}:{request.build_absolute_uri()}'
+        entry = cache.get(key)
+        if entry is None:
+            entry = self.build_cached_list()
+            cache.set(key, entry)
+        version, data = entry
+        if version is None:
+            return Response(data)
+        return self.conditional_response(request, *version, lambda: Response(data))
+
+    def build_cached_list(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        version = self.get_collection_version(queryset) if hasattr(self, 'conditional_response') else None
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return version, self.get_serializer(queryset, many=True).data
+        return version, self.get_paginated_response(self.get_serializer(page, many=True).data).data
@@ -0,0 +1,102 @@
+import hashlib
+from calendar import timegm
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = '他の利用者が先に変更しました。最新の内容を読み込み直してください。'
+    default_code = 'precondition_failed'
+
+
+class EditConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = '他の利用者が同時に変更しました。最新の内容を読み込み直してください。'
+    default_code = 'conflict'
+
+
+def if_match_given(request):
+    return bool(request.headers.get('If-Match'))
+
+
+def check_if_match(request, *current):
+    """
+    If-Match があり、現在の強い ETag（current のどれか）と一致するものが無ければ PreconditionFailed。
+    If-Match は強い比較なので、W/ 付きの値は一致しない。* は存在するかだけを見る
+    """
+    header = request.headers.get('If-Match')
+    if not header:
+        return
+    etags = parse_etags(header)
+    if etags == ['*']:
+        return
+    if not set(etags).intersection(current):
+        raise PreconditionFailed()
+
+
+def latest_of(*values):
+    return max(filter(None, values), default=None)
+
+
+class ConditionalGetMixin:
+    """
+    GET の一覧・詳細でシリアライズ前に ETag / Last-Modified を計算し、
+    If-None-Match / If-Modified-Since が一致すれば 304 を返す。
+    一覧のバージョンは集計1クエリ（max(updated_at) と件数）だけで求める。
+    """
+    version_field = 'updated_at'
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        parts, last_modified = self.get_collection_version(queryset)
+        return self.conditional_response(
+            request, parts, last_modified,
+            lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        parts, last_modified = self.get_object_version(instance)
+        return self.conditional_response(
+            request, parts, last_modified,
+            lambda: self.finalize_retrieve(instance),
+        )
+
+    def finalize_retrieve(self, instance):
+        # get_object は済んでいるので RetrieveModelMixin.retrieve を通さずにシリアライズする
+        return Response(self.get_serializer(instance).data)
+
+    def get_collection_version(self, queryset):
+        version = queryset.order_by().aggregate(latest=Max(self.version_field), count=Count('pk'))
+        return [version['count'], version['latest']], version['latest']
+
+    def get_object_version(self, instance):
+        latest = getattr(instance, self.version_field)
+        return [instance.pk, latest], latest
+
+    def conditional_response(self, request, parts, last_modified, render):
+        etag = self.make_etag(request, parts)
+        timestamp = timegm(last_modified.utctimetuple()) if last_modified else None
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = render()
+        if 200 <= response.status_code < 300 or response.status_code == 304:
+            response['ETag'] = etag
+            if timestamp is not None and response.status_code != 304:
+                response['Last-Modified'] = http_date(timestamp)
+            # 認証ユーザーごとに内容が変わり得るので共有キャッシュさせず、毎回再検証させる
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ('Accept', 'Authorization'))
+        return response
+
+    def make_etag(self, request, parts):
+        # 同じコレクションでもクエリ文字列（ページ・絞り込み）・ユーザー・形式（Accept）が違えば別表現
+        key = [request.get_full_path(), getattr(request.user, 'pk', None), getattr(request, 'accepted_media_type', None), *parts]
+        raw = '|'.join(value.isoformat() if hasattr(value, 'isoformat') else str(value) for value in key)
+        return 'W/' + quote_etag(hashlib.md5(raw.encode()).hexdigest())
@@ -0,0 +1,172 @@
+"""
+大量の行を CSV / NDJSON で少しずつ書き出すエクスポート（StreamingHttpResponse）。
+
+行は values_list(...).iterator(chunk_size) で読む。PostgreSQL ではサーバー側カーソルになり、
+一覧 API のようにモデルやシリアライザを全件分作らないので、件数が増えてもメモリは一定。
+ASGI（uvicorn）では同期イテレータを渡すと Django が全体を list にしてから送るため、
+専用スレッドで行を読み、上限付きのキューを通して非同期イテレータで返す。
+"""
+import asyncio
+import csv
+import io
+import json
+import queue
+import threading
+from datetime import date, datetime
+
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+CHUNK_SIZE = 2000
+MAX_PENDING_CHUNKS = 8
+
+
+class CSVExportRenderer(BaseRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # 本体は StreamingHttpResponse で返すので、ここに来るのはエラーだけ（JSON で返す）
+        return JSONRenderer().render(data)
+
+
+class NDJSONExportRenderer(CSVExportRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+def export_value(value):
+    if isinstance(value, datetime):
+        # 一覧 API（DRF の DateTimeField）と同じく TIME_ZONE の時刻で出す
+        return timezone.localtime(value).isoformat() if timezone.is_aware(value) else value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def csv_chunks(header, rows, chunk_size=CHUNK_SIZE):
+    buffer = io.StringIO()
+    # Excel で文字化けしないよう BOM を付ける
+    buffer.write('\ufeff')
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for index, row in enumerate(rows, 1):
+        writer.writerow(['' if value is None else export_value(value) for value in row])
+        if index % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def ndjson_chunks(header, rows, chunk_size=CHUNK_SIZE):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(header, map(export_value, row))), ensure_ascii=False, separators=(',', ':')))
+        if len(lines) >= chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def iterate_in_thread(make_chunks, max_pending=MAX_PENDING_CHUNKS):
+    """
+    make_chunks() が返す同期イテレータを専用スレッドで回し、非同期イテレータとして返す。
+    スレッドは自分の DB 接続を使い、終わったら閉じる。受け手が切断したら読み出しを止める
+    """
+    done = object()
+
+    async def iterate():
+        pending = queue.Queue(maxsize=max_pending)
+        stopped = threading.Event()
+
+        def put(item):
+            while not stopped.is_set():
+                try:
+                    pending.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce():
+            try:
+                for chunk in make_chunks():
+                    if not put(chunk):
+                        return
+                put(done)
+            except Exception as exc:
+                put(exc)
+            finally:
+                connections.close_all()
+
+        def take():
+            try:
+                return pending.get(timeout=1)
+            except queue.Empty:
+                return None
+
+        threading.Thread(target=produce, name='export-producer', daemon=True).start()
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                item = await loop.run_in_executor(None, take)
+                if item is None:
+                    continue
+                if item is done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stopped.set()
+
+    return iterate()
+
+
+class StreamingExportMixin:
+    """
+    APIView に ?format=csv|ndjson のストリーミングエクスポートを付ける（指定が無ければ CSV）。
+    get_export_columns() は (見出し, values_list の参照名) のリスト、
+    get_export_queryset() は並び順まで決めたクエリセットを返す
+    """
+    renderer_classes = [CSVExportRenderer, NDJSONExportRenderer]
+    export_filename = 'export'
+    export_chunk_size = CHUNK_SIZE
+
+    def get_export_columns(self):
+        raise NotImplementedError
+
+    def get_export_queryset(self):
+        raise NotImplementedError
+
+    def export_response(self, request):
+        columns = self.get_export_columns()
+        header = [name for name, _ in columns]
+        queryset = self.get_export_queryset().values_list(*[lookup for _, lookup in columns])
+        renderer = request.accepted_renderer
+        write = ndjson_chunks if renderer.format == 'ndjson' else csv_chunks
+        chunk_size = self.export_chunk_size
+
+        def make_chunks():
+            return write(header, queryset.iterator(chunk_size=chunk_size), chunk_size)
+
+        if isinstance(getattr(request, '_request', request), ASGIRequest):
+            content = iterate_in_thread(make_chunks)
+        else:
+            content = make_chunks()
+        response = StreamingHttpResponse(content, content_type=f'{renderer.media_type}; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{self.export_filename}.{renderer.format}"'
+        return response
+
+    def handle_exception(self, exc):
+        # 認証・入力エラーは CSV ではなく JSON で返す
+        response = super().handle_exception(exc)
+        self.request.accepted_renderer = JSONRenderer()
+        self.request.accepted_media_type = JSONRenderer.media_type
+        return response
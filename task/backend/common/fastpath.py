@@ -0,0 +1,77 @@
+"""
+読み取り専用の一覧向けに、シリアライザを通さず .values() の行から直接 dict を作る高速経路。
+
+出力するフィールド・順序・値の形式は元のシリアライザ（の fields）から組み立てるので、
+シリアライザにフィールドを足せばこちらも追従する。日付・日時などは元のフィールドの
+to_representation をそのまま使い、文字列・数値・主キーの関連は値をそのまま入れる。
+メソッドフィールドや入れ子のシリアライザなど、1列に対応しないフィールドには使えない。
+"""
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import fields as drf_fields
+from rest_framework import relations
+
+# 値をそのまま出せるフィールド（.values() の値がそのまま表現になる）
+PASSTHROUGH_FIELDS = (
+    drf_fields.CharField,
+    drf_fields.ChoiceField,
+    drf_fields.IntegerField,
+    drf_fields.BooleanField,
+    drf_fields.FloatField,
+    drf_fields.ReadOnlyField,
+    relations.PrimaryKeyRelatedField,
+)
+# 元のフィールドの to_representation で変換するもの
+CONVERTED_FIELDS = (
+    drf_fields.DateTimeField,
+    drf_fields.DateField,
+    drf_fields.TimeField,
+    drf_fields.DecimalField,
+    drf_fields.UUIDField,
+)
+
+
+class ValuesRepresentation:
+    """
+    serializer_class と同じ形の dict を .values() の行から作る
+    """
+
+    def __init__(self, serializer_class, columns=None):
+        if columns is not None:
+            self.columns = columns
+            self.lookups = list(dict.fromkeys(lookup for _, lookup, _ in columns))
+            return
+        self.columns = []
+        for name, field in serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if field.source == '*' or not isinstance(field, PASSTHROUGH_FIELDS + CONVERTED_FIELDS):
+                raise ImproperlyConfigured(
+                    f'{serializer_class.__name__}.{name}（{type(field).__name__}）は .values() の1列に対応しません'
+                )
+            lookup = '__'.join(field.source_attrs)
+            convert = field.to_representation if isinstance(field, CONVERTED_FIELDS) else None
+            self.columns.append((name, lookup, convert))
+        self.lookups = list(dict.fromkeys(lookup for _, lookup, _ in self.columns))
+
+    def subset(self, names):
+        """
+        names のフィールドだけを出す表現（?fields= / ?omit= 用）
+        """
+        return type(self)(None, [column for column in self.columns if column[0] in names])
+
+    def values(self, queryset, extra=()):
+        """
+        必要な列だけを読むクエリセット（関連先の列は JOIN で同じ行に入る）。
+        extra は表現には出さないが行に含めておく列（ページングの並び順のキーなど）
+        """
+        return queryset.values(*dict.fromkeys([*self.lookups, *extra]))
+
+    def to_representation(self, row):
+        data = {}
+        for name, lookup, convert in self.columns:
+            value = row[lookup]
+            data[name] = convert(value) if convert is not None and value is not None else value
+        return data
+
+    def many(self, rows):
+        return [self.to_representation(row) for row in rows]
@@ -0,0 +1,206 @@
+"""
+リクエストごとのクエリ数・DB 時間・シリアライズ時間・全体の時間を計る（RequestInstrumentationMiddleware）。
+
+計測値は
+- レスポンスの Server-Timing ヘッダ（ブラウザの開発者ツールで見られる）
+- ルート（URL パターン）ごとのヒストグラム（/api/metrics/ で Prometheus 形式）
+- SLOW_REQUEST_SECONDS を超えたリクエストのログ（遅い SQL を SQL_SAMPLE_SIZE 件まで添える）
+に出す。SQL は connection.execute_wrapper で1本ごとに時間を測るだけで、文字列の整形や
+保存は遅い上位の数件に限るため、本番で常時有効にしても負荷はわずか。
+ストリーミングのレスポンスはヘッダを返すまでを計る。
+"""
+import contextvars
+import heapq
+import itertools
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections
+from django.dispatch import receiver
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'SERVER_TIMING': True,
+    'SLOW_REQUEST_SECONDS': 1.0,
+    # 遅いリクエストのうちログに出す割合（大量に遅いときのログ量を抑える）
+    'SLOW_LOG_SAMPLE_RATE': 1.0,
+    'SQL_SAMPLE_SIZE': 5,
+    'SQL_MAX_LENGTH': 1000,
+    'METRICS_TOKEN': None,
+}
+
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+request_seconds = metrics.histogram(
+    'http_request_duration_seconds', 'リクエストの処理時間', ('method', 'route'),
+)
+db_seconds = metrics.histogram(
+    'http_request_db_seconds', '1リクエストで SQL の実行にかかった時間の合計', ('method', 'route'),
+)
+serializer_seconds = metrics.histogram(
+    'http_request_serializer_seconds', '1リクエストでシリアライザの data 生成にかかった時間の合計', ('method', 'route'),
+)
+query_counts = metrics.histogram(
+    'http_request_queries', '1リクエストで実行した SQL の数', ('method', 'route'), buckets=QUERY_BUCKETS,
+)
+responses = metrics.counter(
+    'http_responses', 'レスポンスの件数', ('method', 'route', 'status'),
+)
+slow_requests = metrics.counter(
+    'http_slow_requests', 'SLOW_REQUEST_SECONDS を超えたリクエストの件数', ('method', 'route'),
+)
+
+_options = None
+
+
+def get_options():
+    global _options
+    if _options is None:
+        _options = {**DEFAULTS, **getattr(settings, 'INSTRUMENTATION', {})}
+    return _options
+
+
+@receiver(setting_changed)
+def reset_options(setting, **kwargs):
+    global _options
+    if setting == 'INSTRUMENTATION':
+        _options = None
+
+
+class RequestTimings:
+    """
+    1リクエスト分の計測値。SQL は遅い順に sample_size 件だけ文字列を残す
+    """
+
+    def __init__(self, sample_size=5):
+        self.queries = 0
+        self.db = 0.0
+        self.serializer = 0.0
+        self.sample_size = sample_size
+        self._slowest = []
+        self._order = itertools.count()
+        self._serializer_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.queries += 1
+            self.db += duration
+            if self.sample_size:
+                entry = (duration, next(self._order), sql)
+                if len(self._slowest) < self.sample_size:
+                    heapq.heappush(self._slowest, entry)
+                elif duration > self._slowest[0][0]:
+                    heapq.heapreplace(self._slowest, entry)
+
+    def slowest_queries(self):
+        return [(duration, sql) for duration, _, sql in sorted(self._slowest, reverse=True)]
+
+
+_current = contextvars.ContextVar('request_timings', default=None)
+
+
+def current_timings():
+    return _current.get()
+
+
+def timed_serializer_data(data_property):
+    """
+    BaseSerializer.data を包み、計測中のリクエストならシリアライズ時間を足す。
+    入れ子で .data を読んでも二重には数えない
+    """
+
+    def data(serializer):
+        timings = _current.get()
+        if timings is None or timings._serializer_depth:
+            return data_property.fget(serializer)
+        timings._serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return data_property.fget(serializer)
+        finally:
+            timings.serializer += time.perf_counter() - started
+            timings._serializer_depth -= 1
+
+    return property(data)
+
+
+def install_serializer_timing():
+    from rest_framework.serializers import BaseSerializer
+    if not getattr(BaseSerializer.data, '_instrumented', False):
+        wrapped = timed_serializer_data(BaseSerializer.data)
+        wrapped.fget._instrumented = True
+        BaseSerializer.data = wrapped
+
+
+def route_of(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return '/' + match.route if match.route else match.view_name
+
+
+def server_timing(timings, total):
+    return ', '.join([
+        f'db;dur={timings.db * 1000:.1f};desc="{timings.queries} queries"',
+        f'serialize;dur={timings.serializer * 1000:.1f}',
+        f'total;dur={total * 1000:.1f}',
+    ])
+
+
+class RequestInstrumentationMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        options = get_options()
+        if not options['ENABLED']:
+            return self.get_response(request)
+
+        timings = RequestTimings(options['SQL_SAMPLE_SIZE'])
+        token = _current.set(timings)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - started
+
+        method, route = request.method, route_of(request)
+        request_seconds.observe(total, method=method, route=route)
+        db_seconds.observe(timings.db, method=method, route=route)
+        serializer_seconds.observe(timings.serializer, method=method, route=route)
+        query_counts.observe(timings.queries, method=method, route=route)
+        responses.inc(method=method, route=route, status=response.status_code)
+        if options['SERVER_TIMING']:
+            response['Server-Timing'] = server_timing(timings, total)
+        if total >= options['SLOW_REQUEST_SECONDS']:
+            slow_requests.inc(method=method, route=route)
+            if random.random() < options['SLOW_LOG_SAMPLE_RATE']:
+                self.log_slow_request(request, response, route, timings, total, options)
+        return response
+
+    def log_slow_request(self, request, response, route, timings, total, options):
+        limit = options['SQL_MAX_LENGTH']
+        queries = ''.join(
+            f'\n  {duration * 1000:.1f}ms {sql[:limit]}' for duration, sql in timings.slowest_queries()
+        )
+        logger.warning(
+            '遅いリクエスト %s %s（%s）status=%s total=%.1fms db=%.1fms queries=%d serialize=%.1fms%s',
+            request.method, request.get_full_path(), route, response.status_code,
+            total * 1000, timings.db * 1000, timings.queries, timings.serializer * 1000, queries,
+        )
@@ -0,0 +1,232 @@
+"""
+REST API の負荷試験（manage.py loadtest）。
+
+シナリオごとに同時実行数ぶんのクライアントからリクエストを送り、レイテンシの
+p50/p95/p99、スループット、1リクエストあたりのクエリ数を集計する。
+--base-url を指定しなければ Django の test Client でプロセス内から叩く（クエリ数も数えられる）。
+指定すれば起動済みのサーバーへ HTTP で送る。
+"""
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+
+DEFAULT_PASSWORD = 'testpass123'
+
+
+def percentile(sorted_values, fraction):
+    """
+    最近接順位法のパーセンタイル（sorted_values は昇順）
+    """
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * fraction // 1))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(samples, elapsed):
+    """
+    samples: [(秒, ステータス, クエリ数 or None)] を集計する
+    """
+    latencies = sorted(seconds for seconds, _, _ in samples)
+    queries = [count for _, _, count in samples if count is not None]
+    statuses = {}
+    for _, status, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for _, status, _ in samples if status >= 400),
+        'statuses': statuses,
+        'throughput': round(len(samples) / elapsed, 2) if elapsed else None,
+        'mean_ms': ms(sum(latencies) / len(latencies)) if latencies else None,
+        'p50_ms': ms(percentile(latencies, 0.50)),
+        'p95_ms': ms(percentile(latencies, 0.95)),
+        'p99_ms': ms(percentile(latencies, 0.99)),
+        'max_ms': ms(latencies[-1]) if latencies else None,
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+
+def compare(current, baseline, tolerance=0.1):
+    """
+    シナリオごとに基準値との差を出す。p95 が tolerance を超えて悪化した・スループットが
+    tolerance を超えて落ちた・クエリ数が増えたものを regressions に入れる
+    """
+    result = {'tolerance': tolerance, 'scenarios': {}, 'regressions': []}
+    for name, stats in current['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        if base is None:
+            continue
+        entry = {}
+        for key in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput', 'queries_per_request'):
+            if stats.get(key) is not None and base.get(key):
+                entry[f'{key}_ratio'] = round(stats[key] / base[key], 3)
+        result['scenarios'][name] = entry
+        if entry.get('p95_ms_ratio', 0) > 1 + tolerance:
+            result['regressions'].append(f'{name}: p95 {base["p95_ms"]}ms -> {stats["p95_ms"]}ms')
+        if entry.get('throughput_ratio', 1) < 1 - tolerance:
+            result['regressions'].append(f'{name}: throughput {base["throughput"]} -> {stats["throughput"]} req/s')
+        if (stats.get('queries_per_request') or 0) > (base.get('queries_per_request') or 0) and base.get('queries_per_request') is not None:
+            result['regressions'].append(
+                f'{name}: queries/request {base["queries_per_request"]} -> {stats["queries_per_request"]}'
+            )
+    return result
+
+
+class QueryCounter:
+    """
+    このスレッドの接続で実行された SQL を数える（DEBUG カーソルより軽い execute_wrapper 版）
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class InProcessClient:
+    def __init__(self):
+        self.client = Client()
+        self.token = None
+
+    def login(self, username, password):
+        response = self.client.post('/api/token/', {'username': username, 'password': password}, content_type='application/json')
+        if response.status_code != 200:
+            raise RuntimeError(f'{username} でログインできません（{response.status_code}）')
+        data = response.json()
+        self.token = data['access']
+        return data
+
+    def request(self, method, path, body=None, authenticated=True):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {self.token}'} if authenticated and self.token else {}
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            if method == 'POST':
+                response = self.client.post(path, body or {}, content_type='application/json', **headers)
+            else:
+                response = self.client.get(path, **headers)
+        return time.perf_counter() - started, response.status_code, counter.count, response
+
+
+class HttpClient:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.token = None
+
+    def login(self, username, password):
+        _, status, _, data = self.request('POST', '/api/token/', {'username': username, 'password': password}, authenticated=False)
+        if status != 200:
+            raise RuntimeError(f'{username} でログインできません（{status}）')
+        self.token = data['access']
+        return data
+
+    def request(self, method, path, body=None, authenticated=True):
+        headers = {'Content-Type': 'application/json'}
+        if authenticated and self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                payload = response.read()
+                status = response.status
+        except urllib.error.HTTPError as error:
+            payload = error.read()
+            status = error.code
+        elapsed = time.perf_counter() - started
+        try:
+            parsed = json.loads(payload) if payload else None
+        except ValueError:
+            parsed = None
+        return elapsed, status, None, parsed
+
+
+SCENARIOS = {
+    'tasks': ('GET', '/api/tasks/'),
+    'projects': ('GET', '/api/projects/'),
+    'notifications': ('GET', '/api/notifications/'),
+    'token': ('POST', '/api/token/'),
+    'token_refresh': ('POST', '/api/token/refresh/'),
+}
+
+
+class LoadTest:
+    def __init__(self, scenarios, requests, concurrency, usernames, password=DEFAULT_PASSWORD, base_url=None):
+        self.scenarios = scenarios
+        self.requests = requests
+        self.concurrency = max(1, concurrency)
+        self.usernames = usernames
+        self.password = password
+        self.base_url = base_url
+
+    def make_client(self, index):
+        client = HttpClient(self.base_url) if self.base_url else InProcessClient()
+        username = self.usernames[index % len(self.usernames)]
+        tokens = client.login(username, self.password)
+        return client, username, tokens
+
+    def run(self):
+        results = {}
+        clients = [self.make_client(i) for i in range(self.concurrency)]
+        for name in self.scenarios:
+            results[name] = self.run_scenario(name, clients)
+        return {
+            'config': {
+                'scenarios': list(self.scenarios),
+                'requests': self.requests,
+                'concurrency': self.concurrency,
+                'mode': 'http' if self.base_url else 'in-process',
+                'base_url': self.base_url,
+                'debug': settings.DEBUG,
+            },
+            'scenarios': results,
+        }
+
+    def run_scenario(self, name, clients):
+        method, path = SCENARIOS[name]
+        samples = []
+        lock = threading.Lock()
+        per_client = [self.requests // len(clients) + (1 if i < self.requests % len(clients) else 0) for i in range(len(clients))]
+
+        def worker(index):
+            client, username, tokens = clients[index]
+            local = []
+            try:
+                for _ in range(per_client[index]):
+                    if name == 'token':
+                        sample = client.request(method, path, {'username': username, 'password': self.password}, authenticated=False)
+                    elif name == 'token_refresh':
+                        sample = client.request(method, path, {'refresh': tokens['refresh']}, authenticated=False)
+                        if sample[1] == 200:
+                            body = sample[3] if isinstance(sample[3], dict) else sample[3].json()
+                            tokens['refresh'] = body.get('refresh', tokens['refresh'])
+                    else:
+                        sample = client.request(method, path)
+                    local.append(sample[:3])
+            finally:
+                if threading.current_thread() is not threading.main_thread():
+                    connection.close()
+            with lock:
+                samples.extend(local)
+
+        started = time.perf_counter()
+        if len(clients) == 1:
+            worker(0)
+        else:
+            with ThreadPoolExecutor(max_workers=len(clients)) as executor:
+                list(executor.map(worker, range(len(clients))))
+        return summarize(samples, time.perf_counter() - started)
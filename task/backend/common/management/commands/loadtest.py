@@ -0,0 +1,73 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from common.loadtest import SCENARIOS, DEFAULT_PASSWORD, LoadTest, compare
+
+
+class Command(BaseCommand):
+    help = 'API に同時にリクエストを送り、レイテンシ・スループット・クエリ数を JSON で出力します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f'カンマ区切り（{", ".join(SCENARIOS)}）')
+        parser.add_argument('--requests', type=int, default=200, help='シナリオごとのリクエスト数')
+        parser.add_argument('--concurrency', type=int, default=4, help='同時に送るクライアント数')
+        parser.add_argument('--usernames', default='user1,user2,user3,user4,user5', help='ログインに使うユーザー（create_dummy_data で作られるもの）')
+        parser.add_argument('--password', default=DEFAULT_PASSWORD)
+        parser.add_argument('--base-url', help='起動済みサーバーの URL。省略時はプロセス内で実行する')
+        parser.add_argument('--seed', action='store_true', help='実行前に create_dummy_data でデータを作る')
+        parser.add_argument('--seed-users', type=int, default=5)
+        parser.add_argument('--seed-projects', type=int, default=3)
+        parser.add_argument('--seed-tasks', type=int, default=40)
+        parser.add_argument('--output', help='結果の JSON を書き出すファイル')
+        parser.add_argument('--baseline', help='比較する以前の結果の JSON ファイル')
+        parser.add_argument('--tolerance', type=float, default=0.1, help='悪化とみなす割合（0.1 = 10%%）')
+        parser.add_argument('--fail-on-regression', action='store_true', help='悪化があれば終了コード1で終わる')
+
+    def handle(self, *args, **options):
+        scenarios = [name.strip() for name in options['scenarios'].split(',') if name.strip()]
+        unknown = [name for name in scenarios if name not in SCENARIOS]
+        if unknown:
+            raise CommandError(f'不明なシナリオです: {", ".join(unknown)}')
+        if options['seed']:
+            call_command(
+                'create_dummy_data',
+                users=options['seed_users'], projects=options['seed_projects'], tasks=options['seed_tasks'],
+                stdout=self.stderr,
+            )
+
+        loadtest = LoadTest(
+            scenarios,
+            requests=options['requests'],
+            concurrency=options['concurrency'],
+            usernames=[name.strip() for name in options['usernames'].split(',') if name.strip()],
+            password=options['password'],
+            base_url=options['base_url'],
+        )
+        if options['base_url']:
+            result = loadtest.run()
+        else:
+            # test Client は Host: testserver で送るので、プロセス内実行のときだけ許可する
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                result = loadtest.run()
+        result['config']['timestamp'] = time.strftime('%Y-%m-%dT%H:%M:%S%z')
+
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as fp:
+                result['comparison'] = compare(result, json.load(fp), options['tolerance'])
+
+        output = json.dumps(result, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as fp:
+                fp.write(output + '\n')
+        self.stdout.write(output)
+
+        regressions = result.get('comparison', {}).get('regressions', [])
+        for regression in regressions:
+            self.stderr.write(self.style.WARNING(f'悪化: {regression}'))
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f'{len(regressions)} 件の悪化があります')
@@ -0,0 +1,158 @@
+import base64
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    (updated_at, id) などの複合キーで位置を覚えるカーソルページネーション。
+    OFFSET を使わないので、どれだけ深いページでもインデックスを辿るだけで取得できる。
+    並び順はビューの pagination_ordering で上書きできる。
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    ordering = ('-updated_at', '-id')
+    invalid_cursor_message = '無効なカーソルです。'
+
+    def __init__(self):
+        self.page_size = settings.REST_FRAMEWORK.get('PAGE_SIZE') or 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = tuple(getattr(view, 'pagination_ordering', self.ordering))
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.build_after_filter(position))
+
+        # 1件多く取って次ページの有無を判定する（COUNT は発行しない）
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        position = [self.get_value(last, field.lstrip('-')) for field in self.ordering]
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(position))
+
+    def get_value(self, obj, name):
+        # .values() の行（dict）でもページングできる
+        if isinstance(obj, dict):
+            return obj[name]
+        return getattr(obj, name)
+
+    def build_after_filter(self, position):
+        # (a, b) < (x, y) を a <= x AND (a < x OR (a = x AND b < y)) に展開する。
+        # 先頭の a <= x がインデックス範囲条件になるので深いページでも走査量が増えない。
+        names = [field.lstrip('-') for field in self.ordering]
+        first_lookup = 'lte' if self.ordering[0].startswith('-') else 'gte'
+        after = Q()
+        equal = {}
+        for field, name, value in zip(self.ordering, names, position):
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            after |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return Q(**{f'{names[0]}__{first_lookup}': position[0]}) & after
+
+    def encode_cursor(self, position):
+        payload = json.dumps([self._dump(value) for value in position], separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def load_cursor(self, encoded):
+        padded = encoded + '=' * (-len(encoded) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = self.load_cursor(encoded)
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise ValueError
+            return [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def _dump(self, value):
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        return value
+
+
+class RankedPagination(KeysetPagination):
+    """
+    検索の関連度順のように、キーでは位置を表せない並びのためのページネーション。
+    カーソルには読んだ件数（OFFSET）を入れる。深いページほど高くつくので
+    max_offset 件で打ち切る
+    """
+    max_offset = 200
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.offset = self.decode_offset(request)
+        end = min(self.offset + self.page_size, self.max_offset)
+        rows = list(queryset[self.offset:end + 1]) if end > self.offset else []
+        self.has_next = len(rows) > end - self.offset and end < self.max_offset
+        self.page = rows[:end - self.offset]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor([self.offset + len(self.page)]))
+
+    def decode_offset(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return 0
+        try:
+            values = self.load_cursor(encoded)
+            if not isinstance(values, list) or len(values) != 1 or not isinstance(values[0], int) or values[0] < 0:
+                raise ValueError
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+        return values[0]
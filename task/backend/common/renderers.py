@@ -0,0 +1,62 @@
+"""
+DRF の JSONRenderer と同じバイト列を、orjson があればより速く出す JSON レンダラー。
+
+UNICODE_JSON / COMPACT_JSON（既定）の JSONRenderer と同じく、区切りに空白を入れず、
+非 ASCII はそのまま UTF-8 で出し、U+2028 / U+2029 だけはエスケープする。
+日時・Decimal などの Python オブジェクトは DRF の JSONEncoder に任せる（形式を揃えるため）。
+インデント指定や STRICT_JSON のときは JSONRenderer にそのまま任せる。
+
+CompactJSONRenderer はページングされた一覧を列名1回＋値の配列の配列で返す（看板ボードなど件数の多い画面向け）。
+"""
+from rest_framework.utils import encoders
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson が無い環境では標準の json で出す
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or self.ensure_ascii or not self.compact or self.strict
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(
+                data, default=encoders.JSONEncoder().default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS,
+            )
+        except TypeError:
+            # 64bit を超える整数など orjson が扱えない値
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class CompactJSONRenderer(FastJSONRenderer):
+    """
+    { next, results: [ {...}, ... ] } を { next, columns: [...], rows: [[...], ...] } にして返す。
+    results の無い応答（エラーなど）はそのまま JSON で返す
+    """
+    media_type = 'application/vnd.compact+json'
+    format = 'compact'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict) and isinstance(data.get('results'), list):
+            results = data['results']
+            columns = list(results[0]) if results else self.get_columns(renderer_context or {})
+            data = {
+                **{key: value for key, value in data.items() if key != 'results'},
+                'columns': columns,
+                'rows': [[row[column] for column in columns] for row in results],
+            }
+        return super().render(data, accepted_media_type, renderer_context)
+
+    def get_columns(self, renderer_context):
+        # 0件のページでも列名は返す（?fields= で絞った後のシリアライザのフィールド）
+        view = renderer_context.get('view')
+        if not hasattr(view, 'get_serializer'):
+            return []
+        return [name for name, field in view.get_serializer().fields.items() if not field.write_only]
@@ -0,0 +1,153 @@
+import io
+import json
+import threading
+
+from django.core.cache import cache as default_cache
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from . import metrics
+from .cache import LRUCache, TieredCache, read_cache
+from .export import iterate_in_thread
+from .instrumentation import db_seconds, query_counts
+from .loadtest import compare, summarize
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class ReadCacheTests(SimpleTestCase):
+    def setUp(self):
+        default_cache.clear()
+
+    def test_lru_evicts_least_recently_used_and_expires_after_ttl(self):
+        clock = FakeClock()
+        lru = LRUCache(max_entries=2, ttl=10, clock=clock)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.get('a'), 1)
+        clock.now = 10
+        self.assertIsNone(lru.get('a'))
+        self.assertEqual(len(lru), 1)
+
+    def test_invalidation_reaches_other_processes_through_shared_generation(self):
+        # 2つのインスタンスを別プロセスの代わりにする（1段目は別々、2段目は共有）
+        first = TieredCache('test-shared', local_ttl=60, shared_alias='default')
+        second = TieredCache('test-shared', local_ttl=60, shared_alias='default')
+        first.set('key', 'v1')
+        self.assertEqual(second.get('key'), 'v1')
+        self.assertEqual(second.stats()['shared']['hits'], 1)
+
+        first.invalidate()
+        self.assertIsNone(first.get('key'))
+        second.local.clear()  # 他プロセスの1段目は LOCAL_TTL で切れる
+        self.assertIsNone(second.get('key'))
+
+    def test_process_local_cache_is_rejected_as_the_shared_tier(self):
+        with override_settings(READ_CACHE={'SHARED_ALIAS': 'default'}):
+            with self.assertRaises(ImproperlyConfigured):
+                read_cache('test-locmem')
+        with override_settings(READ_CACHE={}):
+            self.assertIsNone(read_cache('test-locmem').shared)
+
+
+class LoadTestReportTests(SimpleTestCase):
+    def test_summary_percentiles_and_baseline_regressions(self):
+        samples = [(i / 1000, 200, 3) for i in range(1, 101)] + [(0.5, 500, 3)]
+        summary = summarize(samples, elapsed=2.0)
+        self.assertEqual((summary['p50_ms'], summary['p95_ms'], summary['p99_ms']), (51.0, 96.0, 100.0))
+        self.assertEqual((summary['requests'], summary['errors'], summary['queries_per_request']), (101, 1, 3))
+        self.assertEqual(summary['throughput'], 50.5)
+
+        baseline = {'scenarios': {'tasks': {**summary, 'p95_ms': 80.0, 'queries_per_request': 2}}}
+        comparison = compare({'scenarios': {'tasks': summary}}, baseline, tolerance=0.1)
+        self.assertEqual(comparison['scenarios']['tasks']['p95_ms_ratio'], 1.2)
+        self.assertEqual(len(comparison['regressions']), 2)
+
+
+class LoadTestCommandTests(TestCase):
+    def test_in_process_run_reports_every_scenario(self):
+        call_command('create_dummy_data', users=1, projects=1, tasks=3, stdout=io.StringIO())
+        stdout = io.StringIO()
+        call_command('loadtest', requests=3, concurrency=1, usernames='user1', stdout=stdout, stderr=io.StringIO())
+        result = json.loads(stdout.getvalue())
+        self.assertEqual(set(result['scenarios']), {'tasks', 'projects', 'notifications', 'token', 'token_refresh'})
+        for name, stats in result['scenarios'].items():
+            self.assertEqual((stats['requests'], stats['errors']), (3, 0), name)
+        self.assertGreaterEqual(result['scenarios']['tasks']['queries_per_request'], 1)
+
+
+class RequestInstrumentationTests(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='metrics', password='metricspass123')
+        self.client.force_authenticate(user=self.user)
+
+    def test_server_timing_and_route_histograms(self):
+        route = '/api/tasks/'
+        before = query_counts.snapshot(method='GET', route=route)['count']
+        response = self.client.get(reverse('task-list-create'))
+        self.assertEqual(response.status_code, 200)
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'db;dur=[0-9.]+;desc="\d+ queries", serialize;dur=[0-9.]+, total;dur=[0-9.]+')
+        self.assertEqual(query_counts.snapshot(method='GET', route=route)['count'], before + 1)
+        self.assertGreater(db_seconds.snapshot(method='GET', route=route)['sum'], 0)
+
+    @override_settings(INSTRUMENTATION={'SLOW_REQUEST_SECONDS': 0, 'SQL_SAMPLE_SIZE': 2})
+    def test_slow_requests_are_logged_with_sampled_sql(self):
+        with self.assertLogs('common.instrumentation', 'WARNING') as logs:
+            self.client.get(reverse('task-list-create'))
+        self.assertIn('/api/tasks/', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+    @override_settings(INSTRUMENTATION={'METRICS_TOKEN': 'scrape-secret'})
+    def test_metrics_endpoint_renders_prometheus_text(self):
+        self.client.get(reverse('task-list-create'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        self.assertIn('http_request_duration_seconds_bucket{method="GET",route="/api/tasks/",le="+Inf"}', body)
+        self.assertIn('http_responses_total{method="GET",route="/api/tasks/",status="200"}', body)
+
+    def test_render_text_escapes_label_values(self):
+        registry = metrics.Registry()
+        registry.register(metrics.Counter('escaped', 'help', ('path',))).inc(path='a"b\\c')
+        self.assertIn('escaped_total{path="a\\"b\\\\c"} 1', metrics.render_text(registry))
+
+
+class StreamingExportTests(SimpleTestCase):
+    def test_chunks_are_produced_in_another_thread_and_errors_propagate(self):
+        threads = set()
+
+        def make_chunks():
+            for i in range(20):
+                threads.add(threading.current_thread().name)
+                yield str(i)
+
+        async def collect(iterator):
+            return [chunk async for chunk in iterator]
+
+        self.assertEqual(async_to_sync(collect)(iterate_in_thread(make_chunks, max_pending=2)), [str(i) for i in range(20)])
+        self.assertEqual(threads, {'export-producer'})
+
+        def failing():
+            yield 'first'
+            raise ValueError('boom')
+
+        with self.assertRaises(ValueError):
+            async_to_sync(collect)(iterate_in_thread(failing))
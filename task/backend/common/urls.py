@@ -0,0 +1,8 @@
+from django.urls import path
+
+from .views import metrics_view, read_cache_stats
+
+urlpatterns = [
+    path('cache/stats/', read_cache_stats, name='read-cache-stats'),
+    path('metrics/', metrics_view, name='metrics'),
+]
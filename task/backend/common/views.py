@@ -0,0 +1,35 @@
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+
+from . import metrics
+from .cache import all_read_caches
+from .instrumentation import get_options
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def read_cache_stats(request):
+    """
+    このプロセスの読み取りキャッシュの段ごとのヒット・ミス件数とヒット率
+    """
+    return Response({'caches': [cache.stats() for cache in all_read_caches()]})
+
+
+def metrics_view(request):
+    """
+    Prometheus 形式のメトリクス。INSTRUMENTATION['METRICS_TOKEN'] を設定した場合は
+    Authorization: Bearer <トークン> が必要（未設定なら DEBUG のときだけ公開する）
+    """
+    token = get_options()['METRICS_TOKEN']
+    if token:
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        if not hmac.compare_digest(supplied.encode(), token.encode()):
+            return HttpResponseForbidden()
+    elif not settings.DEBUG:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -42,14 +42,20 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
+    # ROTATE_REFRESH_TOKENS / BLACKLIST_AFTER_ROTATION はこのアプリのテーブルを使う
+    'rest_framework_simplejwt.token_blacklist',
+    'common',
     'users',
     'tasks',
+    'realtime',
     'corsheaders',
     'drf_spectacular',
 ]
 
 MIDDLEWARE = [
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    # 静的ファイル以外のリクエストの時間・クエリ数を計る（common/instrumentation.py）
+    'common.instrumentation.RequestInstrumentationMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -95,6 +101,60 @@ DATABASES = {
 }
 
 
+# Cache
+# 既定はプロセス内メモリ。複数ワーカーで無効化を共有する場合は Redis などを指定する
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('DJANGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', 'team-task-manager'),
+    }
+}
+
+# プロジェクト・ユーザー一覧の読み取りキャッシュ（common/cache.py）。
+# LOCAL_* はプロセス内 LRU、SHARED_* は CACHES の別名と保持秒数（None で2段目を使わない）。
+# 2段目はプロセス間で無効化を共有するためのものなので、既定では DJANGO_CACHE_BACKEND に
+# プロセス外のキャッシュ（Redis など）を指定したときだけ使う。LocMemCache を指定すると起動時にエラー
+READ_CACHE = {
+    'LOCAL_MAX_ENTRIES': int(os.environ.get('READ_CACHE_LOCAL_MAX_ENTRIES', '256')),
+    'LOCAL_TTL': int(os.environ.get('READ_CACHE_LOCAL_TTL', '5')),
+    'SHARED_ALIAS': os.environ.get(
+        'READ_CACHE_SHARED_ALIAS',
+        'default' if CACHES['default']['BACKEND'] != 'django.core.cache.backends.locmem.LocMemCache' else '',
+    ) or None,
+    'SHARED_TTL': int(os.environ.get('READ_CACHE_SHARED_TTL', '300')),
+}
+
+TASK_STATS_CACHE_TIMEOUT = int(os.environ.get('TASK_STATS_CACHE_TIMEOUT', '30'))
+
+# メンバーシップ導入前からあるプロジェクトで、タスクが無く作成者から owner を決められないときに
+# owner にするユーザー名（未指定なら最初に作られたスーパーユーザー）。tasks のマイグレーション 0013 で使う
+PROJECT_OWNER_FALLBACK_USERNAME = os.environ.get('PROJECT_OWNER_FALLBACK_USERNAME') or None
+
+# リアルタイム配信（/api/stream/）。InMemoryBroker は同一プロセス内の購読者にだけ届く
+REALTIME_BROKER = os.environ.get('REALTIME_BROKER', 'realtime.broker.InMemoryBroker')
+REALTIME_HEARTBEAT_SECONDS = 15
+
+# タスク操作の活動履歴・通知はバッファに溜め、件数か秒数のしきい値でまとめて書き込む
+ACTIVITY_WRITER = {
+    'BATCH_SIZE': int(os.environ.get('ACTIVITY_WRITER_BATCH_SIZE', '500')),
+    'FLUSH_INTERVAL': float(os.environ.get('ACTIVITY_WRITER_FLUSH_INTERVAL', '1.0')),
+    'MAX_PENDING': 10000,
+    'BACKGROUND': True,
+}
+
+# リクエスト計測（common/instrumentation.py）。SLOW_REQUEST_SECONDS を超えたものは
+# 遅い SQL を添えてログに出す。/api/metrics/ は METRICS_TOKEN の Bearer で取得する
+INSTRUMENTATION = {
+    'ENABLED': os.environ.get('INSTRUMENTATION_ENABLED', '1') == '1',
+    'SERVER_TIMING': os.environ.get('INSTRUMENTATION_SERVER_TIMING', '1') == '1',
+    'SLOW_REQUEST_SECONDS': float(os.environ.get('SLOW_REQUEST_SECONDS', '1.0')),
+    'SLOW_LOG_SAMPLE_RATE': float(os.environ.get('SLOW_LOG_SAMPLE_RATE', '1.0')),
+    'SQL_SAMPLE_SIZE': 5,
+    'METRICS_TOKEN': os.environ.get('METRICS_TOKEN') or None,
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -113,6 +173,33 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# 先頭の方式で保存する。それ以外（既存の PBKDF2 など）で保存されたハッシュは、
+# ログインに成功したときに先頭の方式へ付け替える（users/models.py の User.check_password）
+PASSWORD_HASHERS = [
+    'users.hashing.TunedArgon2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+# Argon2id のコスト。既定は OWASP 推奨の最小構成（19 MiB, 2回, 並列度1）で、
+# Django 既定（100 MiB, 並列度8）より照合が軽い。変えると次回ログイン時に付け替わる
+PASSWORD_ARGON2 = {
+    'TIME_COST': int(os.environ.get('PASSWORD_ARGON2_TIME_COST', '2')),
+    'MEMORY_COST': int(os.environ.get('PASSWORD_ARGON2_MEMORY_COST', '19456')),
+    'PARALLELISM': int(os.environ.get('PASSWORD_ARGON2_PARALLELISM', '1')),
+}
+
+# パスワードのハッシュ化・照合を行うスレッドプール（users/hashing.py）。
+# WORKERS 件を同時に計算し、MAX_PENDING 件まで待たせる。WAIT 秒で空かなければ 429。
+# 同時計算数の上限であり、待っている間も呼び出したリクエストのワーカーはふさがる
+PASSWORD_HASHER_POOL = {
+    'WORKERS': int(os.environ.get('PASSWORD_HASHER_WORKERS', '4')),
+    'MAX_PENDING': int(os.environ.get('PASSWORD_HASHER_MAX_PENDING', '32')),
+    'WAIT': float(os.environ.get('PASSWORD_HASHER_WAIT', '0.5')),
+    'RETRY_AFTER': 1,
+}
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
@@ -139,9 +226,12 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # トークンの内容だけで request.user を作り、User は必要になるまで読まない
+        'users.authentication.StatelessJWTAuthentication',
     ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    'DEFAULT_PAGINATION_CLASS': 'common.pagination.KeysetPagination',
+    'PAGE_SIZE': int(os.environ.get('DJANGO_API_PAGE_SIZE', '100')),
 }
 
 CORS_ALLOW_ALL_ORIGINS = False
@@ -165,4 +255,15 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': True,
     'AUTH_HEADER_TYPES': ('Bearer',),
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
+    'TOKEN_OBTAIN_SERIALIZER': 'users.serializers.TokenObtainPairWithClaimsSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'users.serializers.TokenRefreshWithRevocationSerializer',
 }
+
+# JWT 失効判定（is_active / tokens_valid_after）をプロセス内に持つ秒数と件数
+JWT_REVOCATION_CACHE_TTL = int(os.environ.get('JWT_REVOCATION_CACHE_TTL', '30'))
+JWT_REVOCATION_CACHE_SIZE = 10000
+
+# リアルタイム配信の接続時に使う、ユーザーごとのメンバーのプロジェクト ID をプロセス内に持つ秒数と件数
+# （メンバーシップの変更は同じプロセスなら即座に、他のプロセスにはこの秒数以内に反映される）
+PROJECT_MEMBERSHIP_CACHE_TTL = int(os.environ.get('PROJECT_MEMBERSHIP_CACHE_TTL', '30'))
+PROJECT_MEMBERSHIP_CACHE_SIZE = 10000
@@ -0,0 +1,118 @@
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+
+class BaseBroker:
+    """
+    変更イベントの配信路。publish は同期コード（シグナル）から、
+    subscribe は ASGI のイベントループ上から呼ばれる。
+    プロセス間で配信する場合は Redis Pub/Sub などで同じインターフェースを実装する
+    """
+
+    def publish(self, topic, event):
+        raise NotImplementedError
+
+    def subscribe(self, topics):
+        raise NotImplementedError
+
+
+class Subscription:
+    """
+    1接続ぶんの購読。待機中はキューとコルーチン1つだけなので、アイドル接続は安い
+    """
+
+    def __init__(self, broker, topics, loop, max_queue):
+        self.broker = broker
+        self.topics = frozenset(topics)
+        self.loop = loop
+        self.queue = asyncio.Queue(max_queue)
+        # 取りこぼしが起きたらクライアントに差分同期からやり直してもらう
+        self.overflowed = False
+
+    def deliver(self, event):
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # イベントループが既に閉じている
+            self.close()
+
+    def _put(self, event):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.overflowed = True
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout=None):
+        """
+        次のイベントを返す。timeout 秒何も無ければ None
+        """
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InMemoryBroker(BaseBroker):
+    """
+    プロセス内の購読者にだけ配信するブローカー。単一 ASGI ワーカーやテストで使う
+    """
+
+    def __init__(self, max_queue=100):
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def publish(self, topic, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(topic, ()))
+        for subscription in subscribers:
+            subscription.deliver(event)
+
+    def subscribe(self, topics):
+        subscription = Subscription(self, topics, asyncio.get_running_loop(), self.max_queue)
+        with self._lock:
+            for topic in subscription.topics:
+                self._subscribers[topic].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for topic in subscription.topics:
+                subscribers = self._subscribers.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[topic]
+
+    def subscriber_count(self):
+        with self._lock:
+            return len({s for subscribers in self._subscribers.values() for s in subscribers})
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(getattr(settings, 'REALTIME_BROKER', 'realtime.broker.InMemoryBroker'))()
+        return _broker
+
+
+@receiver(setting_changed)
+def reset_broker(setting, **kwargs):
+    global _broker
+    if setting == 'REALTIME_BROKER':
+        with _broker_lock:
+            _broker = None
@@ -0,0 +1,95 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from tasks.models import Project, ProjectMembership, Task
+from users.activity import records_flushed
+from users.models import Notification
+
+from .broker import get_broker
+
+ALL_PROJECTS = 'project:*'
+
+
+def project_topic(project_id):
+    return f'project:{project_id}'
+
+
+def user_topic(user_id):
+    return f'user:{user_id}'
+
+
+def publish(topics, event):
+    # ロールバックされた変更を流さないよう、コミット後に配信する
+    def send():
+        broker = get_broker()
+        for topic in topics:
+            broker.publish(topic, event)
+    transaction.on_commit(send)
+
+
+def task_event(instance, action):
+    return {
+        'type': f'task.{action}',
+        'id': instance.pk,
+        'project': instance.project_id,
+        'updated_at': instance.updated_at.isoformat() if instance.updated_at else None,
+    }
+
+
+def task_topics(instance):
+    topics = [project_topic(instance.project_id), ALL_PROJECTS]
+    if instance.project_id is None:
+        # プロジェクトに属さないタスクは、それが見える作成者・担当者に届ける
+        topics += [user_topic(user_id) for user_id in sorted({instance.creator_id, instance.assignee_id} - {None})]
+    return topics
+
+
+@receiver(post_save, sender=Task)
+def publish_task_saved(sender, instance, created, **kwargs):
+    event = task_event(instance, 'created' if created else 'updated')
+    publish(task_topics(instance), event)
+
+
+@receiver(post_delete, sender=Task)
+def publish_task_deleted(sender, instance, **kwargs):
+    event = task_event(instance, 'deleted')
+    publish(task_topics(instance), event)
+
+
+@receiver(post_save, sender=Project)
+def publish_project_saved(sender, instance, created, **kwargs):
+    event = {'type': 'project.created' if created else 'project.updated', 'id': instance.pk, 'project': instance.pk}
+    publish([project_topic(instance.pk), ALL_PROJECTS], event)
+
+
+@receiver(post_delete, sender=Project)
+def publish_project_deleted(sender, instance, **kwargs):
+    event = {'type': 'project.deleted', 'id': instance.pk, 'project': instance.pk}
+    publish([project_topic(instance.pk), ALL_PROJECTS], event)
+
+
+@receiver(post_save, sender=ProjectMembership)
+def publish_membership_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        publish([user_topic(instance.user_id)], {'type': 'membership.created', 'project': instance.project_id})
+
+
+@receiver(post_delete, sender=ProjectMembership)
+def publish_membership_deleted(sender, instance, **kwargs):
+    # 接続中のストリームはこれを受けて閉じ、再接続で購読し直す（views.event_stream）
+    publish([user_topic(instance.user_id)], {'type': 'membership.deleted', 'project': instance.project_id})
+
+
+@receiver(post_save, sender=Notification)
+def publish_notification_saved(sender, instance, created, **kwargs):
+    event = {'type': 'notification.created' if created else 'notification.updated', 'id': instance.pk}
+    publish([user_topic(instance.user_id)], event)
+
+
+@receiver(records_flushed, sender=Notification)
+def publish_notifications_flushed(sender, instances, **kwargs):
+    # 一括書き込みされた通知は post_save を通らないのでここで配信する
+    broker = get_broker()
+    for instance in instances:
+        broker.publish(user_topic(instance.user_id), {'type': 'notification.created', 'id': instance.pk})
@@ -0,0 +1,178 @@
+import asyncio
+import threading
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from tasks.models import Project, ProjectMembership, Task
+from users.activity import get_activity_writer
+from .broker import BaseBroker, InMemoryBroker, get_broker
+from .views import resolve_topics
+
+User = get_user_model()
+
+
+class RecordingBroker(BaseBroker):
+    """
+    テスト用の代替ブローカー。配信されたイベントを記録するだけ
+    """
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, event):
+        self.published.append((topic, event))
+
+    def subscribe(self, topics):
+        raise NotImplementedError
+
+
+class InMemoryBrokerTests(TestCase):
+    def test_delivers_events_published_from_other_threads(self):
+        broker = InMemoryBroker()
+
+        async def scenario():
+            subscription = broker.subscribe(['project:1'])
+            thread = threading.Thread(target=broker.publish, args=('project:1', {'type': 'task.updated', 'id': 1}))
+            thread.start()
+            event = await subscription.get(timeout=1)
+            broker.publish('project:2', {'type': 'task.updated', 'id': 2})
+            missing = await subscription.get(timeout=0.05)
+            subscription.close()
+            return event, missing
+
+        event, missing = asyncio.run(scenario())
+        self.assertEqual(event['id'], 1)
+        self.assertIsNone(missing)
+        self.assertEqual(broker.subscriber_count(), 0)
+
+    def test_full_queue_drops_oldest_and_flags_overflow(self):
+        broker = InMemoryBroker(max_queue=2)
+
+        async def scenario():
+            subscription = broker.subscribe(['project:1'])
+            for i in range(3):
+                broker.publish('project:1', {'id': i})
+            await asyncio.sleep(0)
+            ids = [(await subscription.get(timeout=1))['id'] for _ in range(2)]
+            subscription.close()
+            return ids, subscription.overflowed
+
+        self.assertEqual(asyncio.run(scenario()), ([1, 2], True))
+
+
+@override_settings(REALTIME_BROKER='realtime.tests.RecordingBroker', ACTIVITY_WRITER={'BACKGROUND': False})
+class RealtimeSignalTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='streamer', password='streampass123')
+        get_broker().published.clear()
+        self.addCleanup(get_activity_writer().flush)
+
+    def test_task_changes_are_published_to_project_topic_after_commit(self):
+        project = Project.objects.create(name='Live')
+        broker = get_broker()
+        with self.captureOnCommitCallbacks(execute=True):
+            task = Task.objects.create(title='Live task', creator=self.user, project=project)
+            self.assertEqual(broker.published, [])
+        with self.captureOnCommitCallbacks(execute=True):
+            task.delete()
+        events = [(topic, event['type']) for topic, event in broker.published]
+        self.assertIn((f'project:{project.id}', 'task.created'), events)
+        self.assertIn(('project:*', 'task.created'), events)
+        self.assertIn((f'project:{project.id}', 'task.deleted'), events)
+
+    def test_personal_task_changes_are_published_to_creator_and_assignee(self):
+        assignee = User.objects.create_user(username='assignee', password='assigneepass123')
+        broker = get_broker()
+        with self.captureOnCommitCallbacks(execute=True):
+            Task.objects.create(title='Personal', creator=self.user, assignee=assignee)
+        topics = {topic for topic, event in broker.published if event['type'] == 'task.created'}
+        self.assertLessEqual({f'user:{self.user.id}', f'user:{assignee.id}'}, topics)
+
+    def test_notifications_are_published_to_user_topic(self):
+        broker = get_broker()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.notifications.create(message='hello')
+        self.assertEqual([topic for topic, _ in broker.published], [f'user:{self.user.id}'])
+
+    def test_membership_removal_is_published_to_user_topic(self):
+        project = Project.objects.create(name='Members')
+        membership = ProjectMembership.objects.create(project=project, user=self.user)
+        broker = get_broker()
+        broker.published.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            membership.delete()
+        self.assertIn((f'user:{self.user.id}', {'type': 'membership.deleted', 'project': project.id}), broker.published)
+
+
+class EventStreamTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='sse', password='ssepass123')
+
+    def test_requires_valid_token(self):
+        response = self.client.get(reverse('event-stream'), {'token': 'invalid'})
+        self.assertEqual(response.status_code, 401)
+
+    def test_rejects_revoked_tokens_and_inactive_users(self):
+        token = str(AccessToken.for_user(self.user))
+        self.user.tokens_valid_after = timezone.now() + timezone.timedelta(seconds=1)
+        self.user.save()
+        response = self.client.get(reverse('event-stream'), {'token': token})
+        self.assertEqual(response.status_code, 401)
+
+        inactive = User.objects.create_user(username='inactive', password='inactivepass123', is_active=False)
+        response = self.client.get(reverse('event-stream'), {'token': str(AccessToken.for_user(inactive))})
+        self.assertEqual(response.status_code, 401)
+
+    async def test_streams_events_for_subscribed_project(self):
+        project = await Project.objects.acreate(name='Streamed')
+        await ProjectMembership.objects.acreate(project=project, user=self.user)
+        token = str(AccessToken.for_user(self.user))
+        # メンバーでないプロジェクトの指定は無視される
+        response = await self.async_client.get(reverse('event-stream'), {'token': token, 'project': [str(project.id), '999']})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = response.streaming_content
+        self.assertEqual(await anext(content), b'retry: 3000\n\n')
+        next_chunk = asyncio.ensure_future(anext(content))
+        await asyncio.sleep(0)
+        get_broker().publish('project:999', {'type': 'task.updated', 'id': 2})
+        get_broker().publish(f'project:{project.id}', {'type': 'task.updated', 'id': 3})
+        chunk = await asyncio.wait_for(next_chunk, 1)
+        self.assertTrue(chunk.startswith(b'event: task.updated\n'))
+        self.assertIn(b'"id":3', chunk)
+        await content.aclose()
+
+    def test_member_projects_are_cached_until_membership_changes(self):
+        project = Project.objects.create(name='Cached')
+        resolve_topics(self.user.id, [])
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_topics(self.user.id, []), [])
+        membership = ProjectMembership.objects.create(project=project, user=self.user)
+        self.assertEqual(resolve_topics(self.user.id, []), [f'project:{project.id}'])
+        membership.delete()
+        self.assertEqual(resolve_topics(self.user.id, []), [])
+
+    def test_member_project_cache_has_its_own_ttl(self):
+        project = Project.objects.create(name='Short lived')
+        with override_settings(PROJECT_MEMBERSHIP_CACHE_TTL=0):
+            resolve_topics(self.user.id, [])
+            # 別のプロセスでの追加（シグナルを通らない）も、TTL が切れていれば次の接続で読み直す
+            ProjectMembership.objects.bulk_create([ProjectMembership(project=project, user=self.user)])
+            self.assertEqual(resolve_topics(self.user.id, []), [f'project:{project.id}'])
+
+    async def test_stream_ends_when_membership_of_subscribed_project_is_removed(self):
+        project = await Project.objects.acreate(name='Revoked')
+        await ProjectMembership.objects.acreate(project=project, user=self.user)
+        token = str(AccessToken.for_user(self.user))
+        response = await self.async_client.get(reverse('event-stream'), {'token': token})
+        content = response.streaming_content
+        await anext(content)
+        next_chunk = asyncio.ensure_future(anext(content))
+        await asyncio.sleep(0)
+        get_broker().publish(f'user:{self.user.id}', {'type': 'membership.deleted', 'project': project.id})
+        chunk = await asyncio.wait_for(next_chunk, 1)
+        self.assertTrue(chunk.startswith(b'event: membership.deleted\n'))
+        with self.assertRaises(StopAsyncIteration):
+            await asyncio.wait_for(anext(content), 1)
@@ -0,0 +1,119 @@
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from tasks.visibility import get_member_project_cache, get_member_project_ids
+from users.authentication import check_token_state, get_user_state
+
+from .broker import get_broker
+from .signals import ALL_PROJECTS, project_topic, user_topic
+
+HEARTBEAT_SECONDS = getattr(settings, 'REALTIME_HEARTBEAT_SECONDS', 15)
+
+
+def get_stream_token(request):
+    """
+    EventSource はヘッダーを付けられないので ?token= でも受け付ける
+    """
+    header = request.headers.get('Authorization', '')
+    for header_type in jwt_settings.AUTH_HEADER_TYPES:
+        if header.startswith(f'{header_type} '):
+            return header.split(' ', 1)[1]
+    return request.GET.get('token')
+
+
+def authenticate_stream(request):
+    """
+    署名・有効期限と失効（無効化されたユーザー・パスワード変更前に発行されたトークン）を検証し、
+    (user_id, 期限) を返す。失効判定は API と同じ TTL 付きキャッシュから読むので、接続のたびには DB を引かない
+    """
+    raw = get_stream_token(request)
+    if not raw:
+        return None
+    try:
+        token = AccessToken(raw)
+        user_id = get_user_model()._meta.pk.to_python(token[jwt_settings.USER_ID_CLAIM])
+        check_token_state(user_id, token)
+    except (TokenError, KeyError, ValidationError, AuthenticationFailed):
+        return None
+    return user_id, token.get('exp')
+
+
+def resolve_topics(user_id, requested):
+    """
+    購読するプロジェクトのトピック。管理者以外はメンバーのプロジェクトだけで、?project= はその中から選ぶ。
+    メンバーのプロジェクトは get_user_state と同じくプロセス内のキャッシュから読み、接続のたびに DB を引かない
+    """
+    state = get_user_state(user_id)
+    if state is not None and state[1]:
+        return [project_topic(value) for value in requested] or [ALL_PROJECTS]
+    members = {str(project_id) for project_id in get_member_project_ids(user_id)}
+    chosen = [value for value in requested if value in members] if requested else sorted(members)
+    return [project_topic(value) for value in chosen]
+
+
+def ends_subscription(event, topics, requested):
+    """
+    メンバーシップの変更で購読するトピックが変わるか。
+    外されたプロジェクトを購読中か、?project= 無しで新しいプロジェクトに加わったときは接続を閉じ、
+    クライアントの再接続で購読し直させる（外されたプロジェクトのイベントを流し続けない）
+    """
+    if event['type'] == 'membership.deleted':
+        return project_topic(event['project']) in topics
+    if event['type'] == 'membership.created':
+        return not requested and ALL_PROJECTS not in topics
+    return False
+
+
+def format_event(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+
+
+async def event_stream(request):
+    """
+    Server-Sent Events でタスク・プロジェクト・通知の変更を配信する。
+    ?project= を指定するとそのプロジェクトだけ、無ければ見えるすべてのプロジェクトを購読する。
+    プロジェクトに属さない自分のタスクと通知は自分宛てのトピックで届く。
+    アクセストークンの期限とメンバーシップの変更で接続を閉じるので、クライアントは再接続する
+    """
+    identity = await sync_to_async(authenticate_stream)(request)
+    if identity is None:
+        return JsonResponse({'detail': '認証情報が無効です。'}, status=401)
+    user_id, expires_at = identity
+
+    project_ids = [value for value in request.GET.getlist('project') if value.isdigit()]
+    topics = await sync_to_async(resolve_topics)(user_id, project_ids)
+    subscription = get_broker().subscribe([*topics, user_topic(user_id)])
+
+    async def stream():
+        try:
+            yield 'retry: 3000\n\n'
+            while expires_at is None or time.time() < expires_at:
+                event = await subscription.get(timeout=HEARTBEAT_SECONDS)
+                if subscription.overflowed:
+                    subscription.overflowed = False
+                    yield format_event({'type': 'resync'})
+                if event is None:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield format_event(event)
+                if ends_subscription(event, topics, project_ids):
+                    # 変更が別プロセスで起きていても、このプロセスの再接続では読み直させる
+                    get_member_project_cache().delete(user_id)
+                    break
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # リバースプロキシにバッファリングさせない
+    response['X-Accel-Buffering'] = 'no'
+    return response
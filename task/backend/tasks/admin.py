@@ -1,13 +1,29 @@
 from django.contrib import admin
-from .models import Task, Project
+from django.db.models import Q
+from .models import Task, Project, ProjectMembership
+from .search import search_tasks
 
 @admin.register(Task)
 class TaskAdmin(admin.ModelAdmin):
     list_display = ('id', 'title', 'status', 'assignee', 'creator', 'created_at', 'updated_at')
     list_filter = ('status', 'assignee', 'creator', 'created_at')
-    search_fields = ('title', 'description', 'assignee__username', 'creator__username')
+    # タイトル・本文は全文検索で引くので、ここには人名だけを残す
+    search_fields = ('assignee__username', 'creator__username')
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return super().get_search_results(request, queryset, search_term)
+        people, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        matched = search_tasks(Task.objects.all(), search_term.strip()).values('id')
+        return queryset.filter(Q(id__in=matched) | Q(id__in=people.values('id'))), may_have_duplicates
+
+class ProjectMembershipInline(admin.TabularInline):
+    model = ProjectMembership
+    extra = 0
+    raw_id_fields = ('user',)
 
 @admin.register(Project)
 class ProjectAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'created_at')
     search_fields = ('name', 'description')
+    inlines = [ProjectMembershipInline]
@@ -0,0 +1,165 @@
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from rest_framework import status
+
+from users.activity import acting_user
+from .models import Task, TaskVersionConflict
+from .rollups import collect_deltas
+from .serializers import TaskSerializer
+from .signals import send_bulk_post_save
+from .visibility import can_edit_task, visible_tasks
+
+MAX_OPERATIONS = getattr(settings, 'TASK_BULK_MAX_OPERATIONS', 500)
+OPERATIONS = ('create', 'update', 'delete')
+
+
+class TaskBulkProcessor:
+    """
+    作成・部分更新・削除の操作リストをまとめて検証し、1トランザクションで適用する。
+    1件でもエラーがあれば何も適用せず、操作ごとの結果を返す。
+    更新・削除は読み込んだ版のままの行だけに適用し、version を付けた操作はその版とも比べる
+    """
+
+    def __init__(self, request, view=None):
+        self.request = request
+        self.view = view
+        self.context = {'request': request, 'view': view}
+
+    def process(self, operations):
+        """
+        (HTTPステータス, 操作ごとの結果リスト) を返す
+        """
+        results = [{'index': index, 'op': None} for index in range(len(operations))]
+        creates, updates, deletes = [], [], []
+        for index, operation in enumerate(operations):
+            error = self._check_shape(operation)
+            if error:
+                results[index].update(status=status.HTTP_400_BAD_REQUEST, errors=error)
+                continue
+            results[index]['op'] = operation['op']
+            if operation['op'] != 'create':
+                results[index]['id'] = operation['id']
+            {'create': creates, 'update': updates, 'delete': deletes}[operation['op']].append(index)
+
+        # 更新・削除対象は見えるものだけを1クエリで読み込み、権限もその場で判定する
+        # （役割はリクエストごとに1回だけ読んだ {project_id: 役割} を使う）
+        target_ids = [operations[index]['id'] for index in updates + deletes]
+        targets = TaskSerializer.setup_eager_loading(visible_tasks(Task.objects.all(), self.request.user)).in_bulk(target_ids)
+        seen = set()
+        for index in updates + deletes:
+            task_id = operations[index]['id']
+            task = targets.get(task_id)
+            if task_id in seen:
+                results[index].update(status=status.HTTP_400_BAD_REQUEST, errors={'id': '同じタスクへの操作が重複しています。'})
+            elif task is None:
+                results[index].update(status=status.HTTP_404_NOT_FOUND, errors={'id': 'タスクが見つかりません。'})
+            elif not can_edit_task(self.request, task):
+                results[index].update(status=status.HTTP_403_FORBIDDEN, errors={'id': 'このタスクを変更する権限がありません。'})
+            elif operations[index].get('version', task.version) != task.version:
+                results[index].update(
+                    status=status.HTTP_412_PRECONDITION_FAILED,
+                    errors={'version': f'他の利用者が先に変更しました（現在の版: {task.version}）。'},
+                )
+            seen.add(task_id)
+
+        create_serializer = TaskSerializer(
+            data=[operations[index]['data'] for index in creates], many=True, context=self.context,
+        )
+        if creates and not create_serializer.is_valid():
+            for index, errors in zip(creates, create_serializer.errors):
+                if errors:
+                    results[index].update(status=status.HTTP_400_BAD_REQUEST, errors=errors)
+
+        update_serializers = {}
+        for index in updates:
+            if 'errors' in results[index]:
+                continue
+            serializer = TaskSerializer(
+                targets[operations[index]['id']], data=operations[index]['data'], partial=True, context=self.context,
+            )
+            if serializer.is_valid():
+                update_serializers[index] = serializer
+            else:
+                results[index].update(status=status.HTTP_400_BAD_REQUEST, errors=serializer.errors)
+
+        if any('errors' in result for result in results):
+            return status.HTTP_400_BAD_REQUEST, results
+
+        try:
+            created, updated = self._apply(create_serializer if creates else None, update_serializers,
+                                           [targets[operations[index]['id']] for index in deletes])
+        except TaskVersionConflict:
+            # 検証の後に別の保存が入った。トランザクションごと取り消したので何も適用されておらず、
+            # 今の版と読み込んだ版を比べてどの操作がぶつかったかを返す
+            current = dict(Task.objects.filter(pk__in=target_ids).values_list('pk', 'version'))
+            for index in updates + deletes:
+                task = targets[operations[index]['id']]
+                if current.get(task.pk) != task.version:
+                    results[index].update(status=status.HTTP_409_CONFLICT, errors={'id': '他の利用者が同時に変更しました。'})
+            return status.HTTP_409_CONFLICT, results
+        for index, task in zip(creates, created):
+            results[index].update(id=task.pk, status=status.HTTP_201_CREATED, data=TaskSerializer(task, context=self.context).data)
+        for index, task in updated.items():
+            results[index].update(status=status.HTTP_200_OK, data=TaskSerializer(task, context=self.context).data)
+        for index in deletes:
+            results[index]['status'] = status.HTTP_204_NO_CONTENT
+        return status.HTTP_200_OK, results
+
+    def _check_shape(self, operation):
+        if not isinstance(operation, dict) or operation.get('op') not in OPERATIONS:
+            return {'op': f"{' / '.join(OPERATIONS)} のいずれかを指定してください。"}
+        if operation['op'] != 'create' and not isinstance(operation.get('id'), int):
+            return {'id': 'タスクIDを整数で指定してください。'}
+        if operation['op'] != 'delete' and not isinstance(operation.get('data'), dict):
+            return {'data': 'オブジェクトを指定してください。'}
+        if operation['op'] != 'create' and 'version' in operation and not isinstance(operation['version'], int):
+            return {'version': '版数を整数で指定してください。'}
+        return None
+
+    def _apply(self, create_serializer, update_serializers, delete_tasks):
+        now = timezone.now()
+        created, updated = [], {}
+        with transaction.atomic(), acting_user(self.request.user):
+            self._claim_versions([serializer.instance for serializer in update_serializers.values()] + delete_tasks)
+
+            if create_serializer is not None:
+                created = Task.objects.bulk_create([
+                    Task(**data, creator_id=self.request.user.id) for data in create_serializer.validated_data
+                ])
+                send_bulk_post_save(created, created=True)
+
+            if update_serializers:
+                fields = {'updated_at'}
+                for index, serializer in update_serializers.items():
+                    task = serializer.instance
+                    for attr, value in serializer.validated_data.items():
+                        setattr(task, attr, value)
+                        fields.add(attr)
+                    # bulk_update は auto_now を更新しないので明示的に入れる（版数は _claim_versions で進めた）
+                    task.updated_at = now
+                    task.version += 1
+                    updated[index] = task
+                Task.objects.bulk_update(updated.values(), sorted(fields))
+                send_bulk_post_save(updated.values(), created=False)
+
+            if delete_tasks:
+                # QuerySet.delete は行ごとに post_delete を送るので削除記録もそのまま残る
+                with collect_deltas():
+                    Task.objects.filter(id__in=[task.pk for task in delete_tasks]).delete()
+        return created, updated
+
+    def _claim_versions(self, tasks):
+        """
+        読み込んだ版のままの行だけ版数を1つ進める（1回の UPDATE ... WHERE (id, version) の OR）。
+        進められなかった行があれば TaskVersionConflict
+        """
+        if not tasks:
+            return
+        condition = reduce(or_, (Q(pk=task.pk, version=task.version) for task in tasks))
+        if Task.objects.filter(condition).update(version=F('version') + 1) != len(tasks):
+            raise TaskVersionConflict(', '.join(str(task.pk) for task in tasks))
@@ -0,0 +1,257 @@
+"""
+他ツールから書き出したタスクの CSV / JSON をまとめて取り込む（manage.py import_tasks と POST /api/tasks/import/）。
+
+ファイルは1行ずつ読み、BATCH_SIZE 件ごとに
+- 担当者のユーザー名・プロジェクト名・取り込み済みの external_id をそれぞれ1クエリで引き、
+- TaskImportSerializer で検証し、
+- 問題の無い行だけを bulk_create で1トランザクションに書き込む。
+external_id が既にある行は取り込み済みとして飛ばすので、途中で止まっても同じファイルで
+再実行すれば重複しない。API の1回の行数上限で打ち切ったときは next_offset を返し、
+次の要求で offset に渡すとその行の次から読む（読み飛ばした行は検証もクエリもしない）。
+結果は行ごとのエラー一覧と件数で返す。
+"""
+import codecs
+import csv
+import json
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Min
+from rest_framework.exceptions import ValidationError
+
+from users.activity import acting_user
+from .models import Project, Task
+from .serializers import TaskSerializer
+from .signals import send_bulk_post_save
+
+BATCH_SIZE = getattr(settings, 'TASK_IMPORT_BATCH_SIZE', 500)
+# API で1リクエストに取り込む行数の上限（コマンドには無い）
+MAX_API_ROWS = getattr(settings, 'TASK_IMPORT_MAX_API_ROWS', 10000)
+FORMATS = ('csv', 'json', 'ndjson')
+# 行の中で名前で指定する関連（取り込み側の列名 -> 参照先）
+ASSIGNEE_COLUMN = 'assignee'
+PROJECT_COLUMN = 'project'
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+class TaskImportSerializer(TaskSerializer):
+    """
+    取り込み用。担当者・プロジェクトは名前からまとめて ID に変換するので検証対象から外し、
+    external_id の一意性もバッチごとにまとめて確かめる（行ごとのクエリを出さない）
+    """
+
+    class Meta(TaskSerializer.Meta):
+        fields = None
+        exclude = ('assignee', 'project')
+        extra_kwargs = {
+            'external_id': {'required': True, 'allow_null': False, 'allow_blank': False, 'validators': []},
+        }
+
+
+def read_rows(stream, format):
+    """
+    バイナリのファイルから dict の行を1件ずつ返す。
+    csv は見出し行つき（UTF-8、BOM 可）、ndjson は1行1オブジェクト、json はオブジェクトの配列
+    （配列は標準の json で一度に読むので、大きなファイルは ndjson を使う）
+    """
+    if format not in FORMATS:
+        raise ImportFormatError(f"形式は {' / '.join(FORMATS)} のいずれかを指定してください。")
+    text = codecs.getreader('utf-8-sig')(stream)
+    try:
+        yield from parse_rows(text, format)
+    except UnicodeDecodeError:
+        # Excel の CSV（Shift_JIS）など。ここまでの行は取り込み済みなので、保存し直して再送すれば続きから入る
+        raise ImportFormatError('ファイルを UTF-8 として読めません。UTF-8 で保存し直してください。')
+    except csv.Error as exc:
+        raise ImportFormatError(f'CSV として読めません: {exc}')
+
+
+def parse_rows(text, format):
+    if format == 'csv':
+        for row in csv.DictReader(text):
+            yield {key.strip(): value for key, value in row.items() if key is not None}
+    elif format == 'ndjson':
+        for number, line in enumerate(text, 1):
+            if line.strip():
+                yield parse_json_row(line, number)
+    else:
+        try:
+            rows = json.load(text)
+        except ValueError as exc:
+            raise ImportFormatError(f'JSON として読めません: {exc}')
+        if not isinstance(rows, list):
+            raise ImportFormatError('JSON はタスクの配列を指定してください。')
+        yield from rows
+
+
+def parse_json_row(line, number):
+    try:
+        return json.loads(line)
+    except ValueError:
+        # 行として扱い、エラーは行ごとの結果に出す
+        return {'__invalid__': f'{number}行目を JSON として読めません。'}
+
+
+def blank_to_none(row):
+    # CSV の空欄は「指定なし」として扱う（説明文は空文字のまま）
+    return {
+        key: (None if value == '' and key not in ('title', 'description') else value)
+        for key, value in row.items()
+    }
+
+
+class TaskImporter:
+    """
+    creator を作成者として行を取り込む。dry_run では検証だけ行い、何も書き込まない
+    """
+
+    def __init__(self, creator, batch_size=BATCH_SIZE, dry_run=False, max_rows=None, projects=None):
+        self.creator = creator
+        # プロジェクト名を探す範囲（API では取り込む人が編集できるプロジェクトだけ）
+        self.projects = Project.objects.all() if projects is None else projects
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.max_rows = max_rows
+        self.counts = {'rows': 0, 'created': 0, 'skipped': 0, 'failed': 0}
+        self.errors = []
+        self.complete = True
+        self.next_offset = None
+        self._seen_external_ids = set()
+
+    def run(self, rows, offset=0):
+        """
+        先頭の offset 行を読み飛ばしてから取り込む。max_rows 件で打ち切ったときは complete が偽になり、
+        next_offset（ここまでに読んだ行数）を offset に渡して再実行すれば続きから入る。
+        行番号はファイル全体での番号のまま
+        """
+        batch = []
+        for number, row in enumerate(rows, start=1):
+            if number <= offset:
+                continue
+            if self.max_rows is not None and self.counts['rows'] >= self.max_rows:
+                self.complete = False
+                self.next_offset = number - 1
+                break
+            self.counts['rows'] += 1
+            batch.append((number, row))
+            if len(batch) >= self.batch_size:
+                self.import_batch(batch)
+                batch = []
+        if batch:
+            self.import_batch(batch)
+        return self.report()
+
+    def report(self):
+        return {
+            **self.counts, 'dry_run': self.dry_run, 'complete': self.complete,
+            'next_offset': self.next_offset, 'errors': self.errors,
+        }
+
+    def fail(self, number, row, errors):
+        self.counts['failed'] += 1
+        external_id = row.get('external_id') if isinstance(row, dict) else None
+        self.errors.append({'row': number, 'external_id': external_id, 'errors': errors})
+
+    def import_batch(self, batch):
+        rows = []
+        for number, row in batch:
+            if not isinstance(row, dict):
+                self.fail(number, row, {'non_field_errors': ['オブジェクトを指定してください。']})
+            elif '__invalid__' in row:
+                self.fail(number, row, {'non_field_errors': [row['__invalid__']]})
+            elif self.non_scalar_errors(row):
+                self.fail(number, row, self.non_scalar_errors(row))
+            else:
+                rows.append((number, blank_to_none(row)))
+
+        users = self.lookup(get_user_model().objects.all(), 'username', rows, ASSIGNEE_COLUMN)
+        projects = self.lookup(self.projects, 'name', rows, PROJECT_COLUMN)
+        external_ids = {str(row['external_id']) for _, row in rows if row.get('external_id') is not None}
+        existing = set(Task.objects.filter(external_id__in=external_ids).values_list('external_id', flat=True))
+
+        pending = []
+        for number, row in rows:
+            external_id = row.get('external_id')
+            if external_id is not None and str(external_id) in existing:
+                self.counts['skipped'] += 1
+                continue
+            errors = {}
+            assignee_id = self.resolve(users, row.get(ASSIGNEE_COLUMN), ASSIGNEE_COLUMN, 'ユーザー', errors)
+            project_id = self.resolve(projects, row.get(PROJECT_COLUMN), PROJECT_COLUMN, 'プロジェクト', errors)
+            if external_id is not None and str(external_id) in self._seen_external_ids:
+                errors['external_id'] = ['同じ external_id の行が前にあります。']
+            if errors:
+                self.fail(number, row, errors)
+                continue
+            if external_id is not None:
+                self._seen_external_ids.add(str(external_id))
+            pending.append((number, row, assignee_id, project_id))
+
+        # 関連・一意性の検証を外してあるので、1件ずつ検証してもクエリは出ない
+        validator = TaskImportSerializer()
+        valid = []
+        for number, row, assignee_id, project_id in pending:
+            try:
+                data = validator.run_validation(row)
+            except ValidationError as exc:
+                self.fail(number, row, exc.detail)
+                continue
+            valid.append(Task(**data, assignee_id=assignee_id, project_id=project_id, creator_id=self.creator.pk))
+        self.save(valid)
+
+    def non_scalar_errors(self, row):
+        # 名前で引く列に配列・オブジェクトが来たら、まとめて引く前に行のエラーにする
+        return {
+            column: ['名前（文字列）を指定してください。']
+            for column in (ASSIGNEE_COLUMN, PROJECT_COLUMN)
+            if isinstance(row.get(column), (list, dict))
+        }
+
+    def lookup(self, queryset, field, rows, column):
+        names = {row[column] for _, row in rows if row.get(column) is not None}
+        if not names:
+            return {}
+        # 同名が複数あるプロジェクトは最初に作られたものに入れる
+        return dict(
+            queryset.filter(**{f'{field}__in': names}).values(field).annotate(first_id=Min('id')).values_list(field, 'first_id')
+        )
+
+    def resolve(self, mapping, name, column, label, errors):
+        if name is None:
+            return None
+        if name not in mapping:
+            errors[column] = [f'{label}「{name}」が見つかりません。']
+            return None
+        return mapping[name]
+
+    def save(self, tasks):
+        if not tasks:
+            return
+        if self.dry_run:
+            self.counts['created'] += len(tasks)
+            return
+        try:
+            with transaction.atomic(), acting_user(self.creator):
+                created = Task.objects.bulk_create(tasks)
+                send_bulk_post_save(created, created=True)
+        except IntegrityError:
+            # 別の取り込みが同じ external_id を先に入れた。入った分を除いてやり直す
+            existing = set(Task.objects.filter(
+                external_id__in=[task.external_id for task in tasks],
+            ).values_list('external_id', flat=True))
+            remaining = [task for task in tasks if task.external_id not in existing]
+            self.counts['skipped'] += len(tasks) - len(remaining)
+            if len(remaining) == len(tasks):
+                raise
+            for task in remaining:
+                task.pk = None
+            return self.save(remaining)
+        self.counts['created'] += len(created)
+
+
+def import_tasks(stream, format, creator, offset=0, **options):
+    return TaskImporter(creator, **options).run(read_rows(stream, format), offset=offset)
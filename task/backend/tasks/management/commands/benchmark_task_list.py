@@ -0,0 +1,74 @@
+import json
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from tasks.models import Task
+from tasks.views import TaskListCreateView
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'タスク一覧の通常の経路（TaskSerializer + JSONRenderer）と ?fast=1 の1秒あたりの処理件数を比べます'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, action='append', dest='page_sizes', help='繰り返し指定可（既定: 100 と 1000）')
+        parser.add_argument('--requests', type=int, default=50, help='経路・ページサイズごとのリクエスト数')
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--project', type=int, help='このプロジェクトのタスクだけで測る')
+
+    def handle(self, *args, **options):
+        user = User.objects.order_by('id').first()
+        if user is None or not Task.objects.exists():
+            raise CommandError('ユーザーとタスクがありません。先に create_dummy_data を実行してください。')
+        results = []
+        for page_size in options['page_sizes'] or [100, 1000]:
+            params = {'page_size': page_size}
+            if options['project']:
+                params['project'] = options['project']
+            normal = self.measure('serializer', user, params, options)
+            fast = self.measure('fast', user, {**params, 'fast': 1}, options)
+            # 次ページのリンクには fast=1 が付くので、それを除いて比べる
+            identical = normal.pop('body') == fast.pop('body').replace(b'&fast=1', b'').replace(b'fast=1&', b'')
+            for result in (normal, fast):
+                result['speedup'] = round(result['requests_per_second'] / normal['requests_per_second'], 2)
+            results.append({'page_size': page_size, 'identical': identical, 'results': [normal, fast]})
+        self.stdout.write(json.dumps({'requests': options['requests'], 'pages': results}, ensure_ascii=False, indent=2))
+
+    def measure(self, name, user, params, options):
+        view = TaskListCreateView.as_view()
+        factory = APIRequestFactory()
+        # 次ページのリンクを組み立てるので、ALLOWED_HOSTS に通るホスト名で送る
+        host = next((host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*'), 'localhost')
+
+        def call():
+            request = factory.get('/api/tasks/', params, HTTP_ACCEPT='application/json', HTTP_HOST=host)
+            force_authenticate(request, user=user)
+            response = view(request)
+            assert response.status_code == 200, response.status_code
+            return response.render().content
+
+        for _ in range(options['warmup']):
+            call()
+        with CaptureQueriesContext(connection) as ctx:
+            body = call()
+        queries = len(ctx.captured_queries)
+
+        started = time.perf_counter()
+        for _ in range(options['requests']):
+            call()
+        elapsed = time.perf_counter() - started
+        return {
+            'path': name,
+            'requests_per_second': round(options['requests'] / elapsed, 1),
+            'mean_ms': round(elapsed / options['requests'] * 1000, 3),
+            'queries_per_request': queries,
+            'bytes': len(body),
+            'body': body,
+        }
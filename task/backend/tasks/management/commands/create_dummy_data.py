@@ -1,59 +1,272 @@
-from django.core.management.base import BaseCommand
-from django.contrib.auth import get_user_model
-from tasks.models import Task, Project
+import csv
+import io
 import random
-from datetime import date, timedelta
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, time as dt_time, timedelta, timezone as dt_timezone
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Max, Min
+
+from common.cache import read_cache
+from tasks.models import Task, Project, ProjectMembership
+from tasks.rollups import rebuild_project_stats
+from tasks.stats import invalidate_task_stats
+from users.models import ActivityLog, Notification
+from users.notifications import adjust_unread_counts
+
+KANBAN_STATUSES = ['not_started', 'in_progress', 'review', 'done']
+# 検索の動作確認にも使えるよう、タイトル・説明文に混ぜる語
+TOPICS = ['デザインレビュー', '会議メモ', 'API設計', '請求書', 'テスト計画', 'リリース準備', '顧客対応', '議事録', 'バグ修正', '資料作成']
+ACTIONS = ['タスク「{}」を作成しました', 'タスク「{}」を更新しました', 'タスク「{}」のステータスを「完了」に変更しました']
+
+
+@contextmanager
+def keep_timestamps(model):
+    """
+    ブロック内では auto_now / auto_now_add を止め、行に入れた created_at / updated_at をそのまま書く
+    （bulk_create も pre_save で現在時刻に置き換えるため）
+    """
+    fields = [
+        (field, field.auto_now, field.auto_now_add)
+        for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    for field, _, _ in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in fields:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
 
 class Command(BaseCommand):
-    help = 'ダミーユーザーとダミータスクを作成します'
+    help = 'ダミーのユーザー・プロジェクト・タスク（と活動履歴・通知）をまとめて作成します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=5, help='ユーザー数')
+        parser.add_argument('--projects', type=int, default=3, help='プロジェクト数')
+        parser.add_argument('--tasks', type=int, default=40, help='タスク数')
+        parser.add_argument('--activity-logs', type=int, default=0, help='活動履歴の件数（過去1年に分散）')
+        parser.add_argument('--notifications', type=int, default=0, help='通知の件数')
+        parser.add_argument('--seed', type=int, default=0, help='乱数の種。同じ値・同じ日付なら同じデータになる')
+        parser.add_argument('--batch-size', type=int, default=5000, help='1回の INSERT / COPY で書き込む件数')
+        parser.add_argument('--password', default='testpass123', help='ダミーユーザー共通のパスワード')
 
     def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.today = date.today()
+        self.now = datetime.now(dt_timezone.utc)
+        # PostgreSQL は COPY で流し込む。それ以外は bulk_create（どちらも作成日時は指定どおりに入る）
+        self.use_copy = connection.vendor == 'postgresql'
+        self._reported = {}
+        started = time.perf_counter()
+
+        user_ids = self.create_users(options['users'], options['password'])
+        if not user_ids and (options['tasks'] or options['activity_logs'] or options['notifications']):
+            raise CommandError('タスク・活動履歴・通知を作るには --users に1以上を指定してください')
+        project_ids = self.create_projects(options['projects'])
+        self.delete_dummy_tasks()
+        task_range = self.create_tasks(options['tasks'], user_ids, project_ids)
+        self.create_memberships(project_ids)
+        if options['activity_logs']:
+            self.create_activity_logs(options['activity_logs'], user_ids, task_range)
+        if options['notifications']:
+            self.create_notifications(options['notifications'], user_ids)
+
+        # 一括書き込みはシグナルを送らないので、集計は作り直し、キャッシュはまとめて捨てる
+        rebuild_project_stats()
+        invalidate_task_stats()
+        read_cache('projects').invalidate()
+        read_cache('users').invalidate()
+        self.stdout.write(self.style.SUCCESS(f'ダミーデータ作成完了！（{time.perf_counter() - started:.1f}秒）'))
+
+    def create_users(self, count, password):
         User = get_user_model()
+        names = [f'user{i}' for i in range(1, count + 1)]
+        existing = set()
+        for chunk in self.chunks(names):
+            existing.update(User.objects.filter(username__in=chunk).values_list('username', flat=True))
+        # ハッシュ計算は1回だけ行い、全員で同じハッシュを使う
+        encoded = make_password(password)
+        new_users = (
+            User(username=name, email=f'{name}@example.com', password=encoded)
+            for name in names if name not in existing
+        )
+        created = self.bulk_create(User, new_users, count - len(existing), 'ユーザー')
+        if created:
+            self.stdout.write(self.style.SUCCESS(f'ユーザー作成: {created}人（パスワード: {password}）'))
+        user_ids = []
+        for chunk in self.chunks(names):
+            user_ids.extend(User.objects.filter(username__in=chunk).values_list('id', flat=True))
+        return sorted(user_ids)
+
+    def create_projects(self, count):
+        names = [f'プロジェクト{i}' for i in range(1, count + 1)]
+        existing = set(Project.objects.filter(name__in=names).values_list('name', flat=True))
+        new_projects = (
+            Project(name=name, description=f'これは{name}の説明です')
+            for name in names if name not in existing
+        )
+        self.bulk_create(Project, new_projects, count - len(existing), 'プロジェクト')
+        return sorted(Project.objects.filter(name__in=names).values_list('id', flat=True))
+
+    def delete_dummy_tasks(self):
+        # 大量の削除でも1文で済ませる（シグナル・削除記録は残さない）
+        deleted = Task.objects.filter(title__startswith='ダミータスク')._raw_delete(Task.objects.db)
+        if deleted:
+            self.stdout.write(f'既存のダミータスクを削除: {deleted}件')
+
+    def create_tasks(self, count, user_ids, project_ids):
+        rng = self.rng
+
+        def rows():
+            for i in range(1, count + 1):
+                topic = rng.choice(TOPICS)
+                # 開始日を今日から-30日〜+30日の範囲でランダムに、終了日は開始日から7〜30日後
+                start = self.today + timedelta(days=rng.randint(-30, 30))
+                end = start + timedelta(days=rng.randint(7, 30))
+                created = self.random_past(365)
+                yield {
+                    'title': f'ダミータスク{i} {topic}',
+                    'description': f'これはダミータスク{i}の説明です（{topic}）',
+                    'assignee_id': rng.choice(user_ids) if user_ids else None,
+                    'creator_id': rng.choice(user_ids),
+                    'status': rng.choice(KANBAN_STATUSES),
+                    'start_date': start,
+                    'end_date': end,
+                    'due_date': end,
+                    'project_id': rng.choice(project_ids) if project_ids else None,
+                    'created_at': created,
+                    'updated_at': created + timedelta(days=rng.randint(0, 30)),
+                    # COPY の列は dict のキーから決まるので、NOT NULL の列は明示する
+                    'version': 1,
+                }
+
+        self.write_rows(Task, rows(), count, 'タスク')
+        bounds = Task.objects.filter(title__startswith='ダミータスク').aggregate(low=Min('id'), high=Max('id'))
+        return bounds['low'], bounds['high']
+
+    def create_memberships(self, project_ids):
+        # タスクの作成者・担当者をそのプロジェクトの編集者にする（自分のタスクが一覧に出るように）
+        pairs = set()
+        for column in ('creator_id', 'assignee_id'):
+            rows = Task.objects.filter(project_id__in=project_ids, **{f'{column}__isnull': False})
+            pairs.update(rows.order_by().values_list('project_id', column).distinct())
+        pairs -= set(ProjectMembership.objects.filter(project_id__in=project_ids).values_list('project_id', 'user_id'))
+        memberships = (ProjectMembership(project_id=project_id, user_id=user_id) for project_id, user_id in sorted(pairs))
+        return self.bulk_create(ProjectMembership, memberships, len(pairs), 'メンバー')
+
+    def create_activity_logs(self, count, user_ids, task_range):
+        rng = self.rng
+        low, high = task_range
+
+        def rows():
+            for _ in range(count):
+                task_id = rng.randint(low, high) if low is not None else None
+                yield {
+                    'user_id': rng.choice(user_ids),
+                    'action': rng.choice(ACTIONS).format(f'ダミータスク{task_id}'),
+                    'created_at': self.random_past(365),
+                    'related_task_id': task_id,
+                }
+
+        self.write_rows(ActivityLog, rows(), count, '活動履歴')
+
+    def create_notifications(self, count, user_ids):
+        rng = self.rng
+        unread = {}
+
+        def rows():
+            for i in range(count):
+                user_id = rng.choice(user_ids)
+                is_read = rng.random() < 0.7
+                if not is_read:
+                    unread[user_id] = unread.get(user_id, 0) + 1
+                yield {
+                    'user_id': user_id,
+                    'message': f'ダミー通知{i + 1}',
+                    'is_read': is_read,
+                    'created_at': self.random_past(90),
+                    'link': None,
+                }
+
+        self.write_rows(Notification, rows(), count, '通知')
+        adjust_unread_counts(unread)
+
+    def random_past(self, days):
+        return self.now - timedelta(seconds=self.rng.randint(0, days * 86400))
+
+    def write_rows(self, model, rows, total, label):
+        """
+        dict の行を batch_size 件ずつ書き込む。PostgreSQL は COPY、それ以外は bulk_create
+        """
+        if self.use_copy:
+            columns = None
+            written = 0
+            started = time.perf_counter()
+            for batch in self.chunks(rows):
+                columns = columns or list(batch[0])
+                self.copy_rows(model, columns, batch)
+                written += len(batch)
+                self.report(label, written, total, started)
+            return written
+        objects = (model(**row) for row in rows)
+        with keep_timestamps(model):
+            return self.bulk_create(model, objects, total, label)
+
+    def bulk_create(self, model, objects, total, label):
+        written = 0
+        started = time.perf_counter()
+        for batch in self.chunks(objects):
+            model.objects.bulk_create(batch)
+            written += len(batch)
+            self.report(label, written, total, started)
+        return written
+
+    def copy_rows(self, model, columns, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([self.csv_value(row[column]) for column in columns])
+        buffer.seek(0)
+        quote = connection.ops.quote_name
+        sql = f'COPY {quote(model._meta.db_table)} ({", ".join(quote(c) for c in columns)}) FROM STDIN WITH (FORMAT csv)'
+        with connection.cursor() as cursor:
+            cursor.cursor.copy_expert(sql, buffer)
+
+    def csv_value(self, value):
+        # CSV の空欄は NULL になる
+        if value is None:
+            return ''
+        if isinstance(value, bool):
+            return 't' if value else 'f'
+        if isinstance(value, (date, datetime, dt_time)):
+            return value.isoformat()
+        return value
+
+    def chunks(self, iterable):
+        batch = []
+        for item in iterable:
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
 
-        # ダミーユーザー作成
-        users = []
-        for i in range(1, 6):
-            username = f'user{i}'
-            email = f'user{i}@example.com'
-            password = 'testpass123'
-            user, created = User.objects.get_or_create(username=username, defaults={'email': email})
-            if created:
-                user.set_password(password)
-                user.save()
-                self.stdout.write(self.style.SUCCESS(f'ユーザー作成: {username} / {password}'))
-            users.append(user)
-
-        # ダミープロジェクト作成
-        projects = []
-        for i in range(1, 4):
-            project, _ = Project.objects.get_or_create(name=f'プロジェクト{i}', defaults={'description': f'これはプロジェクト{i}の説明です'})
-            projects.append(project)
-
-        # 既存のダミータスク削除
-        Task.objects.filter(title__startswith='ダミータスク').delete()
-
-        # ダミータスク作成
-        today = date.today()
-        kanban_statuses = ['not_started', 'in_progress', 'review', 'done']
-        for i in range(1, 41):
-            assignee = random.choice(users)
-            creator = random.choice(users)
-            # 開始日を今日から-30日〜+30日の範囲でランダムに
-            start = today + timedelta(days=random.randint(-30, 30))
-            # 終了日は開始日から7〜30日後
-            end = start + timedelta(days=random.randint(7, 30))
-            project = random.choice(projects)
-            status = random.choice(kanban_statuses)
-            task = Task.objects.create(
-                title=f'ダミータスク{i}',
-                description=f'これはダミータスク{i}の説明です',
-                assignee=assignee,
-                creator=creator,
-                status=status,
-                start_date=start,
-                end_date=end,
-                project=project
-            )
-            self.stdout.write(self.style.SUCCESS(f'タスク作成: {task.title}（担当: {assignee.username}、プロジェクト: {project.name}、ステータス: {status}）'))
-
-        self.stdout.write(self.style.SUCCESS('ダミーデータ作成完了！')) 
\ No newline at end of file
+    def report(self, label, written, total, started):
+        # 10% ごと（と最後）にだけ進捗を出す
+        step = max(total // 10, 1)
+        reported = self._reported.get(label, 0)
+        if written < total and written - reported < step:
+            return
+        self._reported[label] = written
+        elapsed = time.perf_counter() - started
+        rate = written / elapsed if elapsed else 0
+        self.stdout.write(f'{label}: {written:,}/{total:,}（{elapsed:.1f}秒, {rate:,.0f}件/秒）')
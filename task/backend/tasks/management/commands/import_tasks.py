@@ -0,0 +1,44 @@
+import json
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from tasks.importer import BATCH_SIZE, FORMATS, ImportFormatError, import_tasks
+
+
+class Command(BaseCommand):
+    help = 'CSV / JSON / NDJSON のタスクをまとめて取り込みます（external_id が取り込み済みの行は飛ばします）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='取り込むファイル')
+        parser.add_argument('--format', choices=FORMATS, help='省略時は拡張子から判断')
+        parser.add_argument('--creator', required=True, help='作成者にするユーザー名')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='検証だけ行い、書き込まない')
+        parser.add_argument('--report', help='行ごとのエラーを含む結果を JSON で書き出すファイル')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        format = options['format'] or path.suffix.lstrip('.').lower()
+        try:
+            creator = get_user_model().objects.get(username=options['creator'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"ユーザー「{options['creator']}」が見つかりません")
+        try:
+            with path.open('rb') as stream:
+                report = import_tasks(
+                    stream, format, creator, batch_size=options['batch_size'], dry_run=options['dry_run'],
+                )
+        except (OSError, ImportFormatError) as exc:
+            raise CommandError(str(exc))
+
+        if options['report']:
+            Path(options['report']).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+        for error in report['errors'][:20]:
+            self.stdout.write(f"{error['row']}行目（{error['external_id']}）: {json.dumps(error['errors'], ensure_ascii=False)}")
+        if len(report['errors']) > 20:
+            self.stdout.write(f"ほか {len(report['errors']) - 20} 件のエラー（--report で全件を書き出せます）")
+        label = '検証' if options['dry_run'] else '取り込み'
+        summary = f"{label}完了: {report['rows']} 行中 作成 {report['created']} / 取り込み済み {report['skipped']} / エラー {report['failed']}"
+        self.stdout.write(self.style.WARNING(summary) if report['failed'] else self.style.SUCCESS(summary))
@@ -0,0 +1,25 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tasks.rollups import rebuild_project_stats, verify_project_stats
+
+
+class Command(BaseCommand):
+    help = 'プロジェクトごとのタスク集計（ProjectStats）を実際の件数と照合（verify）・作り直し（rebuild）します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['verify', 'rebuild'])
+
+    def handle(self, *args, **options):
+        if options['action'] == 'rebuild':
+            count = rebuild_project_stats()
+            self.stdout.write(self.style.SUCCESS(f'{count} プロジェクトの集計を作り直しました'))
+            return
+
+        drift = verify_project_stats()
+        for item in drift:
+            self.stdout.write(json.dumps(item, ensure_ascii=False))
+        if drift:
+            raise CommandError(f'{len(drift)} プロジェクトの集計がずれています（project_stats rebuild で直せます）')
+        self.stdout.write(self.style.SUCCESS('集計は実際の件数と一致しています'))
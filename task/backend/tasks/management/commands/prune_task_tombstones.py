@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from tasks.sync import TOMBSTONE_RETENTION, prune_tombstones
+
+
+class Command(BaseCommand):
+    help = '保持期間を過ぎたタスク削除記録（差分同期用）を削除します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=TOMBSTONE_RETENTION.days, help='保持する日数')
+
+    def handle(self, *args, **options):
+        deleted = prune_tombstones(timedelta(days=options['days']))
+        self.stdout.write(self.style.SUCCESS(f'削除記録を {deleted} 件削除しました'))
@@ -0,0 +1,59 @@
+from django.db import migrations
+
+# search_vector は検索専用の列なのでモデルには出さず、PostgreSQL のトリガーだけで維持する
+FORWARD = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'ALTER TABLE tasks_task ADD COLUMN search_vector tsvector',
+    """
+    CREATE FUNCTION tasks_task_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('simple', coalesce(NEW.title, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce(NEW.description, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER tasks_task_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, description ON tasks_task
+    FOR EACH ROW EXECUTE FUNCTION tasks_task_search_vector_update()
+    """,
+    """
+    UPDATE tasks_task SET search_vector =
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+    """,
+    'CREATE INDEX tasks_task_search_vector_idx ON tasks_task USING gin (search_vector)',
+    'CREATE INDEX tasks_task_title_trgm_idx ON tasks_task USING gin (title gin_trgm_ops)',
+    'CREATE INDEX tasks_task_description_trgm_idx ON tasks_task USING gin (description gin_trgm_ops)',
+]
+
+BACKWARD = [
+    'DROP INDEX IF EXISTS tasks_task_description_trgm_idx',
+    'DROP INDEX IF EXISTS tasks_task_title_trgm_idx',
+    'DROP TRIGGER IF EXISTS tasks_task_search_vector_trigger ON tasks_task',
+    'DROP FUNCTION IF EXISTS tasks_task_search_vector_update()',
+    'ALTER TABLE tasks_task DROP COLUMN IF EXISTS search_vector',
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        # SQLite などでは Python 実装の索引（tasks/search.py）を使うので何もしない
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0006_task_timeline_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(_run(FORWARD), _run(BACKWARD)),
+    ]
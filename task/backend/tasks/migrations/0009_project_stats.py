@@ -0,0 +1,45 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+STATUS_FIELDS = ('not_started', 'in_progress', 'review', 'done')
+
+
+def populate_project_stats(apps, schema_editor):
+    # 既存のタスクから集計行を作る（以降はシグナルで増減する）
+    Project = apps.get_model('tasks', 'Project')
+    ProjectStats = apps.get_model('tasks', 'ProjectStats')
+    Task = apps.get_model('tasks', 'Task')
+    stats = {project_id: ProjectStats(project_id=project_id) for project_id in Project.objects.values_list('id', flat=True)}
+    rows = Task.objects.filter(project__isnull=False).order_by().values_list('project_id', 'status').annotate(count=Count('id'))
+    for project_id, status, count in rows:
+        row = stats[project_id]
+        row.total += count
+        if status in STATUS_FIELDS:
+            setattr(row, status, getattr(row, status) + count)
+    ProjectStats.objects.bulk_create(stats.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0008_task_external_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectStats',
+            fields=[
+                ('project', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='tasks.project')),
+                ('total', models.IntegerField(default=0)),
+                ('not_started', models.IntegerField(default=0)),
+                ('in_progress', models.IntegerField(default=0)),
+                ('review', models.IntegerField(default=0)),
+                ('done', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(populate_project_stats, migrations.RunPython.noop),
+    ]
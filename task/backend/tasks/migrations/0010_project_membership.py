@@ -0,0 +1,44 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_memberships(apps, schema_editor):
+    # これまで見えていたタスクが見えなくならないよう、プロジェクトのタスクの作成者・担当者を編集者にする
+    ProjectMembership = apps.get_model('tasks', 'ProjectMembership')
+    Task = apps.get_model('tasks', 'Task')
+    pairs = set()
+    for column in ('creator_id', 'assignee_id'):
+        rows = Task.objects.filter(project__isnull=False, **{f'{column}__isnull': False}).order_by().values_list('project_id', column).distinct()
+        pairs.update(rows.iterator(chunk_size=5000))
+    ProjectMembership.objects.bulk_create(
+        [ProjectMembership(project_id=project_id, user_id=user_id, role='editor') for project_id, user_id in sorted(pairs)],
+        batch_size=1000, ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0009_project_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectMembership',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('owner', 'オーナー'), ('editor', '編集者'), ('viewer', '閲覧者')], default='editor', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='tasks.project')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='project_memberships', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'project'), name='membership_user_project_uniq')],
+            },
+        ),
+        migrations.RunPython(populate_memberships, migrations.RunPython.noop),
+    ]
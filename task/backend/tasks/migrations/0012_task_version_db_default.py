@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0011_task_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='task',
+            name='version',
+            field=models.PositiveIntegerField(db_default=1, default=1),
+        ),
+    ]
@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def fallback_owner_id(apps):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    username = getattr(settings, 'PROJECT_OWNER_FALLBACK_USERNAME', None)
+    users = User.objects.filter(username=username) if username else User.objects.filter(is_superuser=True, is_active=True)
+    return users.order_by('id').values_list('id', flat=True).first()
+
+
+def backfill_project_owners(apps, schema_editor):
+    """
+    owner のいないプロジェクトに owner を1人付ける（0010 の移行では編集者しか作らなかったため）。
+    最初のタスクの作成者を owner にし、タスクの無いプロジェクトは PROJECT_OWNER_FALLBACK_USERNAME
+    （未指定なら最初のスーパーユーザー）にする。すでにメンバーなら役割を owner に上げる
+    """
+    Project = apps.get_model('tasks', 'Project')
+    ProjectMembership = apps.get_model('tasks', 'ProjectMembership')
+    Task = apps.get_model('tasks', 'Task')
+    first_creator = Task.objects.filter(project=OuterRef('pk')).order_by('created_at', 'id').values('creator_id')[:1]
+    owners = dict(
+        Project.objects.exclude(memberships__role='owner')
+        .annotate(first_creator=Subquery(first_creator))
+        .values_list('id', 'first_creator')
+        .iterator(chunk_size=5000)
+    )
+    fallback = fallback_owner_id(apps)
+    owners = {project_id: user_id or fallback for project_id, user_id in owners.items() if user_id or fallback}
+    if not owners:
+        return
+    existing = {
+        (membership.project_id, membership.user_id): membership
+        for membership in ProjectMembership.objects.filter(project_id__in=owners)
+    }
+    promoted, created = [], []
+    for project_id, user_id in sorted(owners.items()):
+        membership = existing.get((project_id, user_id))
+        if membership is None:
+            created.append(ProjectMembership(project_id=project_id, user_id=user_id, role='owner'))
+        else:
+            membership.role = 'owner'
+            promoted.append(membership)
+    ProjectMembership.objects.bulk_update(promoted, ['role'], batch_size=1000)
+    ProjectMembership.objects.bulk_create(created, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0012_task_version_db_default'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_project_owners, migrations.RunPython.noop),
+    ]
@@ -1,14 +1,57 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 
 class Project(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-updated_at', '-id'], name='project_updated_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+class ProjectMembership(models.Model):
+    """
+    プロジェクトの参加者と役割。メンバーでないプロジェクトのタスクは一覧・詳細に出ない（管理者を除く）。
+    オーナーはプロジェクト自体とメンバーを管理でき、編集者はタスクを変更でき、閲覧者は見るだけ
+    """
+    OWNER = 'owner'
+    EDITOR = 'editor'
+    VIEWER = 'viewer'
+    ROLE_CHOICES = [
+        (OWNER, 'オーナー'),
+        (EDITOR, '編集者'),
+        (VIEWER, '閲覧者'),
+    ]
+
+    project = models.ForeignKey(Project, related_name='memberships', on_delete=models.CASCADE)
+    user = models.ForeignKey(get_user_model(), related_name='project_memberships', on_delete=models.CASCADE)
+    role = models.CharField(max_length=20, choices=ROLE_CHOICES, default=EDITOR)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # 可視範囲の判定（user_id で引いて project_id を返す）がインデックスだけで済むよう user を先頭にする
+            models.UniqueConstraint(fields=['user', 'project'], name='membership_user_project_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} @ {self.project_id} ({self.role})'
+
+class TaskVersionConflict(Exception):
+    """
+    読み込んだ後に別の保存でタスクの版数が進んでいた（UPDATE ... WHERE version= が0行だった）
+    """
+
+    def __init__(self, task_id):
+        super().__init__(f'タスク {task_id} は読み込んだ後に変更されています')
+        self.task_id = task_id
+
 class Task(models.Model):
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True)
@@ -28,8 +71,113 @@ class Task(models.Model):
         ],
         default='not_started'
     )
+    # 他ツールから取り込んだタスクの元の ID。取り込みを再実行しても重複させないために使う
+    external_id = models.CharField(max_length=100, unique=True, null=True, blank=True)
+    # 楽観的排他制御の版数。保存のたびに1つ進み、読み込んだ時の版のままの行だけを書き換える
+    # （ETag / If-Match にもこの値を使う）。db_default は COPY や生の INSERT で列を省いた行のため
+    version = models.PositiveIntegerField(default=1, db_default=1)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # カーソルページネーションの並び順 (updated_at, id) に合わせた複合インデックス
+            models.Index(fields=['-updated_at', '-id'], name='task_updated_id_idx'),
+            models.Index(fields=['project', '-updated_at', '-id'], name='task_project_updated_id_idx'),
+            # ガントチャートの期間検索（start_date <= to AND end_date >= from）用。
+            # 表示期間の位置によって絞り込みが効く側が変わるので両方向を用意する
+            models.Index(fields=['start_date', 'end_date'], name='task_start_end_idx'),
+            models.Index(fields=['end_date', 'start_date'], name='task_end_start_idx'),
+        ]
+
     def __str__(self):
         return self.title
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.snapshot_loaded_values()
+        return instance
+
+    def snapshot_loaded_values(self):
+        # シグナル側で変更前の値と比較できるよう、DB 上の値を覚えておく
+        self._loaded_values = {
+            field.attname: getattr(self, field.attname)
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__
+        }
+
+    def loaded_value(self, attname):
+        """
+        DB から読み込んだ（または最後に保存した）時点の値。新規作成なら None
+        """
+        return getattr(self, '_loaded_values', {}).get(attname)
+
+    def save(self, *args, **kwargs):
+        # 既存のタスクなら版数を1つ進め、_do_update で読み込んだ版の行だけを UPDATE する
+        # （行ロックは取らない。先に別の保存が入っていれば TaskVersionConflict）
+        expected = None
+        if not self._state.adding and self.pk is not None:
+            expected = self.loaded_value('version') or self.version
+            self.version = expected + 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        self._expected_version = expected
+        try:
+            # post_save の受信側（ProjectStats の増減）も同じトランザクションで行う
+            with transaction.atomic(using=kwargs.get('using')):
+                super().save(*args, **kwargs)
+        except TaskVersionConflict:
+            self.version = expected
+            raise
+        finally:
+            self._expected_version = None
+        self.snapshot_loaded_values()
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        expected = getattr(self, '_expected_version', None)
+        if expected is None:
+            return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+        if super()._do_update(base_qs.filter(version=expected), using, pk_val, values, update_fields, forced_update):
+            return True
+        # 0行なら、行が残っているかで「先に更新された」と「削除された」を見分ける（衝突時だけの1クエリ）
+        if base_qs.filter(pk=pk_val).exists():
+            raise TaskVersionConflict(pk_val)
+        return False
+
+
+class ProjectStats(models.Model):
+    """
+    プロジェクトごとのステータス別タスク数。タスクの作成・ステータス変更・プロジェクト移動・削除の
+    たびに tasks/rollups.py が F 式で増減させる。ずれたら manage.py project_stats rebuild で作り直す
+    """
+    project = models.OneToOneField(Project, primary_key=True, related_name='stats', on_delete=models.CASCADE)
+    total = models.IntegerField(default=0)
+    not_started = models.IntegerField(default=0)
+    in_progress = models.IntegerField(default=0)
+    review = models.IntegerField(default=0)
+    done = models.IntegerField(default=0)
+    # QuerySet.update では auto_now が効かないので、増減のたびに明示的に入れる
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.project_id}: {self.done}/{self.total}'
+
+
+class TaskTombstone(models.Model):
+    """
+    削除されたタスクの記録。差分同期で削除をクライアントへ伝えるために残す。
+    別のプロジェクトへ移したタスクも、元のプロジェクトの project_id で記録する
+    """
+    task_id = models.BigIntegerField()
+    project_id = models.BigIntegerField(null=True, blank=True)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at'], name='tombstone_deleted_at_idx'),
+            models.Index(fields=['project_id', 'deleted_at'], name='tombstone_project_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.task_id} ({self.deleted_at})"
@@ -1,5 +1,8 @@
 from rest_framework import permissions
 
+from .models import ProjectMembership
+from .visibility import can_edit_task, get_project_roles
+
 class IsOwnerOrAdmin(permissions.BasePermission):
     """
     オブジェクトの作成者または管理者のみ編集・削除を許可
@@ -8,5 +11,26 @@ class IsOwnerOrAdmin(permissions.BasePermission):
         # 管理者は常に許可
         if request.user and request.user.is_staff:
             return True
-        # 作成者のみ許可
-        return obj.creator == request.user 
\ No newline at end of file
+        # 作成者のみ許可（creator を読み込まずに ID で比較する）
+        return obj.creator_id == request.user.id 
+
+class IsTaskEditorOrReadOnly(permissions.BasePermission):
+    """
+    参照は見えるタスクなら誰でも（見える範囲は get_queryset で絞ってある）。
+    変更・削除は作成者・プロジェクトのオーナー / 編集者・管理者のみ
+    """
+    def has_object_permission(self, request, view, obj):
+        if request.method in permissions.SAFE_METHODS:
+            return True
+        return can_edit_task(request, obj)
+
+
+class IsProjectOwnerOrReadOnly(permissions.BasePermission):
+    """
+    プロジェクト（とそのメンバー）の変更はオーナーと管理者のみ
+    """
+    def has_object_permission(self, request, view, obj):
+        if request.method in permissions.SAFE_METHODS or request.user.is_staff:
+            return True
+        project_id = obj.project_id if isinstance(obj, ProjectMembership) else obj.pk
+        return get_project_roles(request).get(project_id) == ProjectMembership.OWNER
@@ -0,0 +1,145 @@
+"""
+ProjectStats（プロジェクトごとのステータス別タスク数）の増減・作り直し・検証。
+
+タスクの保存・削除のシグナルで (プロジェクト, ステータス) ごとの増減を求め、
+プロジェクトごとに UPDATE 1回（F 式）で反映する。Task.save と削除はシグナルごと
+トランザクションの中で動くので、タスクの変更と集計は一緒に確定・取り消しされる。
+一括操作では collect_deltas() の中で増減を溜め、最後にまとめて反映する。
+"""
+import contextvars
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from common.cache import read_cache
+from .models import Project, ProjectStats, Task
+
+STATUS_FIELDS = ('not_started', 'in_progress', 'review', 'done')
+COUNT_FIELDS = ('total', *STATUS_FIELDS)
+
+_pending = contextvars.ContextVar('project_stats_deltas', default=None)
+
+
+def task_deltas(old, new):
+    """
+    old / new は (project_id, status) か None（作成前・削除後）。{(project_id, status): 増減} を返す
+    """
+    deltas = defaultdict(int)
+    if old == new:
+        return deltas
+    if old is not None and old[0] is not None:
+        deltas[old] -= 1
+    if new is not None and new[0] is not None:
+        deltas[new] += 1
+    return deltas
+
+
+def record(deltas):
+    """
+    collect_deltas() の中なら溜め、そうでなければすぐ反映する
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    pending = _pending.get()
+    if pending is None:
+        apply_deltas(deltas)
+    else:
+        for key, delta in deltas.items():
+            pending[key] += delta
+
+
+@contextmanager
+def collect_deltas():
+    pending = defaultdict(int)
+    token = _pending.set(pending)
+    try:
+        yield
+    finally:
+        _pending.reset(token)
+    apply_deltas(pending)
+
+
+def apply_deltas(deltas):
+    """
+    {(project_id, status): 増減} をプロジェクトごとに UPDATE 1回で反映する
+    """
+    by_project = defaultdict(lambda: defaultdict(int))
+    for (project_id, status), delta in deltas.items():
+        if not delta:
+            continue
+        by_project[project_id]['total'] += delta
+        if status in STATUS_FIELDS:
+            by_project[project_id][status] += delta
+    if not by_project:
+        return
+    now = timezone.now()
+    with transaction.atomic():
+        for project_id, changes in sorted(by_project.items()):
+            values = {field: F(field) + delta for field, delta in changes.items() if delta}
+            if not values:
+                continue
+            if not ProjectStats.objects.filter(project_id=project_id).update(**values, updated_at=now):
+                # 集計行がまだ無い（移行前に作られたプロジェクトなど）。作ってから足す
+                if not Project.objects.filter(pk=project_id).exists():
+                    continue
+                ProjectStats.objects.get_or_create(project_id=project_id)
+                ProjectStats.objects.filter(project_id=project_id).update(**values, updated_at=now)
+    read_cache('projects').invalidate_on_commit()
+
+
+def count_tasks():
+    """
+    実際のタスク数を {project_id: {total, not_started, ...}} で返す
+    """
+    counts = defaultdict(lambda: dict.fromkeys(COUNT_FIELDS, 0))
+    rows = (
+        Task.objects.filter(project__isnull=False).order_by()
+        .values_list('project_id', 'status').annotate(count=Count('id'))
+    )
+    for project_id, status, count in rows:
+        counts[project_id]['total'] += count
+        if status in STATUS_FIELDS:
+            counts[project_id][status] += count
+    return counts
+
+
+def verify_project_stats():
+    """
+    集計行と実際の件数が違うプロジェクトを [{project, expected, actual}] で返す
+    """
+    expected = count_tasks()
+    actual = {
+        row['project_id']: {field: row[field] for field in COUNT_FIELDS}
+        for row in ProjectStats.objects.values('project_id', *COUNT_FIELDS)
+    }
+    drift = []
+    for project_id in sorted(Project.objects.values_list('id', flat=True)):
+        want = expected.get(project_id, dict.fromkeys(COUNT_FIELDS, 0))
+        have = actual.get(project_id)
+        if have != want:
+            drift.append({'project': project_id, 'expected': want, 'actual': have})
+    return drift
+
+
+def rebuild_project_stats():
+    """
+    全プロジェクトの集計行を実際の件数で作り直し、作り直した行数を返す。
+    集計行をロックしてから数えるので、並行するタスク変更の増減は数え終わった後に足される
+    """
+    with transaction.atomic():
+        list(ProjectStats.objects.select_for_update().values_list('project_id', flat=True))
+        counts = count_tasks()
+        now = timezone.now()
+        rows = [
+            ProjectStats(project_id=project_id, updated_at=now, **counts.get(project_id, dict.fromkeys(COUNT_FIELDS, 0)))
+            for project_id in Project.objects.values_list('id', flat=True)
+        ]
+        ProjectStats.objects.bulk_create(
+            rows, update_conflicts=True, unique_fields=['project'], update_fields=[*COUNT_FIELDS, 'updated_at'],
+        )
+    read_cache('projects').invalidate_on_commit()
+    return len(rows)
@@ -0,0 +1,188 @@
+"""
+タスクの全文検索。
+
+PostgreSQL ではトリガーで維持する tasks_task.search_vector（tsvector, GIN インデックス）と
+pg_trgm のトライグラム類似度を組み合わせて順位付けする（マイグレーション 0007）。
+日本語は空白で区切られず 'simple' 設定の tsvector では語の途中に当たらないので、
+部分一致と表記ゆれはトライグラム側で拾う。
+
+それ以外のDB（テストの SQLite など）では、文字 bigram の転置インデックスを
+プロセス内に持つ Python 実装で候補を絞り、DB から読んだ本文で採点し直す。
+"""
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+
+from django.db import connection
+from django.db.models import BooleanField, Case, FloatField, Value, When
+from django.db.models.expressions import RawSQL
+
+from .models import Task
+
+# 関連度順は OFFSET で読むので、深追いしないよう件数を打ち切る
+MAX_RESULTS = 200
+# クエリの bigram のうちこの割合以上を含む文書を一致とみなす（Python 実装）
+MATCH_THRESHOLD = 0.7
+TITLE_WEIGHT = 1.0
+DESCRIPTION_WEIGHT = 0.4
+PHRASE_BONUS = 0.5
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def normalize(text):
+    # 全角英数・半角カナの揺れを NFKC で吸収する
+    return unicodedata.normalize('NFKC', text or '').lower()
+
+
+def ngrams(text, n=2):
+    grams = set()
+    for token in TOKEN_RE.findall(normalize(text)):
+        if len(token) < n:
+            grams.add(token)
+        else:
+            grams.update(token[i:i + n] for i in range(len(token) - n + 1))
+    return grams
+
+
+def score(query, query_grams, title, description):
+    """
+    タイトル・本文それぞれに含まれるクエリ bigram の割合から関連度を出す。一致しなければ None
+    """
+    title_grams = ngrams(title)
+    description_grams = ngrams(description)
+    total = len(query_grams)
+    if len(query_grams & (title_grams | description_grams)) < total * MATCH_THRESHOLD:
+        return None
+    value = (
+        TITLE_WEIGHT * len(query_grams & title_grams) / total
+        + DESCRIPTION_WEIGHT * len(query_grams & description_grams) / total
+    )
+    if normalize(query) in normalize(title):
+        value += PHRASE_BONUS
+    return round(value, 6)
+
+
+class PythonSearchIndex:
+    """
+    task_id ごとの bigram 集合と、bigram → task_id の転置リスト。
+    初回検索時に全件から作り、以降は post_save / post_delete で差分更新する。
+    queryset.update() のようにシグナルを送らない更新は反映されないが、
+    候補は必ず DB の現在の値で採点し直すので、古い内容が結果に出ることはない
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._documents = {}
+        self._postings = defaultdict(set)
+        self.loaded = False
+
+    def load(self):
+        with self._lock:
+            if self.loaded:
+                return
+            rows = Task.objects.order_by().values_list('id', 'title', 'description')
+            for task_id, title, description in rows.iterator(chunk_size=2000):
+                self._add(task_id, title, description)
+            self.loaded = True
+
+    def update(self, task_id, title, description):
+        with self._lock:
+            self._remove(task_id)
+            self._add(task_id, title, description)
+
+    def remove(self, task_id):
+        with self._lock:
+            self._remove(task_id)
+
+    def candidates(self, query_grams):
+        self.load()
+        hits = Counter()
+        with self._lock:
+            for gram in query_grams:
+                hits.update(self._postings.get(gram, ()))
+        needed = len(query_grams) * MATCH_THRESHOLD
+        return [task_id for task_id, count in hits.items() if count >= needed]
+
+    def _add(self, task_id, title, description):
+        grams = ngrams(title) | ngrams(description)
+        self._documents[task_id] = grams
+        for gram in grams:
+            self._postings[gram].add(task_id)
+
+    def _remove(self, task_id):
+        for gram in self._documents.pop(task_id, ()):
+            postings = self._postings.get(gram)
+            if postings is not None:
+                postings.discard(task_id)
+                if not postings:
+                    del self._postings[gram]
+
+
+_index = PythonSearchIndex()
+
+
+def get_search_index():
+    return _index
+
+
+def uses_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def search_tasks(queryset, query):
+    """
+    queryset を query に一致するタスクに絞り、関連度 search_rank の高い順に並べて返す
+    """
+    if uses_postgres():
+        return _search_postgres(queryset, query)
+    return _search_python(queryset, query)
+
+
+def _search_postgres(queryset, query):
+    table = connection.ops.quote_name(Task._meta.db_table)
+    pattern = '%' + re.sub(r'([\\%_])', r'\\\1', query) + '%'
+    matched = RawSQL(
+        f"({table}.search_vector @@ plainto_tsquery('simple', %s)"
+        f" OR {table}.title ILIKE %s OR {table}.description ILIKE %s"
+        f" OR {table}.title %% %s)",
+        [query, pattern, pattern, query],
+        output_field=BooleanField(),
+    )
+    rank = RawSQL(
+        f"ts_rank({table}.search_vector, plainto_tsquery('simple', %s)) + similarity({table}.title, %s)",
+        [query, query],
+        output_field=FloatField(),
+    )
+    return (
+        queryset.alias(search_match=matched)
+        .filter(search_match=True)
+        .annotate(search_rank=rank)
+        .order_by('-search_rank', '-id')
+    )
+
+
+def _search_python(queryset, query):
+    query_grams = ngrams(query)
+    if not query_grams:
+        return queryset.none()
+    candidates = get_search_index().candidates(query_grams)
+    rows = queryset.filter(id__in=candidates).order_by().values_list('id', 'title', 'description')
+    ranked = []
+    for task_id, title, description in rows:
+        value = score(query, query_grams, title, description)
+        if value is not None:
+            ranked.append((value, task_id))
+    ranked.sort(reverse=True)
+    ranked = ranked[:MAX_RESULTS]
+    if not ranked:
+        return queryset.none()
+    return (
+        queryset.filter(id__in=[task_id for _, task_id in ranked])
+        .annotate(search_rank=Case(
+            *[When(id=task_id, then=Value(value)) for value, task_id in ranked],
+            output_field=FloatField(),
+        ))
+        .order_by('-search_rank', '-id')
+    )
@@ -1,29 +1,185 @@
+from django.core.exceptions import FieldDoesNotExist
 from rest_framework import serializers
-from .models import Task, Project
+from rest_framework.permissions import SAFE_METHODS
+from .models import Task, Project, ProjectMembership, ProjectStats
+from .visibility import can_use_project
+
+
+class EagerLoadingMixin:
+    """
+    宣言済みフィールドの source から select_related / prefetch_related を組み立てる
+    """
+    @classmethod
+    def setup_eager_loading(cls, queryset, fields=None):
+        """
+        fields（返すフィールド名の集合）を渡すと、そのフィールドに要る関連だけを JOIN する
+        """
+        if fields is None:
+            select_related, prefetch_related = cls.get_eager_loading_plan()
+        else:
+            declared = [field for name, field in cls._get_declared_fields().items() if name in fields]
+            select_related, prefetch_related = cls._build_eager_loading_plan(declared)
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
+
+    @classmethod
+    def setup_sparse_loading(cls, queryset, fields, keep=()):
+        """
+        setup_eager_loading(fields) に加えて .only() で読む列を絞る。keep は表現には出さないが
+        読んでおく列（ページングの並び順のキーなど）。モデルの列に対応しないフィールドがあるときは列は絞らない
+        """
+        queryset = cls.setup_eager_loading(queryset, fields)
+        only = cls._build_only_fields([field for name, field in cls._get_declared_fields().items() if name in fields])
+        if only is None:
+            return queryset
+        return queryset.only(*dict.fromkeys([*only, *keep]))
+
+    @classmethod
+    def get_eager_loading_plan(cls):
+        # フィールド定義はクラスごとに不変なので計画は一度だけ作る
+        plan = cls.__dict__.get('_eager_loading_plan')
+        if plan is None:
+            plan = cls._build_eager_loading_plan(cls._get_declared_fields().values())
+            cls._eager_loading_plan = plan
+        return plan
+
+    @classmethod
+    def _get_declared_fields(cls):
+        fields = cls.__dict__.get('_eager_loading_fields')
+        if fields is None:
+            fields = cls().fields
+            cls._eager_loading_fields = fields
+        return fields
+
+    @classmethod
+    def _build_only_fields(cls, fields):
+        only = []
+        for field in fields:
+            if field.write_only:
+                continue
+            if field.source == '*' or isinstance(field, (serializers.BaseSerializer, serializers.ManyRelatedField)):
+                return None
+            current = cls.Meta.model
+            for attr in field.source_attrs:
+                try:
+                    model_field = current._meta.get_field(attr)
+                except FieldDoesNotExist:
+                    return None
+                current = model_field.related_model
+            only.append('__'.join(field.source_attrs))
+        return only
+
+    @classmethod
+    def _build_eager_loading_plan(cls, fields):
+        model = cls.Meta.model
+        select_related, prefetch_related = set(), set()
+        for field in fields:
+            if field.source == '*':
+                continue
+            attrs = field.source_attrs
+            # 関連先そのものを PK で返すフィールドは *_id 列で足りるので JOIN しない
+            if not isinstance(field, (serializers.BaseSerializer, serializers.ManyRelatedField)):
+                attrs = attrs[:-1]
+            lookup, many, current = [], False, model
+            for attr in attrs:
+                try:
+                    model_field = current._meta.get_field(attr)
+                except FieldDoesNotExist:
+                    break
+                if not model_field.is_relation:
+                    break
+                lookup.append(attr)
+                many = many or model_field.many_to_many or model_field.one_to_many
+                current = model_field.related_model
+            if lookup:
+                (prefetch_related if many else select_related).add('__'.join(lookup))
+        return sorted(select_related), sorted(prefetch_related)
+
+
+def parse_fieldset(query_params, available):
+    """
+    ?fields=a,b（これだけ返す）と ?omit=c（これを除く）から返すフィールド名の集合を作る。
+    どちらも無ければ None。知らないフィールド名は 400 にする
+    """
+    fields, omit = query_params.get('fields'), query_params.get('omit')
+    if fields is None and omit is None:
+        return None
+    selected = set(available)
+    errors = {}
+    for param, names in (('fields', fields), ('omit', omit)):
+        if names is None:
+            continue
+        names = {name.strip() for name in names.split(',') if name.strip()}
+        unknown = sorted(names - set(available))
+        if unknown:
+            errors[param] = [f"不明なフィールドです: {', '.join(unknown)}"]
+        selected = selected & names if param == 'fields' else selected - names
+    if errors:
+        raise serializers.ValidationError(errors)
+    return selected
+
+
+class SparseFieldsetMixin:
+    """
+    GET のときだけ、リクエストの ?fields= / ?omit= で返すフィールドを絞る
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return fields
+        selected = parse_fieldset(request.query_params, [name for name, field in fields.items() if not field.write_only])
+        if selected is None:
+            return fields
+        return {name: field for name, field in fields.items() if name in selected or field.write_only}
+
+
+class ProjectStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ProjectStats
+        fields = ('total', 'not_started', 'in_progress', 'review', 'done')
+
+
+class ProjectSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    # 集計行（ProjectStats）は select_related で一緒に読むので追加のクエリは出ない
+    progress = ProjectStatsSerializer(source='stats', read_only=True, default=None)
 
-class ProjectSerializer(serializers.ModelSerializer):
     class Meta:
         model = Project
         fields = '__all__'
 
-class TaskSerializer(serializers.ModelSerializer):
-    creator = serializers.PrimaryKeyRelatedField(read_only=True)
-    assignee_name = serializers.SerializerMethodField()
-    project_name = serializers.SerializerMethodField()
+class ProjectMembershipSerializer(serializers.ModelSerializer):
+    username = serializers.CharField(source='user.username', read_only=True)
 
     class Meta:
-        model = Task
-        fields = '__all__'
-        extra_fields = ['project_name']
+        model = ProjectMembership
+        fields = ('user', 'username', 'role', 'created_at')
+        read_only_fields = ('created_at',)
 
-    def get_assignee_name(self, obj):
-        return obj.assignee.username if obj.assignee else None
+    def validate_user(self, value):
+        # 既存のメンバーの変更では役割だけを変えられる
+        if self.instance is not None and value.pk != self.instance.user_id:
+            raise serializers.ValidationError('メンバーは変更できません。役割だけを指定してください。')
+        return value
 
-    def get_creator(self, obj):
-        return obj.creator.username if obj.creator else None
+class TaskSerializer(SparseFieldsetMixin, EagerLoadingMixin, serializers.ModelSerializer):
+    creator = serializers.PrimaryKeyRelatedField(read_only=True)
+    assignee_name = serializers.CharField(source='assignee.username', read_only=True, allow_null=True)
+    project_name = serializers.CharField(source='project.name', read_only=True, allow_null=True)
 
-    def get_project_name(self, obj):
-        return obj.project.name if obj.project else None
+    class Meta:
+        model = Task
+        fields = '__all__'
+        # 版数は保存のたびにモデル側で進める
+        read_only_fields = ('version',)
 
-    def get_assignee(self, obj):
-        return obj.assignee.username if obj.assignee else None 
\ No newline at end of file
+    def validate_project(self, value):
+        # メンバーでない（閲覧者の）プロジェクトにはタスクを作れない・移せない
+        request = self.context.get('request')
+        if value is not None and request is not None and not can_use_project(request, value.pk):
+            raise serializers.ValidationError('このプロジェクトにタスクを追加する権限がありません。')
+        return value
@@ -0,0 +1,99 @@
+from django.db import router
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from common.cache import read_cache
+from .models import Project, ProjectMembership, ProjectStats, Task, TaskTombstone
+from .rollups import collect_deltas, record, task_deltas
+from .search import get_search_index, uses_postgres
+from .stats import invalidate_task_stats
+from .visibility import forget_member_project_ids
+
+
+def send_bulk_post_save(instances, created):
+    """
+    bulk_create / bulk_update はモデルシグナルを送らないため、
+    受信側（集計キャッシュなど）と整合させるよう1件ずつ post_save を送る
+    """
+    using = router.db_for_write(Task)
+    # プロジェクト集計の増減はまとめてプロジェクトごとに1回で反映する
+    with collect_deltas():
+        for instance in instances:
+            post_save.send(sender=Task, instance=instance, created=created, update_fields=None, raw=False, using=using)
+            instance.snapshot_loaded_values()
+
+
+@receiver(post_delete, sender=Task)
+def record_task_tombstone(sender, instance, **kwargs):
+    # 物理削除でも差分同期に削除を伝えられるよう痕跡を残す
+    TaskTombstone.objects.create(task_id=instance.pk, project_id=instance.project_id)
+
+
+@receiver(post_save, sender=Task)
+def record_project_move_tombstone(sender, instance, created, raw=False, **kwargs):
+    # 別プロジェクトへ移したタスクは、元のプロジェクトで絞った差分同期からは消えたことになる
+    if created or raw:
+        return
+    old_project_id = getattr(instance, '_loaded_values', {}).get('project_id', instance.project_id)
+    if old_project_id is not None and old_project_id != instance.project_id:
+        TaskTombstone.objects.create(task_id=instance.pk, project_id=old_project_id)
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def invalidate_stats_on_task_change(sender, **kwargs):
+    invalidate_task_stats()
+
+
+@receiver(post_save, sender=Task)
+def update_project_stats_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    new = (instance.project_id, instance.status)
+    if created:
+        record(task_deltas(None, new))
+        return
+    # 読み込み時の値と比べ、プロジェクト移動・ステータス変更の分だけ増減させる
+    loaded = getattr(instance, '_loaded_values', {})
+    old = (loaded.get('project_id', instance.project_id), loaded.get('status', instance.status))
+    record(task_deltas(old, new))
+
+
+@receiver(post_delete, sender=Task)
+def update_project_stats_on_delete(sender, instance, **kwargs):
+    record(task_deltas((instance.project_id, instance.status), None))
+
+
+@receiver(post_save, sender=Project)
+def create_project_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        ProjectStats.objects.get_or_create(project=instance)
+
+
+@receiver(post_save, sender=Task)
+def update_search_index(sender, instance, **kwargs):
+    # PostgreSQL ではトリガーが search_vector を更新するので、Python 実装の索引だけ追従させる
+    index = get_search_index()
+    if index.loaded and not uses_postgres():
+        index.update(instance.pk, instance.title, instance.description)
+
+
+@receiver(post_delete, sender=Task)
+def remove_from_search_index(sender, instance, **kwargs):
+    index = get_search_index()
+    if index.loaded and not uses_postgres():
+        index.remove(instance.pk)
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def invalidate_project_list_cache(sender, **kwargs):
+    read_cache('projects').invalidate_on_commit()
+
+
+@receiver(post_save, sender=ProjectMembership)
+@receiver(post_delete, sender=ProjectMembership)
+def invalidate_visibility_caches(sender, instance, **kwargs):
+    # 見えるプロジェクト・タスクが変わるので、利用者ごとの一覧と集計を作り直させる
+    read_cache('projects').invalidate_on_commit()
+    invalidate_task_stats()
+    forget_member_project_ids(instance.user_id)
@@ -0,0 +1,103 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import Task
+from .visibility import visible_tasks
+
+STATS_CACHE_KEY = 'tasks:stats'
+# 利用者ごとの集計をまとめて無効化するための世代番号
+STATS_GENERATION_KEY = 'tasks:stats:generation'
+STATS_CACHE_TIMEOUT = getattr(settings, 'TASK_STATS_CACHE_TIMEOUT', 30)
+STATUSES = [value for value, _ in Task._meta.get_field('status').choices]
+
+
+def _empty_bucket():
+    return {'total': 0, 'overdue': 0, 'by_status': dict.fromkeys(STATUSES, 0)}
+
+
+def _add(bucket, row):
+    bucket['total'] += row['count']
+    bucket['overdue'] += row['overdue']
+    bucket['by_status'][row['status']] = bucket['by_status'].get(row['status'], 0) + row['count']
+
+
+def _ordered(buckets, key):
+    # ID 順、未設定（None）は末尾
+    return sorted(buckets.values(), key=lambda item: (item[key] is None, item[key] or 0))
+
+
+def compute_task_stats(queryset=None):
+    """
+    (プロジェクト, ステータス, 担当者) ごとの件数を1回の GROUP BY で集計し、
+    全体・プロジェクト別・担当者別に畳み込む。完了済みのタスクは期限切れに数えない
+    """
+    today = timezone.localdate()
+    rows = (
+        (Task.objects.all() if queryset is None else queryset).order_by()
+        .values('project_id', 'project__name', 'assignee_id', 'assignee__username', 'status')
+        .annotate(
+            count=Count('id'),
+            overdue=Count('id', filter=Q(due_date__lt=today) & ~Q(status='done')),
+        )
+    )
+    summary = _empty_bucket()
+    projects, assignees = {}, {}
+    for row in rows:
+        _add(summary, row)
+        project = projects.setdefault(row['project_id'], {
+            'project': row['project_id'], 'project_name': row['project__name'], **_empty_bucket(),
+        })
+        _add(project, row)
+        assignee = assignees.setdefault(row['assignee_id'], {
+            'assignee': row['assignee_id'], 'assignee_name': row['assignee__username'], **_empty_bucket(),
+        })
+        _add(assignee, row)
+
+    return {
+        'date': today.isoformat(),
+        **summary,
+        'by_project': _ordered(projects, 'project'),
+        'by_assignee': _ordered(assignees, 'assignee'),
+    }
+
+
+def _stats_generation():
+    generation = cache.get(STATS_GENERATION_KEY)
+    if generation is None:
+        cache.add(STATS_GENERATION_KEY, 1, None)
+        generation = cache.get(STATS_GENERATION_KEY, 1)
+    return generation
+
+
+def get_task_stats(user=None):
+    """
+    user に見えるタスクだけの集計（管理者と user 省略時は全タスク）
+    """
+    scope = 'all' if user is None or user.is_staff else f'user:{user.pk}'
+    key = f'{STATS_CACHE_KEY}:{_stats_generation()}:{scope}'
+    stats = cache.get(key)
+    # 日付が変わると期限切れ件数が変わるので、前日の集計は使わない
+    if stats is None or stats['date'] != timezone.localdate().isoformat():
+        stats = compute_task_stats(None if scope == 'all' else visible_tasks(Task.objects.all(), user))
+        cache.set(key, stats, STATS_CACHE_TIMEOUT)
+    return stats
+
+
+def invalidate_task_stats():
+    """
+    変更直後とコミット後の両方で消す（common/cache.py の invalidate_on_commit と同じ）。
+    コミット前に別リクエストが古い集計を詰め直しても、コミット後の無効化で取り除かれる
+    """
+    _advance_stats_generation()
+    transaction.on_commit(_advance_stats_generation)
+
+
+def _advance_stats_generation():
+    # 世代を進めて、全員分の集計を一度に見えなくする
+    try:
+        cache.incr(STATS_GENERATION_KEY)
+    except ValueError:
+        cache.set(STATS_GENERATION_KEY, 2, None)
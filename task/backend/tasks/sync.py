@@ -0,0 +1,65 @@
+import base64
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import TaskTombstone
+
+# 同時に走っている書き込みのコミット遅延を取りこぼさないよう、
+# 前回のトークンより少し前から拾い直す（変更は upsert として扱ってもらう）
+SYNC_OVERLAP = timedelta(seconds=getattr(settings, 'TASK_SYNC_OVERLAP_SECONDS', 2))
+TOMBSTONE_RETENTION = timedelta(days=getattr(settings, 'TASK_TOMBSTONE_RETENTION_DAYS', 30))
+
+
+class InvalidSyncToken(ValueError):
+    pass
+
+
+def encode_token(moment):
+    return base64.urlsafe_b64encode(moment.isoformat().encode()).decode().rstrip('=')
+
+
+def decode_token(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        moment = datetime.fromisoformat(base64.urlsafe_b64decode(padded.encode()).decode())
+    except Exception:
+        raise InvalidSyncToken(token)
+    if timezone.is_naive(moment):
+        raise InvalidSyncToken(token)
+    return moment
+
+
+def collect_changes(tasks, since, project_id=None, tombstones=None):
+    """
+    since 以降に作成・更新されたタスクと削除されたタスクIDを返す。
+    since が None、または墓標の保持期間より古い場合は全件を返して reset を立てる。
+    tombstones を渡すとその範囲（利用者に見えるもの）の削除記録だけを見る。
+    墓標はプロジェクトから移したタスクにも元の project_id で残るので、まだ tasks に含まれるものは deleted から除く
+    """
+    now = timezone.now()
+    reset = since is None or since < now - TOMBSTONE_RETENTION
+    if reset:
+        return {'token': now, 'reset': True, 'changed': tasks, 'deleted': []}
+
+    threshold = since - SYNC_OVERLAP
+    if tombstones is None:
+        tombstones = TaskTombstone.objects.all()
+    tombstones = tombstones.filter(deleted_at__gte=threshold)
+    if project_id:
+        tombstones = tombstones.filter(project_id=project_id)
+    deleted = set(tombstones.values_list('task_id', flat=True))
+    if deleted:
+        deleted -= set(tasks.filter(pk__in=deleted).order_by().values_list('pk', flat=True))
+    return {
+        'token': now,
+        'reset': False,
+        'changed': tasks.filter(updated_at__gte=threshold),
+        'deleted': sorted(deleted),
+    }
+
+
+def prune_tombstones(retention=TOMBSTONE_RETENTION):
+    deleted, _ = TaskTombstone.objects.filter(deleted_at__lt=timezone.now() - retention).delete()
+    return deleted
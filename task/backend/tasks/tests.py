@@ -1,17 +1,45 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import tempfile
+from io import BytesIO, StringIO
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.urls import reverse
-from rest_framework.test import APITestCase
+from rest_framework.test import APIClient, APITestCase
 from rest_framework import status
 from django.contrib.auth import get_user_model
-from .models import Task
+from django.core.cache import cache
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from users.models import ActivityLog, Notification
+from users.activity import get_activity_writer
+from .importer import ImportFormatError, import_tasks
+from .models import Task, Project, ProjectMembership, ProjectStats, TaskTombstone, TaskVersionConflict
+from .rollups import verify_project_stats
+from .stats import STATS_CACHE_KEY, _stats_generation
 
 User = get_user_model()
 
+@override_settings(ACTIVITY_WRITER={'BACKGROUND': False})
 class TaskAPITests(APITestCase):
     def setUp(self):
+        # コミット後に積まれた活動履歴は、テストのトランザクションを戻す前に書き切る
+        self.addCleanup(get_activity_writer().flush)
         self.user = User.objects.create_user(username='taskuser', password='taskpass123')
         self.client.force_authenticate(user=self.user)
 
+    def _project(self, name, role=ProjectMembership.EDITOR):
+        # 一覧・詳細に出るよう、自分をメンバーにしたプロジェクトを作る
+        project = Project.objects.create(name=name)
+        ProjectMembership.objects.create(project=project, user=self.user, role=role)
+        return project
+
     def test_create_task(self):
         url = reverse('task-list-create')
         data = {
@@ -29,7 +57,7 @@ class TaskAPITests(APITestCase):
         url = reverse('task-list-create')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertGreaterEqual(len(response.data), 1)
+        self.assertGreaterEqual(len(response.data['results']), 1)
 
     def test_update_task(self):
         task = Task.objects.create(title='Task2', assignee=self.user, creator=self.user, status='not_started')
@@ -47,3 +75,771 @@ class TaskAPITests(APITestCase):
         response = self.client.delete(url)
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertFalse(Task.objects.filter(id=task.id).exists())
+
+    def _count_list_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('task-list-create'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries)
+
+    def _create_tasks(self, count):
+        for i in range(count):
+            assignee = User.objects.create_user(username=f'assignee{Task.objects.count()}', password='x')
+            project = self._project(f'Project{Task.objects.count()}')
+            Task.objects.create(title=f'Task{i}', assignee=assignee, project=project, creator=self.user)
+
+    def test_task_list_query_count_is_constant(self):
+        self._create_tasks(2)
+        small = self._count_list_queries()
+        self._create_tasks(10)
+        self.assertEqual(self._count_list_queries(), small)
+
+    def test_task_list_includes_related_names(self):
+        project = self._project('Alpha')
+        Task.objects.create(title='Named', assignee=self.user, project=project, creator=self.user)
+        Task.objects.create(title='Unassigned', creator=self.user)
+        response = self.client.get(reverse('task-list-create'))
+        by_title = {item['title']: item for item in response.data['results']}
+        self.assertEqual(by_title['Named']['assignee_name'], 'taskuser')
+        self.assertEqual(by_title['Named']['project_name'], 'Alpha')
+        self.assertIsNone(by_title['Unassigned']['assignee_name'])
+        self.assertIsNone(by_title['Unassigned']['project_name'])
+
+    def _walk_pages(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            ids.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_task_list_cursor_pagination_walks_ties_in_order(self):
+        tasks = [Task.objects.create(title=f'Paged{i}', creator=self.user) for i in range(7)]
+        # 同じ updated_at を持つ行が多数あっても id で一意に並ぶこと
+        Task.objects.update(updated_at=timezone.now())
+        ids = self._walk_pages(reverse('task-list-create') + '?page_size=3')
+        self.assertEqual(ids, sorted((t.id for t in tasks), reverse=True))
+
+    def test_fast_task_list_matches_serializer_bytes(self):
+        project = self._project('高速 "経路"')
+        Task.objects.create(
+            title='改行\u2028区切り\u2029 と 絵文字 🎉', description='"引用" \\ </script>',
+            assignee=self.user, project=project, creator=self.user,
+            due_date='2024-06-01', start_date='2024-05-01', status='review', external_id='F-1',
+        )
+        Task.objects.create(title='Unassigned', creator=self.user)
+        for i in range(3):
+            Task.objects.create(title=f'Paged{i}', creator=self.user)
+        url = reverse('task-list-create') + '?page_size=2'
+        while url:
+            normal = self.client.get(url, HTTP_ACCEPT='application/json')
+            fast = self.client.get(url + '&fast=1')
+            self.assertEqual(fast.status_code, status.HTTP_200_OK)
+            self.assertEqual(fast['Content-Type'], 'application/json')
+            self.assertEqual(fast.content.replace(b'&fast=1', b''), normal.content)
+            url = normal.data['next']
+
+    def test_fast_task_list_filters_and_revalidates(self):
+        project = self._project('Alpha')
+        Task.objects.create(title='In project', project=project, creator=self.user)
+        Task.objects.create(title='Elsewhere', creator=self.user)
+        url = reverse('task-list-create') + f'?project={project.id}&fast=1'
+        response = self.client.get(url)
+        self.assertEqual([item['title'] for item in response.json()['results']], ['In project'])
+        cached = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        fast_queries = len(ctx.captured_queries)
+        self.assertLessEqual(fast_queries, self._count_list_queries())
+
+    def test_task_list_sparse_fieldsets_trim_select(self):
+        project = self._project('Board')
+        Task.objects.create(title='Card', description='long text' * 100, assignee=self.user, project=project, creator=self.user)
+        url = reverse('task-list-create') + '?fields=id,title,status,assignee_name'
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(response.data['results'][0]), ['id', 'assignee_name', 'title', 'status'])
+        self.assertEqual(response.data['results'][0]['assignee_name'], 'taskuser')
+        page_sql = ctx.captured_queries[-1]['sql']
+        self.assertNotIn('description', page_sql)
+        self.assertNotIn('JOIN "tasks_project"', page_sql)
+        # 高速経路でも同じフィールドだけを返す
+        fast = self.client.get(url + '&fast=1', HTTP_ACCEPT='application/json')
+        self.assertEqual(fast.json()['results'], json.loads(response.content)['results'])
+
+        omitted = self.client.get(reverse('task-list-create') + '?omit=description,created_at')
+        self.assertNotIn('description', omitted.data['results'][0])
+        self.assertIn('project_name', omitted.data['results'][0])
+
+        invalid = self.client.get(reverse('task-list-create') + '?fields=id,secret')
+        self.assertEqual(invalid.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('fields', invalid.data)
+
+    def test_task_detail_sparse_fieldsets(self):
+        task = Task.objects.create(title='Detail', creator=self.user)
+        response = self.client.get(reverse('task-detail', args=[task.id]) + '?fields=id,title')
+        self.assertEqual(response.data, {'id': task.id, 'title': 'Detail'})
+        # 更新の応答は全フィールドのまま
+        updated = self.client.patch(reverse('task-detail', args=[task.id]) + '?fields=id', {'title': 'Renamed'}, format='json')
+        self.assertEqual(updated.data['title'], 'Renamed')
+
+    def test_task_list_compact_format(self):
+        for i in range(3):
+            Task.objects.create(title=f'Compact{i}', creator=self.user)
+        url = reverse('task-list-create') + '?fields=id,title&format=compact&page_size=2'
+        for extra in ('', '&fast=1'):
+            response = self.client.get(url + extra)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response['Content-Type'], 'application/vnd.compact+json')
+            body = response.json()
+            self.assertEqual(body['columns'], ['id', 'title'])
+            self.assertEqual([row[1] for row in body['rows']], ['Compact2', 'Compact1'])
+            self.assertIn('format=compact', body['next'])
+        empty = self.client.get(reverse('task-list-create') + '?project=999999&fields=id,title&format=compact').json()
+        self.assertEqual(empty, {'next': None, 'columns': ['id', 'title'], 'rows': []})
+        # 形式が違えば ETag も別
+        url = reverse('task-list-create') + '?fields=id,title'
+        compact = self.client.get(url, HTTP_ACCEPT='application/vnd.compact+json')
+        self.assertNotEqual(self.client.get(url)['ETag'], compact['ETag'])
+
+    def test_task_list_pagination_keeps_project_filter(self):
+        project = self._project('Filtered')
+        for i in range(5):
+            Task.objects.create(title=f'In{i}', creator=self.user, project=project)
+        Task.objects.create(title='Out', creator=self.user)
+        url = reverse('task-list-create') + f'?project={project.id}&page_size=2'
+        first = self.client.get(url)
+        self.assertIn(f'project={project.id}', first.data['next'])
+        ids = self._walk_pages(url)
+        self.assertEqual(len(ids), 5)
+        self.assertFalse(Task.objects.filter(id__in=ids, project__isnull=True).exists())
+
+    def test_task_list_rejects_invalid_cursor(self):
+        response = self.client.get(reverse('task-list-create') + '?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_task_changes_reports_updates_and_deletions_since_token(self):
+        kept = Task.objects.create(title='Kept', creator=self.user)
+        removed = Task.objects.create(title='Removed', creator=self.user)
+        url = reverse('task-changes')
+        initial = self.client.get(url)
+        self.assertTrue(initial.data['reset'])
+        self.assertEqual(len(initial.data['changed']), 2)
+
+        Task.objects.filter(id=kept.id).update(updated_at=timezone.now() - timezone.timedelta(days=1))
+        changed = Task.objects.create(title='Changed', creator=self.user)
+        self.client.delete(reverse('task-detail', args=[removed.id]))
+
+        response = self.client.get(url, {'since': initial.data['token']})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.data['reset'])
+        self.assertEqual([t['id'] for t in response.data['changed']], [changed.id])
+        self.assertEqual(response.data['deleted'], [removed.id])
+
+    def test_task_changes_for_a_project_report_tasks_moved_out_of_it(self):
+        source = self._project('Source')
+        target = self._project('Target')
+        task = Task.objects.create(title='Moving', creator=self.user, project=source)
+        url = reverse('task-changes')
+        source_token = self.client.get(url, {'project': source.id}).data['token']
+        all_token = self.client.get(url).data['token']
+
+        response = self.client.patch(reverse('task-detail', args=[task.id]), {'project': target.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        source_changes = self.client.get(url, {'project': source.id, 'since': source_token}).data
+        self.assertEqual((source_changes['changed'], source_changes['deleted']), ([], [task.id]))
+        # プロジェクトで絞らなければ、まだ見えるタスクなので更新として届く
+        all_changes = self.client.get(url, {'since': all_token}).data
+        self.assertEqual(([t['id'] for t in all_changes['changed']], all_changes['deleted']), ([task.id], []))
+
+    def test_task_changes_rejects_invalid_token(self):
+        response = self.client.get(reverse('task-changes'), {'since': 'garbage'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_task_list_answers_if_none_match_with_304(self):
+        task = Task.objects.create(title='Cached', creator=self.user)
+        url = reverse('task-list-create')
+        first = self.client.get(url)
+        etag = first['ETag']
+        with CaptureQueriesContext(connection) as ctx:
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+        # 集計と、削除記録・見えるプロジェクト・ユーザーの最新時刻（どれもインデックスで引く1行）だけ
+        self.assertEqual(len(ctx.captured_queries), 4)
+
+        self.client.patch(reverse('task-detail', args=[task.id]), {'status': 'done'}, format='json')
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(changed['ETag'], etag)
+
+        deleted_etag = changed['ETag']
+        other = Task.objects.create(title='Other', creator=self.user)
+        self.client.delete(reverse('task-detail', args=[other.id]))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=deleted_etag).status_code, status.HTTP_200_OK)
+
+    def test_task_detail_answers_if_none_match_with_304(self):
+        task = Task.objects.create(title='Detail', creator=self.user)
+        url = reverse('task-detail', args=[task.id])
+        first = self.client.get(url)
+        self.assertIn('Last-Modified', first)
+        cached = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_task_etags_change_when_embedded_project_or_user_names_change(self):
+        project = self._project('Before')
+        assignee = User.objects.create_user(username='before', password='beforepass123')
+        task = Task.objects.create(title='Named', creator=self.user, assignee=assignee, project=project)
+        urls = [reverse('task-list-create'), reverse('task-detail', args=[task.id])]
+        for rename in (lambda: setattr(project, 'name', 'After') or project.save(),
+                       lambda: setattr(assignee, 'username', 'after') or assignee.save()):
+            etags = [self.client.get(url)['ETag'] for url in urls]
+            rename()
+            for url, etag in zip(urls, etags):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, status.HTTP_200_OK, url)
+        self.assertEqual((response.data['project_name'], response.data['assignee_name']), ('After', 'after'))
+
+    def test_task_stats_groups_counts_and_is_invalidated_on_change(self):
+        cache.clear()
+        project = self._project('Stats')
+        yesterday = timezone.localdate() - timezone.timedelta(days=1)
+        Task.objects.create(title='S1', creator=self.user, assignee=self.user, project=project, due_date=yesterday)
+        Task.objects.create(title='S2', creator=self.user, project=project, status='done', due_date=yesterday)
+        Task.objects.create(title='S3', creator=self.user, status='in_progress')
+        url = reverse('task-stats')
+
+        with CaptureQueriesContext(connection) as ctx:
+            stats = self.client.get(url).data
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(stats['total'], 3)
+        self.assertEqual(stats['overdue'], 1)
+        self.assertEqual(stats['by_status'], {'not_started': 1, 'in_progress': 1, 'review': 0, 'done': 1})
+        by_project = {item['project']: item for item in stats['by_project']}
+        self.assertEqual(by_project[project.id]['total'], 2)
+        self.assertEqual(by_project[project.id]['project_name'], 'Stats')
+        by_assignee = {item['assignee']: item for item in stats['by_assignee']}
+        self.assertEqual(by_assignee[self.user.id]['overdue'], 1)
+        self.assertEqual(by_assignee[None]['total'], 2)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        Task.objects.create(title='S4', creator=self.user, status='review')
+        self.assertEqual(self.client.get(url).data['by_status']['review'], 1)
+
+    def test_task_stats_are_invalidated_again_after_commit(self):
+        url = reverse('task-stats')
+        with self.captureOnCommitCallbacks(execute=True):
+            Task.objects.create(title='Pending', creator=self.user)
+            # コミット前に別リクエストが古い集計を詰め直した状態を作る
+            stale = {'date': timezone.localdate().isoformat(), 'total': 0}
+            cache.set(f'{STATS_CACHE_KEY}:{_stats_generation()}:user:{self.user.pk}', stale)
+        self.assertEqual(self.client.get(url).data['total'], 1)
+
+    def test_task_list_timeline_window_returns_overlapping_tasks_as_columns(self):
+        base = timezone.localdate()
+        days = lambda n: base + timezone.timedelta(days=n)
+        inside = Task.objects.create(title='Inside', creator=self.user, assignee=self.user,
+                                     start_date=days(2), end_date=days(4))
+        overlapping = Task.objects.create(title='Overlap', creator=self.user, start_date=days(-5), end_date=days(0))
+        Task.objects.create(title='Before', creator=self.user, start_date=days(-9), end_date=days(-1))
+        Task.objects.create(title='Undated', creator=self.user)
+        response = self.client.get(reverse('task-list-create'), {'from': days(0).isoformat(), 'to': days(7).isoformat()})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['origin'], days(0).isoformat())
+        self.assertEqual(response.data['ids'], [overlapping.id, inside.id])
+        self.assertEqual(response.data['starts'], [-5, 2])
+        self.assertEqual(response.data['ends'], [0, 4])
+        self.assertEqual(response.data['assignees'], [None, self.user.id])
+
+    def test_task_list_timeline_rejects_invalid_window(self):
+        url = reverse('task-list-create')
+        self.assertEqual(self.client.get(url, {'from': '2025-02-01'}).status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(url, {'from': '2025-02-01', 'to': '2025-01-01'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_task_bulk_applies_create_update_delete_in_one_request(self):
+        moved = Task.objects.create(title='Move', creator=self.user)
+        removed = Task.objects.create(title='Remove', creator=self.user)
+        payload = {'operations': [
+            {'op': 'create', 'data': {'title': 'Bulk new', 'assignee': self.user.id}},
+            {'op': 'update', 'id': moved.id, 'data': {'status': 'review'}},
+            {'op': 'delete', 'id': removed.id},
+        ]}
+        response = self.client.post(reverse('task-bulk'), payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results']
+        self.assertEqual([r['status'] for r in results], [201, 200, 204])
+        self.assertEqual(results[0]['data']['assignee_name'], 'taskuser')
+        self.assertEqual(Task.objects.get(id=results[0]['id']).creator, self.user)
+        moved.refresh_from_db()
+        self.assertEqual(moved.status, 'review')
+        self.assertFalse(Task.objects.filter(id=removed.id).exists())
+        self.assertTrue(TaskTombstone.objects.filter(task_id=removed.id).exists())
+
+    def test_task_bulk_rejects_whole_batch_on_any_error(self):
+        other = User.objects.create_user(username='other', password='otherpass123')
+        # 閲覧者として見えてはいるが、変更はできないタスク
+        foreign = Task.objects.create(title='Foreign', creator=other, project=self._project('Read only', ProjectMembership.VIEWER))
+        payload = [
+            {'op': 'create', 'data': {'title': 'Should not exist'}},
+            {'op': 'update', 'id': foreign.id, 'data': {'status': 'done'}},
+            {'op': 'delete', 'id': 999999},
+            {'op': 'create', 'data': {'status': 'not_started'}},
+        ]
+        response = self.client.post(reverse('task-bulk'), payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([r.get('status') for r in response.data['results']], [None, 403, 404, 400])
+        self.assertIn('title', response.data['results'][3]['errors'])
+        self.assertFalse(Task.objects.filter(title='Should not exist').exists())
+        foreign.refresh_from_db()
+        self.assertEqual(foreign.status, 'not_started')
+
+    def test_task_search_ranks_title_matches_first_and_follows_changes(self):
+        in_description = Task.objects.create(title='週次作業', description='デザインレビューの準備', creator=self.user)
+        in_title = Task.objects.create(title='デザインレビュー', creator=self.user)
+        Task.objects.create(title='請求書の送付', creator=self.user)
+        response = self.client.get(reverse('task-search'), {'q': 'デザインレビュー'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([t['id'] for t in response.data['results']], [in_title.id, in_description.id])
+
+        # 全角英数字は NFKC で正規化して一致させる
+        renamed = Task.objects.create(title='ＡＰＩ設計', creator=self.user)
+        self.assertEqual([t['id'] for t in self.client.get(reverse('task-search'), {'q': 'api'}).data['results']], [renamed.id])
+        renamed.delete()
+        self.assertEqual(self.client.get(reverse('task-search'), {'q': 'api'}).data['results'], [])
+
+    def test_task_search_is_paginated_and_requires_query(self):
+        tasks = [Task.objects.create(title=f'会議メモ{i}', creator=self.user) for i in range(3)]
+        response = self.client.get(reverse('task-search'), {'q': '会議', 'page_size': 2})
+        first = [t['id'] for t in response.data['results']]
+        response = self.client.get(response.data['next'])
+        self.assertIsNone(response.data['next'])
+        self.assertCountEqual(first + [t['id'] for t in response.data['results']], [t.id for t in tasks])
+        self.assertEqual(self.client.get(reverse('task-search'), {'q': ' '}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_task_export_streams_csv_and_ndjson_with_joined_names(self):
+        project = self._project('輸出')
+        first = Task.objects.create(title='a,"b"', assignee=self.user, creator=self.user, project=project)
+        Task.objects.create(title='other', creator=self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('task-export'), {'project': project.id})
+            body = b''.join(response.streaming_content).decode('utf-8-sig')
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('filename="tasks.csv"', response['Content-Disposition'])
+        rows = list(csv.DictReader(body.splitlines()))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual((rows[0]['id'], rows[0]['title']), (str(first.id), 'a,"b"'))
+        self.assertEqual((rows[0]['assignee_name'], rows[0]['project_name'], rows[0]['due_date']), ('taskuser', '輸出', ''))
+
+        response = self.client.get(reverse('task-export'), {'format': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['title'] for row in rows], ['a,"b"', 'other'])
+        self.assertIsNone(rows[1]['project_name'])
+        self.assertEqual(self.client.get(reverse('task-export'), {'format': 'xml'}).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(reverse('task-export'), {'project': 'x'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_import_reports_row_errors_and_skips_already_imported_rows(self):
+        project = self._project('移行先')
+        User.objects.create_user(username='hanako', password='hanakopass123')
+        content = (
+            'external_id,title,status,assignee,project,due_date\n'
+            'J-1,設計,in_progress,hanako,移行先,2024-06-01\n'
+            'J-2,実装,not_started,,,\n'
+            'J-3,レビュー,unknown,nobody,移行先,\n'
+            'J-1,重複,done,,,\n'
+            ',IDなし,done,,,\n'
+        ).encode()
+        upload = SimpleUploadedFile('jira.csv', content, content_type='text/csv')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('task-import'), {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # 名前の解決・取り込み済み ID の確認はバッチにつき1クエリずつ（行数に比例しない）
+        self.assertLess(len(ctx.captured_queries), 15)
+        self.assertEqual(
+            {key: response.data[key] for key in ('rows', 'created', 'skipped', 'failed', 'complete')},
+            {'rows': 5, 'created': 2, 'skipped': 0, 'failed': 3, 'complete': True},
+        )
+        errors = {error['row']: error['errors'] for error in response.data['errors']}
+        self.assertEqual(set(errors), {3, 4, 5})
+        self.assertEqual(set(errors[3]), {'assignee'})
+        self.assertIn('external_id', errors[4])
+        self.assertIn('external_id', errors[5])
+        task = Task.objects.get(external_id='J-1')
+        self.assertEqual((task.assignee.username, task.project_id, task.creator_id), ('hanako', project.id, self.user.id))
+
+        # 直して同じファイルを再送すると、取り込み済みの行は飛ばす
+        fixed = content.replace(b'unknown,nobody', b'review,hanako')
+        response = self.client.post(reverse('task-import'), {'file': SimpleUploadedFile('jira.csv', fixed)}, format='multipart')
+        self.assertEqual((response.data['created'], response.data['skipped'], response.data['failed']), (1, 3, 1))
+        self.assertEqual(Task.objects.filter(external_id__startswith='J-').count(), 3)
+
+    def test_import_resumes_from_next_offset_until_complete(self):
+        max_rows = 2
+        # 2 * max_rows + 1 行。2行目は毎回失敗するが、再送のたびに先頭から数え直さず先へ進む
+        lines = [json.dumps({'external_id': f'R-{i}', 'title': f'再開{i}' if i != 2 else ''}) for i in range(1, 2 * max_rows + 2)]
+        content = '\n'.join(lines).encode()
+        reports, offset = [], 0
+        for _ in range(3):
+            report = import_tasks(BytesIO(content), 'ndjson', self.user, offset=offset, max_rows=max_rows)
+            reports.append(report)
+            offset = report['next_offset']
+        self.assertEqual([(r['rows'], r['complete'], r['next_offset']) for r in reports], [(2, False, 2), (2, False, 4), (1, True, None)])
+        self.assertEqual([error['row'] for error in reports[0]['errors']], [2])
+        self.assertEqual(Task.objects.filter(external_id__startswith='R-').count(), 4)
+
+        # API では offset で渡す。行番号はファイル全体での番号
+        upload = SimpleUploadedFile('resume.ndjson', content.replace(b'"R-', b'"S-'))
+        response = self.client.post(reverse('task-import'), {'file': upload, 'offset': 1}, format='multipart')
+        self.assertEqual((response.data['rows'], response.data['created'], response.data['complete']), (4, 3, True))
+        self.assertEqual([error['row'] for error in response.data['errors']], [2])
+        response = self.client.post(reverse('task-import'), {'file': SimpleUploadedFile('resume.ndjson', content), 'offset': 'x'}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_import_rejects_undecodable_and_malformed_files(self):
+        shift_jis = 'external_id,title\nK-1,設計\n'.encode('shift_jis')
+        with self.assertRaisesMessage(ImportFormatError, 'UTF-8'):
+            import_tasks(BytesIO(shift_jis), 'csv', self.user)
+        response = self.client.post(reverse('task-import'), {'file': SimpleUploadedFile('excel.csv', shift_jis)}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('file', response.data)
+
+        too_large = ('external_id,title\nK-2,' + 'x' * (csv.field_size_limit() + 1) + '\n').encode()
+        with self.assertRaisesMessage(ImportFormatError, 'CSV'):
+            import_tasks(BytesIO(too_large), 'csv', self.user)
+
+    def test_import_reports_list_or_object_names_as_row_errors(self):
+        rows = [
+            {'external_id': 'L-1', 'title': '配列', 'assignee': ['taskuser']},
+            {'external_id': 'L-2', 'title': 'オブジェクト', 'project': {'name': 'x'}},
+            {'external_id': 'L-3', 'title': '正常', 'assignee': 'taskuser'},
+        ]
+        report = import_tasks(BytesIO(json.dumps(rows).encode()), 'json', self.user)
+        self.assertEqual((report['created'], report['failed']), (1, 2))
+        self.assertEqual([(error['row'], set(error['errors'])) for error in report['errors']], [(1, {'assignee'}), (2, {'project'})])
+
+    def test_import_command_reads_ndjson_in_batches(self):
+        lines = [json.dumps({'external_id': f'N-{i}', 'title': f'NDJSON{i}'}) for i in range(5)] + ['{broken']
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False, encoding='utf-8') as fp:
+            fp.write('\n'.join(lines))
+        try:
+            call_command('import_tasks', fp.name, creator='taskuser', batch_size=2, dry_run=True, stdout=StringIO())
+            self.assertFalse(Task.objects.filter(external_id__startswith='N-').exists())
+            stdout = StringIO()
+            call_command('import_tasks', fp.name, creator='taskuser', batch_size=2, stdout=stdout)
+        finally:
+            os.unlink(fp.name)
+        self.assertEqual(Task.objects.filter(external_id__startswith='N-').count(), 5)
+        self.assertIn('6行目', stdout.getvalue())
+
+    def test_project_list_is_served_from_cache_until_a_project_changes(self):
+        project = self._project('Cached')
+        self.client.get(reverse('project-list-create'))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('project-list-create'))
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual([p['name'] for p in response.data['results']], ['Cached'])
+        # キャッシュから返しても条件付きGETは効く
+        cached = self.client.get(reverse('project-list-create'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        project.name = 'Renamed'
+        project.save()
+        response = self.client.get(reverse('project-list-create'))
+        self.assertEqual([p['name'] for p in response.data['results']], ['Renamed'])
+
+
+class CreateDummyDataCommandTests(TestCase):
+    def run_command(self, **options):
+        call_command('create_dummy_data', stdout=StringIO(), **options)
+
+    def test_same_seed_creates_same_data(self):
+        options = dict(users=3, projects=2, tasks=25, activity_logs=10, notifications=12, seed=7, batch_size=4)
+        self.run_command(**options)
+        first = list(Task.objects.order_by('title').values_list('title', 'status', 'due_date'))
+        self.run_command(**options)
+        # 既存のダミータスクは作り直し、ユーザー・プロジェクトは増えない
+        self.assertEqual(list(Task.objects.order_by('title').values_list('title', 'status', 'due_date')), first)
+        self.assertEqual(User.objects.filter(username__startswith='user').count(), 3)
+        self.assertEqual(Project.objects.count(), 2)
+        self.assertEqual(ActivityLog.objects.count(), 20)
+        # 未読数のカウンタは作った通知と一致する
+        for user in User.objects.all():
+            unread = Notification.objects.filter(user=user, is_read=False).count()
+            self.assertEqual(user.unread_notification_count, unread)
+        self.assertTrue(User.objects.get(username='user1').check_password('testpass123'))
+        self.assertEqual(set(Task.objects.values_list('version', flat=True)), {1})
+        # 作成日時は bulk_create でも生成した値のまま（過去に分散している）
+        week_ago = timezone.now() - timezone.timedelta(days=7)
+        self.assertTrue(ActivityLog.objects.filter(created_at__lt=week_ago).exists())
+        self.assertTrue(Task.objects.filter(updated_at__lt=week_ago).exists())
+        self.assertTrue(Notification.objects.filter(created_at__lt=week_ago).exists())
+        task = Task.objects.first()
+        task.save()
+        self.assertGreater(task.updated_at, week_ago)
+        # 作成者は自分のタスクのプロジェクトのメンバーになっている
+        for task in Task.objects.exclude(project=None):
+            self.assertTrue(ProjectMembership.objects.filter(project_id=task.project_id, user_id=task.creator_id).exists())
+
+    def test_tasks_require_users(self):
+        with self.assertRaises(CommandError):
+            self.run_command(users=0, tasks=1)
+
+
+class ProjectStatsTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='rollup', password='rolluppass123')
+        self.client.force_authenticate(user=self.user)
+        self.first = Project.objects.create(name='A')
+        self.second = Project.objects.create(name='B')
+        for project in (self.first, self.second):
+            ProjectMembership.objects.create(project=project, user=self.user)
+
+    def counts(self, project):
+        return ProjectStats.objects.values('total', 'not_started', 'in_progress', 'review', 'done').get(project=project)
+
+    def test_counts_follow_create_status_change_move_and_delete(self):
+        task = Task.objects.create(title='t', creator=self.user, project=self.first)
+        self.assertEqual(self.counts(self.first), {'total': 1, 'not_started': 1, 'in_progress': 0, 'review': 0, 'done': 0})
+        self.client.patch(reverse('task-detail', args=[task.id]), {'status': 'done'}, format='json')
+        self.assertEqual((self.counts(self.first)['not_started'], self.counts(self.first)['done']), (0, 1))
+        self.client.patch(reverse('task-detail', args=[task.id]), {'project': self.second.id}, format='json')
+        self.assertEqual((self.counts(self.first)['total'], self.counts(self.second)['done']), (0, 1))
+
+        self.client.post(reverse('task-bulk'), {'operations': [
+            {'op': 'create', 'data': {'title': 'b1', 'project': self.first.id}},
+            {'op': 'create', 'data': {'title': 'b2', 'project': self.first.id, 'status': 'review'}},
+            {'op': 'delete', 'id': task.id},
+        ]}, format='json')
+        self.assertEqual(self.counts(self.first), {'total': 2, 'not_started': 1, 'in_progress': 0, 'review': 1, 'done': 0})
+        self.assertEqual(self.counts(self.second)['total'], 0)
+        self.assertEqual(verify_project_stats(), [])
+
+    def test_project_list_carries_progress_and_etag_changes_with_it(self):
+        Task.objects.create(title='t', creator=self.user, project=self.first, status='done')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('project-list-create'))
+        # 件数の集計はせず、一覧と同じクエリで読む（版の集計1回 + 一覧1回）
+        self.assertEqual(len(ctx.captured_queries), 2)
+        progress = {project['name']: project['progress'] for project in response.data['results']}
+        self.assertEqual((progress['A']['total'], progress['A']['done'], progress['B']['total']), (1, 1, 0))
+
+        Task.objects.create(title='u', creator=self.user, project=self.first)
+        refreshed = self.client.get(reverse('project-list-create'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(refreshed.status_code, status.HTTP_200_OK)
+        self.assertEqual({p['name']: p['progress']['total'] for p in refreshed.data['results']}['A'], 2)
+
+    def test_command_reports_and_repairs_drift(self):
+        Task.objects.create(title='t', creator=self.user, project=self.first)
+        ProjectStats.objects.filter(project=self.first).update(total=5)
+        with self.assertRaises(CommandError):
+            call_command('project_stats', 'verify', stdout=StringIO())
+        call_command('project_stats', 'rebuild', stdout=StringIO())
+        self.assertEqual(verify_project_stats(), [])
+        self.assertEqual(self.counts(self.first)['total'], 1)
+
+
+@override_settings(ACTIVITY_WRITER={'BACKGROUND': False})
+class ProjectVisibilityTests(APITestCase):
+    def setUp(self):
+        # コミット後に積まれた活動履歴は、テストのトランザクションを戻す前に書き切る
+        self.addCleanup(get_activity_writer().flush)
+        self.owner = User.objects.create_user(username='owner', password='ownerpass123')
+        self.viewer = User.objects.create_user(username='viewer', password='viewerpass123')
+        self.outsider = User.objects.create_user(username='outsider', password='outsiderpass123')
+        self.project = Project.objects.create(name='Team')
+        ProjectMembership.objects.create(project=self.project, user=self.owner, role=ProjectMembership.OWNER)
+        ProjectMembership.objects.create(project=self.project, user=self.viewer, role=ProjectMembership.VIEWER)
+        self.task = Task.objects.create(title='Team task', creator=self.owner, project=self.project)
+        self.personal = Task.objects.create(title='Outsider task', creator=self.outsider)
+
+    def titles(self, user, url, key='results'):
+        self.client.force_authenticate(user=user)
+        return sorted(item['title'] for item in self.client.get(url).data[key])
+
+    def project_names(self, user):
+        self.client.force_authenticate(user=user)
+        return [project['name'] for project in self.client.get(reverse('project-list-create')).data['results']]
+
+    def test_listings_show_only_member_projects_and_own_tasks(self):
+        self.assertEqual(self.titles(self.viewer, reverse('task-list-create')), ['Team task'])
+        self.assertEqual(self.titles(self.outsider, reverse('task-list-create')), ['Outsider task'])
+        self.assertEqual(self.titles(self.outsider, reverse('task-search') + '?q=task'), ['Outsider task'])
+        self.assertEqual(self.titles(self.outsider, reverse('task-changes'), key='changed'), ['Outsider task'])
+        self.assertEqual(self.client.get(reverse('task-stats')).data['total'], 1)
+        self.assertEqual(self.project_names(self.outsider), [])
+        self.assertEqual(self.project_names(self.viewer), ['Team'])
+
+        admin = User.objects.create_user(username='admin', password='adminpass123', is_staff=True)
+        self.assertEqual(self.titles(admin, reverse('task-list-create')), ['Outsider task', 'Team task'])
+
+    def test_detail_checks_visibility_and_role_in_one_query(self):
+        url = reverse('task-detail', args=[self.task.id])
+        self.client.force_authenticate(user=self.outsider)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+        self.client.force_authenticate(user=self.viewer)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.patch(url, {'status': 'done'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+        ProjectMembership.objects.filter(user=self.viewer).update(role=ProjectMembership.EDITOR)
+        self.assertEqual(self.client.patch(url, {'status': 'done'}, format='json').status_code, status.HTTP_200_OK)
+
+    def test_tasks_can_only_be_put_into_editable_projects(self):
+        self.client.force_authenticate(user=self.viewer)
+        response = self.client.post(reverse('task-list-create'), {'title': 'New', 'project': self.project.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('project', response.data)
+        self.client.force_authenticate(user=self.owner)
+        response = self.client.post(reverse('task-list-create'), {'title': 'New', 'project': self.project.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_owner_manages_members_and_lists_follow(self):
+        members_url = reverse('project-member-list', args=[self.project.id])
+        self.assertEqual(self.project_names(self.outsider), [])
+        self.assertEqual(self.client.get(members_url).status_code, status.HTTP_404_NOT_FOUND)
+
+        self.client.force_authenticate(user=self.viewer)
+        self.assertEqual(self.client.post(members_url, {'user': self.outsider.id}, format='json').status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=self.owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(members_url, {'user': self.outsider.id, 'role': 'editor'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['username'], 'outsider')
+        owner_url = reverse('project-member-detail', args=[self.project.id, self.owner.id])
+        self.assertEqual(self.client.delete(owner_url).status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.assertEqual(self.project_names(self.outsider), ['Team'])
+        self.assertEqual(self.titles(self.outsider, reverse('task-list-create')), ['Outsider task', 'Team task'])
+
+    def test_created_project_is_owned_by_its_creator(self):
+        self.client.force_authenticate(user=self.outsider)
+        response = self.client.post(reverse('project-list-create'), {'name': 'Mine'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        membership = ProjectMembership.objects.get(project_id=response.data['id'])
+        self.assertEqual((membership.user_id, membership.role), (self.outsider.id, ProjectMembership.OWNER))
+
+
+class TaskVersionTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='versions', password='versionspass123')
+        self.client.force_authenticate(user=self.user)
+        self.task = Task.objects.create(title='Card', creator=self.user)
+        self.url = reverse('task-detail', args=[self.task.id])
+
+    def test_if_match_update_advances_version_and_rejects_stale_tags(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertTrue(etag.startswith('"1-'))
+        response = self.client.put(self.url, {'title': 'Moved', 'status': 'done'}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['version'], 2)
+        self.assertEqual(response['ETag'], self.client.get(self.url)['ETag'])
+        self.assertTrue(response['ETag'].startswith('"2-'))
+
+        # 古い版・弱い ETag では書き換えない
+        for stale in (etag, 'W/"2"'):
+            response = self.client.patch(self.url, {'title': 'Overwritten'}, format='json', HTTP_IF_MATCH=stale)
+            self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.task.refresh_from_db()
+        self.assertEqual((self.task.title, self.task.version), ('Moved', 2))
+
+        # 一覧の version から組み立てた "<version>" も受け付ける
+        response = self.client.patch(self.url, {'title': 'From list'}, format='json', HTTP_IF_MATCH='"2"')
+        self.assertEqual(response.data['version'], 3)
+        # version は送っても無視される
+        response = self.client.patch(self.url, {'version': 10}, format='json', HTTP_IF_MATCH='*')
+        self.assertEqual(response.data['version'], 4)
+
+    def test_saving_a_stale_instance_raises_instead_of_overwriting(self):
+        first = Task.objects.get(pk=self.task.pk)
+        second = Task.objects.get(pk=self.task.pk)
+        first.title = 'First'
+        first.save()
+        second.title = 'Second'
+        with self.assertRaises(TaskVersionConflict):
+            second.save(update_fields=['title'])
+        self.assertEqual(second.version, 1)
+        self.task.refresh_from_db()
+        self.assertEqual((self.task.title, self.task.version), ('First', 2))
+
+    def test_delete_checks_if_match(self):
+        response = self.client.delete(self.url, HTTP_IF_MATCH='"7"')
+        self.assertEqual(response.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        self.assertTrue(Task.objects.filter(pk=self.task.pk).exists())
+        response = self.client.delete(self.url, HTTP_IF_MATCH='"1"')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_bulk_update_advances_versions_and_checks_given_version(self):
+        payload = [{'op': 'update', 'id': self.task.id, 'version': 1, 'data': {'status': 'review'}}]
+        response = self.client.post(reverse('task-bulk'), payload, format='json')
+        self.assertEqual(response.data['results'][0]['data']['version'], 2)
+        response = self.client.post(reverse('task-bulk'), payload, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['results'][0]['status'], status.HTTP_412_PRECONDITION_FAILED)
+        self.task.refresh_from_db()
+        self.assertEqual((self.task.status, self.task.version), ('review', 2))
+
+
+class ProjectOwnerBackfillMigrationTests(TransactionTestCase):
+    migrate_from = [('tasks', '0012_task_version_db_default')]
+    migrate_to = [('tasks', '0013_backfill_project_owners')]
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_from)
+        apps = executor.loader.project_state(self.migrate_from).apps
+        Project, Task, Membership = (apps.get_model('tasks', name) for name in ('Project', 'Task', 'ProjectMembership'))
+        # users アプリは移行済みのままなので、ユーザーは今のモデルで作る
+        User.objects.create_superuser(username='admin', password='adminpass123')
+        first = User.objects.create_user(username='first', password='firstpass123')
+        second = User.objects.create_user(username='second', password='secondpass123')
+        self.tasks = Project.objects.create(name='With tasks')
+        Task.objects.create(title='Earliest', creator_id=first.pk, project=self.tasks)
+        Task.objects.create(title='Later', creator_id=second.pk, project=self.tasks)
+        # 0010 の移行で作られた状態（作成者は編集者）
+        Membership.objects.create(project=self.tasks, user_id=first.pk, role='editor')
+        Membership.objects.create(project=self.tasks, user_id=second.pk, role='editor')
+        self.empty = Project.objects.create(name='Empty')
+        self.owned = Project.objects.create(name='Owned')
+        Membership.objects.create(project=self.owned, user_id=second.pk, role='owner')
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def migrate(self):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(self.migrate_to)
+
+    def roles(self, project):
+        return dict(ProjectMembership.objects.filter(project_id=project.pk).values_list('user__username', 'role'))
+
+    def test_first_task_creator_becomes_owner_and_empty_projects_get_the_first_superuser(self):
+        self.migrate()
+        self.assertEqual(self.roles(self.tasks), {'first': 'owner', 'second': 'editor'})
+        self.assertEqual(self.roles(self.empty), {'admin': 'owner'})
+        self.assertEqual(self.roles(self.owned), {'second': 'owner'})
+
+    @override_settings(PROJECT_OWNER_FALLBACK_USERNAME='second')
+    def test_fallback_owner_can_be_configured(self):
+        self.migrate()
+        self.assertEqual(self.roles(self.empty), {'second': 'owner'})
+        # 空のプロジェクトもメンバーの一覧に出る
+        client = APIClient()
+        client.force_authenticate(user=User.objects.get(username='second'))
+        names = [project['name'] for project in client.get(reverse('project-list-create')).data['results']]
+        self.assertIn('Empty', names)
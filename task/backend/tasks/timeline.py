@@ -0,0 +1,52 @@
+from datetime import date
+
+from rest_framework.exceptions import ValidationError
+
+TIMELINE_COLUMNS = ('id', 'title', 'status', 'start_date', 'end_date', 'assignee_id', 'project_id')
+
+
+def parse_window(query_params):
+    """
+    ?from=YYYY-MM-DD&to=YYYY-MM-DD を (from, to) に変換する。どちらも無ければ None
+    """
+    raw_from, raw_to = query_params.get('from'), query_params.get('to')
+    if raw_from is None and raw_to is None:
+        return None
+    errors = {}
+    window = []
+    for name, raw in (('from', raw_from), ('to', raw_to)):
+        try:
+            window.append(date.fromisoformat(raw or ''))
+        except ValueError:
+            errors[name] = 'YYYY-MM-DD 形式で指定してください。'
+    if errors:
+        raise ValidationError(errors)
+    if window[0] > window[1]:
+        raise ValidationError({'to': 'from 以降の日付を指定してください。'})
+    return tuple(window)
+
+
+def filter_window(queryset, window):
+    # 表示期間と1日でも重なるタスク（開始・終了日が未設定のものは描画できないので除く）
+    start, end = window
+    return queryset.filter(start_date__lte=end, end_date__gte=start)
+
+
+def build_timeline(queryset, origin):
+    """
+    ガントチャート用の列指向レスポンス。日付は origin からの日数で返す
+    """
+    columns = {
+        'ids': [], 'titles': [], 'statuses': [], 'starts': [], 'ends': [], 'assignees': [], 'projects': [],
+    }
+    origin_ordinal = origin.toordinal()
+    rows = queryset.order_by('start_date', 'id').values_list(*TIMELINE_COLUMNS)
+    for task_id, title, status, start_date, end_date, assignee_id, project_id in rows:
+        columns['ids'].append(task_id)
+        columns['titles'].append(title)
+        columns['statuses'].append(status)
+        columns['starts'].append(start_date.toordinal() - origin_ordinal)
+        columns['ends'].append(end_date.toordinal() - origin_ordinal)
+        columns['assignees'].append(assignee_id)
+        columns['projects'].append(project_id)
+    return {'origin': origin.isoformat(), 'count': len(columns['ids']), **columns}
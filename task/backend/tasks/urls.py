@@ -1,9 +1,17 @@
 from django.urls import path
-from .views import TaskListCreateView, TaskRetrieveUpdateDestroyView, ProjectListCreateView, ProjectRetrieveUpdateDestroyView
+from .views import TaskListCreateView, TaskChangesView, TaskSearchView, TaskStatsView, TaskBulkView, TaskExportView, TaskImportView, TaskRetrieveUpdateDestroyView, ProjectListCreateView, ProjectRetrieveUpdateDestroyView, ProjectMemberListCreateView, ProjectMemberDetailView
 
 urlpatterns = [
     path('tasks/', TaskListCreateView.as_view(), name='task-list-create'),
+    path('tasks/changes/', TaskChangesView.as_view(), name='task-changes'),
+    path('tasks/search/', TaskSearchView.as_view(), name='task-search'),
+    path('tasks/stats/', TaskStatsView.as_view(), name='task-stats'),
+    path('tasks/bulk/', TaskBulkView.as_view(), name='task-bulk'),
+    path('tasks/export/', TaskExportView.as_view(), name='task-export'),
+    path('tasks/import/', TaskImportView.as_view(), name='task-import'),
     path('tasks/<int:pk>/', TaskRetrieveUpdateDestroyView.as_view(), name='task-detail'),
     path('projects/', ProjectListCreateView.as_view(), name='project-list-create'),
     path('projects/<int:pk>/', ProjectRetrieveUpdateDestroyView.as_view(), name='project-detail'),
+    path('projects/<int:project_id>/members/', ProjectMemberListCreateView.as_view(), name='project-member-list'),
+    path('projects/<int:project_id>/members/<int:user_id>/', ProjectMemberDetailView.as_view(), name='project-member-detail'),
 ] 
\ No newline at end of file
@@ -1,37 +1,437 @@
-from django.shortcuts import render
+import hashlib
+
+from django.db.models import Count, F, Max
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+from django.utils.http import quote_etag
 from rest_framework import generics
-from .models import Task, Project
-from .serializers import TaskSerializer, ProjectSerializer
-from rest_framework.permissions import IsAuthenticated
-from .permissions import IsOwnerOrAdmin
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
+from rest_framework.settings import api_settings
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from common.cache import CachedListMixin
+from common.conditional import ConditionalGetMixin, EditConflict, PreconditionFailed, check_if_match, if_match_given, latest_of
+from common.export import StreamingExportMixin
+from common.fastpath import ValuesRepresentation
+from common.pagination import RankedPagination
+from common.renderers import CompactJSONRenderer, FastJSONRenderer
+from users.activity import acting_user
+from .models import Task, Project, ProjectMembership, ProjectStats, TaskTombstone, TaskVersionConflict
+from .serializers import TaskSerializer, ProjectMembershipSerializer, ProjectSerializer, parse_fieldset
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
+from .permissions import IsProjectOwnerOrReadOnly, IsTaskEditorOrReadOnly
+from .bulk import MAX_OPERATIONS, TaskBulkProcessor
+from .importer import FORMATS, MAX_API_ROWS, ImportFormatError, import_tasks
+from .search import MAX_RESULTS, search_tasks
+from .stats import get_task_stats
+from .sync import InvalidSyncToken, collect_changes, decode_token, encode_token
+from .timeline import build_timeline, filter_window, parse_window
+from .visibility import EDIT_ROLES, visible_projects, visible_tasks, visible_tombstones, with_membership_role
 
 # Create your views here.
 
-class TaskListCreateView(generics.ListCreateAPIView):
+_fast_task_representation = None
+
+
+def get_fast_task_representation():
+    # フィールド定義から組み立てるのは最初の1回だけ
+    global _fast_task_representation
+    if _fast_task_representation is None:
+        _fast_task_representation = ValuesRepresentation(TaskSerializer)
+    return _fast_task_representation
+
+
+class TaskListCreateView(ConditionalGetMixin, generics.ListCreateAPIView):
     serializer_class = TaskSerializer
     permission_classes = [IsAuthenticated]
+    # ?format=compact（または Accept: application/vnd.compact+json）で列名＋配列の配列を返す
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, CompactJSONRenderer]
 
     def get_queryset(self):
-        queryset = Task.objects.all()
+        fieldset = self.get_fieldset()
+        # 見えるタスク（メンバーのプロジェクトと自分の個人タスク）だけをクエリの中で絞る
+        queryset = visible_tasks(Task.objects.all(), self.request.user)
+        if fieldset is None or self.get_timeline_window():
+            queryset = self.get_serializer_class().setup_eager_loading(queryset)
+        else:
+            # ?fields= / ?omit= で絞ったときは、返すフィールドに要る列と JOIN だけを読む
+            queryset = self.get_serializer_class().setup_sparse_loading(
+                queryset, fieldset, keep=self.get_ordering_fields(),
+            )
         project_id = self.request.query_params.get('project')
         if project_id:
             queryset = queryset.filter(project_id=project_id)
+        window = self.get_timeline_window()
+        if window:
+            queryset = filter_window(queryset, window)
         return queryset
 
+    def get_timeline_window(self):
+        if not hasattr(self, '_timeline_window'):
+            self._timeline_window = parse_window(self.request.query_params)
+        return self._timeline_window
+
+    def get_fieldset(self):
+        if not hasattr(self, '_fieldset'):
+            self._fieldset = None
+            if self.request.method == 'GET':
+                fields = get_fast_task_representation().columns
+                self._fieldset = parse_fieldset(self.request.query_params, [name for name, _, _ in fields])
+        return self._fieldset
+
+    def get_ordering_fields(self):
+        return [field.lstrip('-') for field in getattr(self, 'pagination_ordering', self.paginator.ordering)]
+
+    def use_fast_path(self):
+        return self.request.method == 'GET' and self.request.query_params.get('fast') in ('1', 'true')
+
+    def get_renderers(self):
+        # ?fast=1 は JSON だけを返す（ブラウザブル API を挟まない）
+        if self.use_fast_path():
+            return [FastJSONRenderer(), CompactJSONRenderer()]
+        return super().get_renderers()
+
+    def list(self, request, *args, **kwargs):
+        window = self.get_timeline_window()
+        if window is None and self.use_fast_path():
+            queryset = self.filter_queryset(self.get_queryset())
+            parts, last_modified = self.get_collection_version(queryset)
+            return self.conditional_response(request, parts, last_modified, lambda: self.fast_list(queryset))
+        if window is None:
+            return super().list(request, *args, **kwargs)
+        # ?from=&to= 指定時はガントチャート用の列指向形式で、期間内の全件を返す
+        queryset = self.filter_queryset(self.get_queryset())
+        parts, last_modified = self.get_collection_version(queryset)
+        return self.conditional_response(
+            request, parts, last_modified,
+            lambda: Response(build_timeline(queryset, window[0])),
+        )
+
+    def fast_list(self, queryset):
+        """
+        TaskSerializer を通さず .values() の行から同じ形の dict を作る（出力のバイト列は通常の一覧と同じ）
+        """
+        representation = get_fast_task_representation()
+        fieldset = self.get_fieldset()
+        if fieldset is not None:
+            representation = representation.subset(fieldset)
+        page = self.paginate_queryset(representation.values(queryset, extra=self.get_ordering_fields()))
+        if page is None:
+            return Response(representation.many(representation.values(queryset)))
+        return self.get_paginated_response(representation.many(page))
+
+    def get_collection_version(self, queryset):
+        # 削除では max(updated_at) も件数も戻ることがあるので、削除記録の最新時刻も含める
+        parts, last_modified = super().get_collection_version(queryset)
+        tombstones = visible_tombstones(TaskTombstone.objects.all(), self.request.user)
+        project_id = self.request.query_params.get('project')
+        if project_id:
+            tombstones = tombstones.filter(project_id=project_id)
+        deleted_at = tombstones.aggregate(latest=Max('deleted_at'))['latest']
+        # project_name / assignee_name を埋め込むので、名前の変更でも ETag を変える。
+        # タスクと JOIN して集計すると一覧のたびに全行を結合する（22万件で +70ms）ので、
+        # 見えるプロジェクトとユーザーの最新の更新時刻をそれぞれインデックスで引く（合わせて1ms未満）
+        projects = visible_projects(Project.objects.all(), self.request.user).aggregate(latest=Max('updated_at'))['latest']
+        users = get_user_model().objects.aggregate(latest=Max('updated_at'))['latest']
+        return [*parts, deleted_at, projects, users], latest_of(last_modified, deleted_at, projects, users)
+
     def perform_create(self, serializer):
-        serializer.save(creator=self.request.user)
+        with acting_user(self.request.user):
+            # request.user は遅延オブジェクトなので、インスタンスを渡さず ID で紐づける（User を読まない）
+            serializer.save(creator_id=self.request.user.id)
 
-class TaskRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Task.objects.all()
+class TaskChangesView(generics.GenericAPIView):
+    """
+    ?since=<token> 以降に作成・更新・削除されたタスクだけを返す差分同期API
+    """
     serializer_class = TaskSerializer
-    permission_classes = [IsAuthenticated, IsOwnerOrAdmin]
+    permission_classes = [IsAuthenticated]
 
-class ProjectListCreateView(generics.ListCreateAPIView):
-    queryset = Project.objects.all()
-    serializer_class = ProjectSerializer
+    def get_queryset(self):
+        queryset = self.get_serializer_class().setup_eager_loading(visible_tasks(Task.objects.all(), self.request.user))
+        project_id = self.request.query_params.get('project')
+        if project_id:
+            queryset = queryset.filter(project_id=project_id)
+        return queryset.order_by('updated_at', 'id')
+
+    def get(self, request):
+        token = request.query_params.get('since')
+        try:
+            since = decode_token(token) if token else None
+        except InvalidSyncToken:
+            raise ValidationError({'since': '無効な同期トークンです。'})
+        changes = collect_changes(
+            self.get_queryset(), since, request.query_params.get('project'),
+            tombstones=visible_tombstones(TaskTombstone.objects.all(), request.user),
+        )
+        return Response({
+            'token': encode_token(changes['token']),
+            'reset': changes['reset'],
+            'changed': self.get_serializer(changes['changed'], many=True).data,
+            'deleted': changes['deleted'],
+        })
+
+class TaskSearchPagination(RankedPagination):
+    max_offset = MAX_RESULTS
+
+class TaskSearchView(generics.ListAPIView):
+    """
+    ?q= に一致するタスクを関連度順に返す（タイトルの一致を本文より重く見る）
+    """
+    serializer_class = TaskSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = TaskSearchPagination
+
+    def get_queryset(self):
+        query = self.request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': '検索語を指定してください。'})
+        queryset = self.get_serializer_class().setup_eager_loading(visible_tasks(Task.objects.all(), self.request.user))
+        project_id = self.request.query_params.get('project')
+        if project_id:
+            queryset = queryset.filter(project_id=project_id)
+        return search_tasks(queryset, query)
+
+class TaskStatsView(APIView):
+    """
+    ダッシュボード用のタスク集計（ステータス別・プロジェクト別・担当者別・期限切れ）
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response(get_task_stats(request.user))
+
+class TaskBulkView(APIView):
+    """
+    タスクの作成・部分更新・削除をまとめて1トランザクションで適用する
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        operations = request.data.get('operations') if isinstance(request.data, dict) else request.data
+        if not isinstance(operations, list) or not operations:
+            raise ValidationError({'operations': '操作のリストを指定してください。'})
+        if len(operations) > MAX_OPERATIONS:
+            raise ValidationError({'operations': f'一度に指定できる操作は{MAX_OPERATIONS}件までです。'})
+        response_status, results = TaskBulkProcessor(request, self).process(operations)
+        return Response({'results': results}, status=response_status)
+
+class TaskImportView(APIView):
+    """
+    multipart の file（CSV / JSON / NDJSON）からタスクを取り込む。
+    1回に MAX_API_ROWS 行までで、complete が false なら同じファイルを offset=next_offset で再送すると続きから入る
+    """
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ValidationError({'file': 'ファイルを指定してください。'})
+        format = request.data.get('format') or upload.name.rsplit('.', 1)[-1].lower()
+        if format not in FORMATS:
+            raise ValidationError({'format': f"{' / '.join(FORMATS)} のいずれかを指定してください。"})
+        dry_run = request.data.get('dry_run') in ('1', 'true', 'True')
+        offset = request.data.get('offset') or 0
+        try:
+            offset = int(offset)
+        except (TypeError, ValueError):
+            offset = -1
+        if offset < 0:
+            raise ValidationError({'offset': '0以上の整数を指定してください。'})
+        try:
+            report = import_tasks(
+                upload, format, request.user, offset=offset, dry_run=dry_run, max_rows=MAX_API_ROWS,
+                # 取り込み先は編集権限のあるプロジェクトだけ
+                projects=visible_projects(Project.objects.all(), request.user, EDIT_ROLES),
+            )
+        except ImportFormatError as exc:
+            raise ValidationError({'file': str(exc)})
+        return Response(report)
+
+class TaskExportView(StreamingExportMixin, APIView):
+    """
+    タスクを ?format=csv|ndjson で全件ストリーミングする（?project= で絞り込み）。
+    担当者・作成者・プロジェクトの名前は JOIN して同じ行で読む
+    """
     permission_classes = [IsAuthenticated]
+    export_filename = 'tasks'
+
+    def get_export_columns(self):
+        return [
+            ('id', 'id'),
+            ('title', 'title'),
+            ('description', 'description'),
+            ('status', 'status'),
+            ('assignee_id', 'assignee_id'),
+            ('assignee_name', 'assignee__username'),
+            ('creator_id', 'creator_id'),
+            ('creator_name', 'creator__username'),
+            ('project_id', 'project_id'),
+            ('project_name', 'project__name'),
+            ('start_date', 'start_date'),
+            ('end_date', 'end_date'),
+            ('due_date', 'due_date'),
+            ('created_at', 'created_at'),
+            ('updated_at', 'updated_at'),
+        ]
+
+    def get_export_queryset(self):
+        queryset = visible_tasks(Task.objects.all(), self.request.user).order_by('id')
+        project_id = self.request.query_params.get('project')
+        if project_id:
+            if not project_id.isdigit():
+                raise ValidationError({'project': 'プロジェクトIDを指定してください。'})
+            queryset = queryset.filter(project_id=project_id)
+        return queryset
+
+    def get(self, request):
+        return self.export_response(request)
+
+class TaskRetrieveUpdateDestroyView(ConditionalGetMixin, generics.RetrieveUpdateDestroyAPIView):
+    serializer_class = TaskSerializer
+    permission_classes = [IsAuthenticated, IsTaskEditorOrReadOnly]
+
+    def get_queryset(self):
+        # 見えないタスクは 404。自分の役割も同じ行に付けるので、権限判定で追加のクエリは出ない
+        queryset = with_membership_role(visible_tasks(Task.objects.all(), self.request.user), self.request.user)
+        return self.get_serializer_class().setup_eager_loading(queryset)
+
+    def get_object(self):
+        # PUT / PATCH / DELETE は If-Match が今の版と違えば 412。GET で受け取った ETag そのものでも、
+        # 一覧の version から組み立てた "<version>" でもよい
+        instance = super().get_object()
+        if self.request.method not in SAFE_METHODS:
+            parts, _ = self.get_object_version(instance)
+            check_if_match(self.request, quote_etag(str(instance.version)), self.make_etag(self.request, parts))
+        return instance
+
+    def get_object_version(self, instance):
+        # 埋め込んでいるプロジェクト名・担当者名の更新時刻も含める（どちらも同じ行で JOIN 済み）
+        related = [getattr(instance.project, 'updated_at', None), getattr(instance.assignee, 'updated_at', None)]
+        return [instance.version, *related], latest_of(instance.updated_at, *related)
+
+    def make_etag(self, request, parts):
+        # 版数のあとに関連先の更新時刻の短いハッシュを付けた強い ETag（If-Match は強い比較なので W/ を付けない）
+        version, *related = parts
+        raw = '|'.join(value.isoformat() if value else '' for value in related)
+        return quote_etag(f'{version}-{hashlib.md5(raw.encode()).hexdigest()[:8]}')
+
+    def update(self, request, *args, **kwargs):
+        response = super().update(request, *args, **kwargs)
+        parts, _ = self.get_object_version(self.saved_instance)
+        response['ETag'] = self.make_etag(request, parts)
+        return response
+
+    def perform_update(self, serializer):
+        # 読み込んでから保存するまでの間に別の更新が入った場合も、UPDATE ... WHERE version= が0行になって気付ける
+        try:
+            with acting_user(self.request.user):
+                self.saved_instance = serializer.save()
+        except TaskVersionConflict:
+            raise self.version_conflict()
+
+    def perform_destroy(self, instance):
+        with transaction.atomic(), acting_user(self.request.user):
+            # 読み込んだ版のままのときだけ消す（版数を進める UPDATE で確かめる）
+            if not Task.objects.filter(pk=instance.pk, version=instance.version).update(version=F('version') + 1):
+                raise self.version_conflict()
+            instance.delete()
+
+    def version_conflict(self):
+        # If-Match を付けた要求なら前提条件の不成立（412）、付けていなければ単なる競合（409）
+        return PreconditionFailed() if if_match_given(self.request) else EditConflict()
+
+class ProjectVersionMixin:
+    """
+    進捗（ProjectStats）はタスクの変更で増減するので、その更新時刻も ETag / Last-Modified に含める
+    """
 
-class ProjectRetrieveUpdateDestroyView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Project.objects.all()
+    def get_queryset(self):
+        queryset = visible_projects(Project.objects.all(), self.request.user)
+        return self.get_serializer_class().setup_eager_loading(queryset)
+
+    def get_collection_version(self, queryset):
+        version = queryset.order_by().aggregate(
+            latest=Max('updated_at'), progress=Max('stats__updated_at'), count=Count('pk'),
+        )
+        last_modified = max(filter(None, [version['latest'], version['progress']]), default=None)
+        return [version['count'], version['latest'], version['progress']], last_modified
+
+    def get_object_version(self, instance):
+        try:
+            progress = instance.stats.updated_at
+        except ProjectStats.DoesNotExist:
+            progress = None
+        return [instance.pk, instance.updated_at, progress], max(filter(None, [instance.updated_at, progress]), default=None)
+
+class ProjectListCreateView(CachedListMixin, ProjectVersionMixin, ConditionalGetMixin, generics.ListCreateAPIView):
+    # 画面ごとに毎回読まれるがほとんど変わらないので、シリアライズ結果をキャッシュする
+    # （プロジェクトの変更は tasks/signals.py、進捗の増減は tasks/rollups.py で無効化）
+    list_cache_name = 'projects'
     serializer_class = ProjectSerializer
     permission_classes = [IsAuthenticated]
+
+    def get_list_cache_scope(self):
+        # 見えるプロジェクトはメンバーシップで決まるので、管理者以外は利用者ごとに持つ
+        return 'all' if self.request.user.is_staff else f'user:{self.request.user.pk}'
+
+    def perform_create(self, serializer):
+        # 作成者をオーナーにする
+        with transaction.atomic():
+            project = serializer.save()
+            ProjectMembership.objects.create(project=project, user_id=self.request.user.pk, role=ProjectMembership.OWNER)
+
+class ProjectRetrieveUpdateDestroyView(ProjectVersionMixin, ConditionalGetMixin, generics.RetrieveUpdateDestroyAPIView):
+    serializer_class = ProjectSerializer
+    permission_classes = [IsAuthenticated, IsProjectOwnerOrReadOnly]
+
+class ProjectMemberMixin:
+    """
+    /projects/<project_id>/members/ 以下。プロジェクトが見えなければ 404、変更はオーナーと管理者のみ
+    """
+    serializer_class = ProjectMembershipSerializer
+    permission_classes = [IsAuthenticated, IsProjectOwnerOrReadOnly]
+    pagination_class = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        # 入力の検証より先に、プロジェクトが見えるか・変更できるかを判定する
+        self.get_project()
+
+    def get_project(self):
+        if not hasattr(self, '_project'):
+            self._project = get_object_or_404(visible_projects(Project.objects.all(), self.request.user), pk=self.kwargs['project_id'])
+            self.check_object_permissions(self.request, self._project)
+        return self._project
+
+    def get_queryset(self):
+        return self.get_project().memberships.select_related('user').order_by('id')
+
+    def check_last_owner(self, membership, role=None):
+        # オーナーが居なくなる変更は受け付けない
+        if membership.role != ProjectMembership.OWNER or role == ProjectMembership.OWNER:
+            return
+        if not self.get_project().memberships.filter(role=ProjectMembership.OWNER).exclude(pk=membership.pk).exists():
+            raise ValidationError({'role': 'オーナーが居なくなるため変更できません。'})
+
+class ProjectMemberListCreateView(ProjectMemberMixin, generics.ListCreateAPIView):
+    def perform_create(self, serializer):
+        project = self.get_project()
+        if project.memberships.filter(user=serializer.validated_data['user']).exists():
+            raise ValidationError({'user': '既にメンバーです。'})
+        serializer.save(project=project)
+
+class ProjectMemberDetailView(ProjectMemberMixin, generics.RetrieveUpdateDestroyAPIView):
+    lookup_field = 'user_id'
+    lookup_url_kwarg = 'user_id'
+
+    def perform_update(self, serializer):
+        self.check_last_owner(serializer.instance, serializer.validated_data.get('role', serializer.instance.role))
+        serializer.save()
+
+    def perform_destroy(self, instance):
+        self.check_last_owner(instance)
+        instance.delete()
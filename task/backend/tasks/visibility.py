@@ -0,0 +1,143 @@
+"""
+プロジェクトのメンバーシップによるタスク・プロジェクトの可視範囲と編集権限。
+
+- 管理者（is_staff）はすべて見える。
+- それ以外は、メンバーになっているプロジェクトのタスクと、プロジェクトに属さない
+  自分が作成者・担当者のタスクだけが見える。
+一覧などの絞り込みは get_queryset の中でメンバーシップへの EXISTS（準結合）として行う。
+(user, project) の一意インデックスだけで判定できるので、一覧は (updated_at, id) の順に読みながら
+見えない行を飛ばすだけで済み、行を読んでから権限を見ることはしない。
+自分の {project_id: 役割} はリクエストごとに1回だけ読み、request に持たせて使い回す。
+リアルタイム配信の接続時に使うメンバーのプロジェクト ID は、JWT の失効判定（users/authentication.py）と
+同じ作りのプロセス内 TTL 付き LRU（PROJECT_MEMBERSHIP_CACHE_*）に持ち、メンバーシップの保存・削除で消す。
+"""
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q, Subquery
+from django.dispatch import receiver
+
+from common.cache import LRUCache
+
+from .models import ProjectMembership
+
+EDIT_ROLES = (ProjectMembership.OWNER, ProjectMembership.EDITOR)
+
+
+def member_project_ids(user, roles=None):
+    """
+    user がメンバーのプロジェクト ID のサブクエリ（roles を渡すとその役割のものだけ）
+    """
+    memberships = ProjectMembership.objects.filter(user_id=user.pk)
+    if roles is not None:
+        memberships = memberships.filter(role__in=roles)
+    return memberships.values('project_id')
+
+
+def visible_tasks(queryset, user):
+    if user.is_staff:
+        return queryset
+    # IN (サブクエリ) だと SQLite は OR の両側を索引で集めてから並べ替えるため、EXISTS にしている
+    member = Exists(ProjectMembership.objects.filter(user_id=user.pk, project_id=OuterRef('project_id')))
+    personal = Q(project__isnull=True) & (Q(creator_id=user.pk) | Q(assignee_id=user.pk))
+    return queryset.filter(member | personal)
+
+
+def visible_projects(queryset, user, roles=None):
+    if user.is_staff:
+        return queryset
+    return queryset.filter(pk__in=member_project_ids(user, roles))
+
+
+def visible_tombstones(queryset, user):
+    # 削除済みのタスクは作成者が分からないので、プロジェクトに属さないものは ID だけ誰にでも返す
+    if user.is_staff:
+        return queryset
+    return queryset.filter(Q(project_id__in=member_project_ids(user)) | Q(project_id__isnull=True))
+
+
+def with_membership_role(queryset, user):
+    """
+    タスクの行に自分の役割（membership_role）を相関サブクエリで付ける。
+    詳細の取得と権限判定を1クエリで済ませるために使う
+    """
+    role = ProjectMembership.objects.filter(project_id=OuterRef('project_id'), user_id=user.pk).values('role')[:1]
+    return queryset.annotate(membership_role=Subquery(role))
+
+
+def get_project_roles(request):
+    """
+    自分の {project_id: 役割}。同じリクエストの中では1回しか読まない
+    """
+    request = getattr(request, '_request', request)
+    roles = getattr(request, '_project_roles', None)
+    if roles is None:
+        roles = dict(ProjectMembership.objects.filter(user_id=request.user.pk).values_list('project_id', 'role'))
+        request._project_roles = roles
+    return roles
+
+
+def get_task_role(request, task):
+    if task.project_id is None:
+        return None
+    # with_membership_role() で付けてあればそれを使う（追加のクエリを出さない）
+    if hasattr(task, 'membership_role'):
+        return task.membership_role
+    return get_project_roles(request).get(task.project_id)
+
+
+def can_edit_task(request, task):
+    user = request.user
+    if user.is_staff or task.creator_id == user.pk:
+        return True
+    return get_task_role(request, task) in EDIT_ROLES
+
+
+def can_use_project(request, project_id):
+    """
+    タスクをこのプロジェクトに入れられるか（作成・移動）
+    """
+    if project_id is None or request.user.is_staff:
+        return True
+    return get_project_roles(request).get(project_id) in EDIT_ROLES
+
+
+_member_project_cache = None
+
+
+def get_member_project_cache():
+    global _member_project_cache
+    if _member_project_cache is None:
+        _member_project_cache = LRUCache(
+            max_entries=getattr(settings, 'PROJECT_MEMBERSHIP_CACHE_SIZE', 10000),
+            ttl=getattr(settings, 'PROJECT_MEMBERSHIP_CACHE_TTL', 30),
+        )
+    return _member_project_cache
+
+
+def get_member_project_ids(user_id):
+    """
+    user_id がメンバーのプロジェクト ID の frozenset。同じプロセスでは TTL の間 DB を引かない
+    """
+    cache = get_member_project_cache()
+    project_ids = cache.get(user_id)
+    if project_ids is None:
+        project_ids = frozenset(ProjectMembership.objects.filter(user_id=user_id).values_list('project_id', flat=True))
+        cache.set(user_id, project_ids)
+    return project_ids
+
+
+def forget_member_project_ids(user_id):
+    """
+    変更直後とコミット後の両方で消す（コミット前に古い内容を読み直されても残らない）
+    """
+    cache = get_member_project_cache()
+    cache.delete(user_id)
+    transaction.on_commit(lambda: cache.delete(user_id))
+
+
+@receiver(setting_changed)
+def reset_member_project_cache(setting, **kwargs):
+    global _member_project_cache
+    if setting in ('PROJECT_MEMBERSHIP_CACHE_SIZE', 'PROJECT_MEMBERSHIP_CACHE_TTL'):
+        _member_project_cache = None
@@ -0,0 +1,225 @@
+import atexit
+import contextvars
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections, router, transaction
+from django.dispatch import Signal, receiver
+
+from common import metrics
+
+logger = logging.getLogger(__name__)
+
+# 一括 INSERT の後に (sender=モデル, instances=作成した行) で送られる。
+# bulk_create は post_save を送らないので、通知の配信などはこちらを受け取る
+records_flushed = Signal()
+
+_current_actor = contextvars.ContextVar('activity_actor', default=None)
+
+DEFAULTS = {
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL': 1.0,
+    'MAX_PENDING': 10000,
+    'BACKGROUND': True,
+}
+
+flush_seconds = metrics.histogram(
+    'activity_writer_flush_seconds', '活動履歴・通知の一括書き込みにかかった時間',
+)
+flushed_records = metrics.counter(
+    'activity_writer_flushed_records', '一括書き込みした行数', ('model',),
+)
+flush_errors = metrics.counter(
+    'activity_writer_flush_errors', '一括書き込みに失敗した回数',
+)
+dropped_records = metrics.counter(
+    'activity_writer_dropped_records', '1行ずつ書き直しても書けずに捨てた行数', ('model',),
+)
+
+
+@contextmanager
+def acting_user(user):
+    """
+    このブロック内の変更を user の操作として活動履歴に残す
+    """
+    token = _current_actor.set(getattr(user, 'pk', None))
+    try:
+        yield
+    finally:
+        _current_actor.reset(token)
+
+
+def current_actor_id():
+    return _current_actor.get()
+
+
+class BufferedWriter:
+    """
+    ActivityLog / Notification の行をメモリに溜め、件数か経過時間のしきい値で
+    bulk_create する。書き込みはバックグラウンドのスレッドが行い、
+    リクエスト処理には INSERT を持ち込まない
+    """
+
+    def __init__(self, batch_size=500, flush_interval=1.0, max_pending=10000, background=True):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.background = background
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def record(self, instance):
+        """
+        未保存のモデルインスタンスを書き込み待ちに積む
+        """
+        with self._lock:
+            self._buffer.append(instance)
+            pending = len(self._buffer)
+        if self._stopped.is_set():
+            # close() の後（終了処理中）は書き込むスレッドも後で書く機会も無いので、その場で書く
+            self.flush()
+            return
+        if not self.background:
+            # バックグラウンド無しの場合は呼び出し側で件数しきい値ごとに書く
+            if pending >= self.batch_size:
+                self.flush()
+            return
+        self._ensure_thread()
+        if pending >= self.max_pending:
+            # 書き込みが追いつかない場合は呼び出し側で書いて、メモリを際限なく使わない
+            self.flush()
+        elif pending >= self.batch_size:
+            self._wakeup.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._buffer)
+
+    def flush(self):
+        """
+        溜まっている行をすべて書き込み、書き込んだ件数を返す
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+            if not batch:
+                return 0
+            started = time.perf_counter()
+            by_model = defaultdict(list)
+            for instance in batch:
+                by_model[type(instance)].append(instance)
+            written = 0
+            for model, instances in by_model.items():
+                created = self._write(model, instances)
+                if not created:
+                    continue
+                written += len(created)
+                flushed_records.inc(len(created), model=model.__name__)
+                records_flushed.send(sender=model, instances=created)
+            flush_seconds.observe(time.perf_counter() - started)
+            return written
+
+    def _write(self, model, instances):
+        """
+        一括で書き、失敗したら1回だけやり直す。それでも失敗したら1行ずつ書き、書けない行だけを捨てる。
+        どれも savepoint の中で書くので、呼び出し側のトランザクションは壊さない
+        """
+        using = router.db_for_write(model)
+        for attempt in range(2):
+            try:
+                with transaction.atomic(using=using):
+                    return model.objects.bulk_create(instances, batch_size=self.batch_size)
+            except Exception:
+                flush_errors.inc()
+                logger.warning(
+                    '%s の一括書き込みに失敗しました（%d件、%d回目）', model.__name__, len(instances), attempt + 1, exc_info=True,
+                )
+        created = []
+        for instance in instances:
+            try:
+                with transaction.atomic(using=using):
+                    created += model.objects.bulk_create([instance])
+            except Exception:
+                dropped_records.inc(model=model.__name__)
+                logger.exception('%s の1行を書き込めなかったため捨てます', model.__name__)
+        return created
+
+    def close(self, flush=True):
+        """
+        バックグラウンドスレッドを止め、残りを書き込む（プロセス終了時に呼ばれる）
+        """
+        self._stopped.set()
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=max(self.flush_interval * 5, 5))
+        return self.flush() if flush else 0
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='activity-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('活動履歴の書き込みスレッドでエラーが発生しました')
+        close_old_connections()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_activity_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            options = {**DEFAULTS, **getattr(settings, 'ACTIVITY_WRITER', {})}
+            _writer = BufferedWriter(
+                batch_size=options['BATCH_SIZE'],
+                flush_interval=options['FLUSH_INTERVAL'],
+                max_pending=options['MAX_PENDING'],
+                background=options['BACKGROUND'],
+            )
+        return _writer
+
+
+metrics.gauge(
+    'activity_writer_pending_records', '書き込み待ちの活動履歴・通知の件数',
+    function=lambda: get_activity_writer().pending(),
+)
+
+
+@atexit.register
+def _flush_on_exit():
+    if _writer is not None:
+        _writer.close()
+
+
+@receiver(setting_changed)
+def reset_activity_writer(setting, **kwargs):
+    global _writer
+    if setting == 'ACTIVITY_WRITER':
+        with _writer_lock:
+            if _writer is not None:
+                # 設定を差し替えても溜まっている行は捨てずに書き切る
+                _writer.close()
+            _writer = None
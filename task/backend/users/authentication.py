@@ -0,0 +1,142 @@
+"""
+リクエストごとに User を引かない JWT 認証。
+
+アクセストークンに user_id / username を載せ（users/serializers.py の TokenObtainPairWithClaimsSerializer）、
+request.user は id・username・is_staff などだけならそのまま答え、それ以外の属性に
+触れたときに初めて User を読み込む遅延オブジェクトにする。
+
+失効判定に使う (is_active, is_staff, tokens_valid_after) は、プロセス内の TTL 付き LRU に
+JWT_REVOCATION_CACHE_TTL 秒だけ持つ。同じプロセスでの変更は post_save で即座に消え、
+他プロセスには TTL 以内に伝わる。
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.functional import SimpleLazyObject, empty
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from common import metrics
+from common.cache import LRUCache
+
+User = get_user_model()
+
+# トークンから答える属性（is_staff / is_active は失効判定と同じキャッシュの値を使う）
+TOKEN_CLAIMS = ('username',)
+
+revocation_lookups = metrics.counter(
+    'jwt_revocation_lookups', 'JWT 失効判定のキャッシュ参照（result は hit / miss）', ('result',),
+)
+
+_revocation_cache = None
+
+
+def get_revocation_cache():
+    global _revocation_cache
+    if _revocation_cache is None:
+        _revocation_cache = LRUCache(
+            max_entries=getattr(settings, 'JWT_REVOCATION_CACHE_SIZE', 10000),
+            ttl=getattr(settings, 'JWT_REVOCATION_CACHE_TTL', 30),
+        )
+    return _revocation_cache
+
+
+def get_user_state(user_id):
+    """
+    (is_active, is_staff, is_superuser, tokens_valid_after の UNIX 秒) を返す。ユーザーが居なければ None
+    """
+    cache = get_revocation_cache()
+    state = cache.get(user_id)
+    if state is not None:
+        revocation_lookups.inc(result='hit')
+        return state or None
+    revocation_lookups.inc(result='miss')
+    row = (
+        User._default_manager.filter(pk=user_id)
+        .values_list('is_active', 'is_staff', 'is_superuser', 'tokens_valid_after')
+        .first()
+    )
+    if row is None:
+        # 存在しないことも覚えておく（削除済みユーザーのトークンで DB を叩かせない）
+        cache.set(user_id, ())
+        return None
+    is_active, is_staff, is_superuser, valid_after = row
+    state = (is_active, is_staff, is_superuser, valid_after.timestamp() if valid_after else None)
+    cache.set(user_id, state)
+    return state
+
+
+@receiver(setting_changed)
+def reset_revocation_cache(setting, **kwargs):
+    global _revocation_cache
+    if setting in ('JWT_REVOCATION_CACHE_SIZE', 'JWT_REVOCATION_CACHE_TTL'):
+        _revocation_cache = None
+
+
+def forget_user_state(user_id):
+    get_revocation_cache().delete(user_id)
+
+
+def check_token_state(user_id, token):
+    """
+    ユーザーが有効で、トークンが失効時刻より後に発行されていれば状態を返す
+    """
+    state = get_user_state(user_id)
+    if state is None:
+        raise AuthenticationFailed(_('User not found'), code='user_not_found')
+    is_active, _is_staff, _is_superuser, valid_after = state
+    if not is_active:
+        raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+    if valid_after is not None and token.get('iat', 0) < valid_after:
+        raise AuthenticationFailed('トークンは失効しています。', code='token_revoked')
+    return state
+
+
+class LazyUser(SimpleLazyObject):
+    """
+    トークンの内容で答えられる属性は DB を引かずに返し、それ以外に触れたら User を読み込む
+    """
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, user_id, attributes):
+        super().__init__(lambda: User._default_manager.get(pk=user_id))
+        self.__dict__['_attributes'] = {'id': user_id, 'pk': user_id, **attributes}
+
+    def __getattr__(self, name):
+        if self._wrapped is empty:
+            attributes = self.__dict__['_attributes']
+            if name in attributes:
+                return attributes[name]
+        return super().__getattr__(name)
+
+    def __bool__(self):
+        return True
+
+    def __repr__(self):
+        if self._wrapped is empty:
+            return f'<LazyUser: {self.__dict__["_attributes"]["id"]}>'
+        return f'<LazyUser: {self._wrapped!r}>'
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication の get_user を、DB を引かない LazyUser に差し替えたもの
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = User._meta.pk.to_python(validated_token[api_settings.USER_ID_CLAIM])
+        except KeyError:
+            raise InvalidToken(_('Token contained no recognizable user identification'))
+        is_active, is_staff, is_superuser, _valid_after = check_token_state(user_id, validated_token)
+        attributes = {name: validated_token[name] for name in TOKEN_CLAIMS if name in validated_token}
+        return LazyUser(user_id, {
+            **attributes,
+            'is_active': is_active,
+            'is_staff': is_staff,
+            'is_superuser': is_superuser,
+        })
@@ -0,0 +1,182 @@
+"""
+パスワードのハッシュ化・照合の同時実行数に上限を設け、混雑時は早めに断る（背圧）。
+
+同時に計算する数は WORKERS、待てる数は MAX_PENDING までに抑え、空きが WAIT 秒で出なければ
+HasherPoolSaturated を送出する。Argon2 は1回ごとにメモリと CPU を使うので、デプロイ直後の
+ログイン集中で同時計算が積み上がり、どのリクエストもタイムアウトするのを防ぐためのもの。
+呼び出したリクエストのスレッドは結果を待つので、同期ワーカー（gunicorn の sync など）は
+計算の間ふさがったままになる。ワーカーを空けるものではなく、計算の上限と待たせる長さを決めるもの。
+
+プールを使うのは pooled_hashing() の中（API のログイン・登録・パスワード変更）だけで、
+そのビューが HasherPoolSaturated を 429 に変える（users/views.py の PooledHashingMixin）。
+createsuperuser・create_dummy_data・管理画面などそれ以外の呼び出しは、その場で同期的に計算する。
+"""
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.contrib.auth.hashers import Argon2PasswordHasher
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from common import metrics
+
+DEFAULTS = {
+    'WORKERS': 4,
+    'MAX_PENDING': 32,
+    'WAIT': 0.5,
+    'RETRY_AFTER': 1,
+}
+
+hash_seconds = metrics.histogram(
+    'password_hash_seconds', 'パスワードのハッシュ化・照合にかかった時間（待ち時間を除く）', ('operation',),
+)
+wait_seconds = metrics.histogram(
+    'password_hash_wait_seconds', 'ハッシュ計算の空きを待った時間', ('operation',),
+)
+rejections = metrics.counter(
+    'password_hash_rejections', '混雑のため断った回数', ('operation',),
+)
+rehashes = metrics.counter(
+    'password_rehashes', 'ログイン時に保存済みハッシュを付け替えた回数',
+)
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """
+    コストを設定（PASSWORD_ARGON2）で調整できる Argon2。
+    値を変えると must_update が真になり、次回ログイン時に新しいコストで付け替わる
+    """
+
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_ARGON2['TIME_COST']
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_ARGON2['MEMORY_COST']
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_ARGON2['PARALLELISM']
+
+
+class HasherPoolSaturated(Exception):
+    """
+    プールの空きが WAIT 秒で出なかった。retry_after 秒後の再試行を促す
+    """
+
+    def __init__(self, retry_after):
+        super().__init__(f'password hasher pool is saturated (retry after {retry_after}s)')
+        self.retry_after = retry_after
+
+
+class HasherPool:
+    def __init__(self, workers=4, max_pending=32, wait=0.5, retry_after=1):
+        self.workers = workers
+        self.wait = wait
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hasher')
+        # 実行中 + 待ち行列の合計を数える
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+    def in_flight(self):
+        return self._in_flight
+
+    def run(self, operation, func, *args):
+        """
+        プールで func(*args) を実行し、終わるまで待って結果を返す。WAIT 秒で枠が取れなければ HasherPoolSaturated
+        """
+        queued = time.perf_counter()
+        if not self._slots.acquire(timeout=self.wait):
+            rejections.inc(operation=operation)
+            raise HasherPoolSaturated(self.retry_after)
+        with self._lock:
+            self._in_flight += 1
+        try:
+            return self._executor.submit(self._timed, operation, queued, func, args).result()
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+
+    def _timed(self, operation, queued, func, args):
+        started = time.perf_counter()
+        wait_seconds.observe(started - queued, operation=operation)
+        try:
+            return func(*args)
+        finally:
+            hash_seconds.observe(time.perf_counter() - started, operation=operation)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_hasher_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            options = {**DEFAULTS, **getattr(settings, 'PASSWORD_HASHER_POOL', {})}
+            _pool = HasherPool(
+                workers=options['WORKERS'],
+                max_pending=options['MAX_PENDING'],
+                wait=options['WAIT'],
+                retry_after=options['RETRY_AFTER'],
+            )
+        return _pool
+
+
+metrics.gauge(
+    'password_hash_in_flight', '計算中・待機中のパスワードハッシュ処理の数',
+    function=lambda: get_hasher_pool().in_flight(),
+)
+
+
+@receiver(setting_changed)
+def reset_hasher_pool(setting, **kwargs):
+    global _pool
+    if setting == 'PASSWORD_HASHER_POOL':
+        with _pool_lock:
+            if _pool is not None:
+                _pool.shutdown()
+            _pool = None
+
+
+_pooled = contextvars.ContextVar('password_hashing_pooled', default=False)
+
+
+@contextmanager
+def pooled_hashing():
+    """
+    このブロック内のハッシュ化・照合をプールで行う。混雑時は HasherPoolSaturated になる
+    """
+    token = _pooled.set(True)
+    try:
+        yield
+    finally:
+        _pooled.reset(token)
+
+
+def hash_password(password):
+    if not _pooled.get():
+        return hashers.make_password(password)
+    return get_hasher_pool().run('hash', hashers.make_password, password)
+
+
+def verify_password(password, encoded):
+    """
+    (一致したか, 優先の方式・コストで付け替えるべきか) を返す
+    """
+    if not _pooled.get():
+        return hashers.verify_password(password, encoded)
+    return get_hasher_pool().run('verify', hashers.verify_password, password, encoded)
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from users.partitions import ensure_partitions, is_partitioned, list_partitions
+
+
+class Command(BaseCommand):
+    help = 'アクティビティログの月別パーティションを先の月まで作成します（PostgreSQL のみ）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=2, help='今月から何か月先まで作るか')
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            self.stdout.write('アクティビティログはパーティション化されていません')
+            return
+        for name in ensure_partitions(months_ahead=options['months_ahead']):
+            self.stdout.write(f'{name} を作成しました')
+        self.stdout.write(self.style.SUCCESS(f'パーティション数: {len(list_partitions())}'))
@@ -0,0 +1,34 @@
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from users.partitions import add_months, archive_month, drop_month, month_start, months_before
+
+
+class Command(BaseCommand):
+    help = '指定した月より古いアクティビティログを月ごとに gzip JSONL へ書き出して削除します'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', help='この月（YYYY-MM）より前を対象にする。省略時は12か月前')
+        parser.add_argument('--output-dir', default='activity_archive', help='書き出し先ディレクトリ')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--keep', action='store_true', help='書き出すだけで削除しない')
+
+    def handle(self, *args, **options):
+        current = month_start(datetime.now(dt_timezone.utc).date())
+        if options['before']:
+            try:
+                cutoff = datetime.strptime(options['before'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError('--before は YYYY-MM 形式で指定してください')
+        else:
+            cutoff = add_months(current, -12)
+        if cutoff > current:
+            raise CommandError('今月以降のログはアーカイブできません')
+
+        for month in months_before(cutoff):
+            path, count = archive_month(month, options['output_dir'], options['chunk_size'])
+            if not options['keep']:
+                drop_month(month)
+            self.stdout.write(f'{month:%Y-%m}: {count} 件を {path} に書き出しました')
+        self.stdout.write(self.style.SUCCESS('アーカイブが完了しました'))
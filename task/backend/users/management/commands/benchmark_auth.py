@@ -0,0 +1,76 @@
+import json
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from users.authentication import StatelessJWTAuthentication, get_revocation_cache
+from users.serializers import TokenObtainPairWithClaimsSerializer
+
+User = get_user_model()
+
+
+class WhoAmIView(APIView):
+    """
+    認証と権限判定だけを通して、よく使う属性（id・is_staff）を返すだけのビュー
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response({'id': request.user.id, 'is_staff': request.user.is_staff})
+
+
+class Command(BaseCommand):
+    help = '従来の JWTAuthentication と StatelessJWTAuthentication の1秒あたりの処理件数を比べます'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='認証方式ごとのリクエスト数')
+        parser.add_argument('--warmup', type=int, default=100)
+
+    def handle(self, *args, **options):
+        # 計測用のユーザーは最後にロールバックして残さない
+        with transaction.atomic():
+            user = User.objects.create_user(username='__benchmark_auth__', password='unused-password')
+            token = str(TokenObtainPairWithClaimsSerializer.get_token(user).access_token)
+            results = [
+                self.measure('JWTAuthentication', JWTAuthentication, token, options),
+                self.measure('StatelessJWTAuthentication', StatelessJWTAuthentication, token, options),
+            ]
+            transaction.set_rollback(True)
+        baseline = results[0]['requests_per_second']
+        for result in results:
+            result['speedup'] = round(result['requests_per_second'] / baseline, 2) if baseline else None
+        self.stdout.write(json.dumps({'requests': options['requests'], 'results': results}, ensure_ascii=False, indent=2))
+
+    def measure(self, name, authentication_class, token, options):
+        view = WhoAmIView.as_view(authentication_classes=[authentication_class])
+        factory = APIRequestFactory()
+
+        def call():
+            response = view(factory.get('/whoami/', HTTP_AUTHORIZATION=f'Bearer {token}'))
+            assert response.status_code == 200, response.status_code
+
+        get_revocation_cache().clear()
+        for _ in range(options['warmup']):
+            call()
+        with CaptureQueriesContext(connection) as ctx:
+            call()
+        queries = len(ctx.captured_queries)
+
+        started = time.perf_counter()
+        for _ in range(options['requests']):
+            call()
+        elapsed = time.perf_counter() - started
+        return {
+            'authentication': name,
+            'requests_per_second': round(options['requests'] / elapsed, 1),
+            'mean_ms': round(elapsed / options['requests'] * 1000, 3),
+            'queries_per_request': queries,
+        }
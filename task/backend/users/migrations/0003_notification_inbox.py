@@ -0,0 +1,36 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:51
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_unread_counts(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    Notification = apps.get_model('users', 'Notification')
+    unread = Notification.objects.filter(is_read=False).order_by().values('user_id').annotate(count=Count('id'))
+    for row in unread:
+        User.objects.filter(pk=row['user_id']).update(unread_notification_count=row['count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_activitylog_notification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='unread_notification_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_unread_counts, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='notification_inbox_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'is_read', '-created_at', '-id'], name='notification_unread_idx'),
+        ),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:53
+
+from datetime import datetime, timezone
+
+from django.db import migrations, models
+
+TABLE = 'users_activitylog'
+SEQUENCE = 'users_activitylog_id_seq'
+
+
+def _month_index(value):
+    return value.year * 12 + value.month - 1
+
+
+def _month_literal(index):
+    return f"'{index // 12:04d}-{index % 12 + 1:02d}-01 00:00:00+00'"
+
+
+def partition_activity_log(apps, schema_editor):
+    """
+    PostgreSQL では既存テーブルを created_at の月別 RANGE パーティションに作り替える。
+    主キーにはパーティションキーを含める必要があるので (id, created_at) にする
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'SELECT MIN(created_at) FROM {TABLE}')
+        oldest = cursor.fetchone()[0]
+        cursor.execute(f"SELECT pg_get_serial_sequence('{TABLE}', 'id')")
+        legacy_sequence = cursor.fetchone()[0]
+    now = datetime.now(timezone.utc)
+    first = _month_index(oldest or now)
+    last = _month_index(now) + 2
+
+    schema_editor.execute(f'ALTER TABLE {TABLE} RENAME TO {TABLE}_legacy')
+    # テーブル名を変えても id の（IDENTITY / serial の）シーケンス名は users_activitylog_id_seq のまま残るので、
+    # 新しいテーブル用に同じ名前で作る前に退避する（旧テーブルと一緒に最後に消える）
+    if legacy_sequence:
+        schema_editor.execute(f'ALTER SEQUENCE {legacy_sequence} RENAME TO {TABLE}_legacy_id_seq')
+    schema_editor.execute(f'CREATE SEQUENCE {SEQUENCE}')
+    schema_editor.execute(
+        f'CREATE TABLE {TABLE} ('
+        f"id bigint NOT NULL DEFAULT nextval('{SEQUENCE}'), "
+        'action varchar(255) NOT NULL, '
+        'created_at timestamp with time zone NOT NULL, '
+        'related_task_id integer NULL, '
+        'user_id bigint NOT NULL, '
+        'PRIMARY KEY (id, created_at)'
+        ') PARTITION BY RANGE (created_at)'
+    )
+    schema_editor.execute(f'ALTER SEQUENCE {SEQUENCE} OWNED BY {TABLE}.id')
+    for index in range(first, last + 1):
+        name = f'{TABLE}_p{index // 12:04d}{index % 12 + 1:02d}'
+        schema_editor.execute(
+            f'CREATE TABLE {name} PARTITION OF {TABLE} '
+            f'FOR VALUES FROM ({_month_literal(index)}) TO ({_month_literal(index + 1)})'
+        )
+    # パーティションを作り忘れた月の行の受け皿
+    schema_editor.execute(f'CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT')
+    schema_editor.execute(
+        f'INSERT INTO {TABLE} (id, action, created_at, related_task_id, user_id) '
+        f'SELECT id, action, created_at, related_task_id, user_id FROM {TABLE}_legacy'
+    )
+    schema_editor.execute(f"SELECT setval('{SEQUENCE}', COALESCE((SELECT MAX(id) FROM {TABLE}), 0) + 1, false)")
+    schema_editor.execute(f'DROP TABLE {TABLE}_legacy')
+    schema_editor.execute(
+        f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_user_id_fk_users_user_id '
+        'FOREIGN KEY (user_id) REFERENCES users_user (id) DEFERRABLE INITIALLY DEFERRED'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_notification_inbox'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_activity_log, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='activitylog',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='activitylog_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='activitylog',
+            index=models.Index(fields=['related_task_id', '-created_at', '-id'], name='activitylog_task_created_idx'),
+        ),
+    ]
@@ -1,15 +1,58 @@
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager as BaseUserManager
 from django.db import models
+from django.utils import timezone
+
+from .hashing import hash_password, rehashes, verify_password
+
+class UserManager(BaseUserManager):
+    def _create_user_object(self, username, email, password, **extra_fields):
+        # ハッシュ化は set_password（API からはスレッドプール経由）に任せる
+        user = super()._create_user_object(username, email, None, **extra_fields)
+        if password is not None:
+            user.set_password(password)
+        return user
 
 class User(AbstractUser):
     profile_image = models.ImageField(upload_to='profile_images/', null=True, blank=True)
     bio = models.TextField(blank=True, default='')
     department = models.CharField(max_length=100, blank=True, default='')
     notify_email = models.BooleanField(default=True)
+    # 未読通知数の非正規化カウンタ（通知の作成・既読化・削除と同時に増減させる）
+    unread_notification_count = models.PositiveIntegerField(default=0, editable=False)
+    # これより前に発行された JWT は無効（パスワード変更時などに進める。users/authentication.py）
+    tokens_valid_after = models.DateTimeField(null=True, blank=True, editable=False)
+    # タスクの応答に埋め込むユーザー名が変わったことを ETag に反映するため（ログインなど update_fields 付きの保存では進まない）
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = UserManager()
 
     def __str__(self):
         return self.username
 
+    def set_password(self, raw_password):
+        # API のログイン・登録・パスワード変更では上限付きのプールで行う（users/hashing.py）
+        self.password = hash_password(raw_password)
+        self._password = raw_password
+
+    def check_password(self, raw_password):
+        """
+        照合はプールで行い、一致したうえで優先のハッシュ方式・コストと違っていれば付け替える
+        """
+        is_correct, must_update = verify_password(raw_password, self.password)
+        if is_correct and must_update and self.pk:
+            self.set_password(raw_password)
+            self._password = None
+            self.save(update_fields=['password'])
+            rehashes.inc()
+        return is_correct
+
+    def revoke_tokens(self):
+        """
+        発行済みのトークンをすべて無効にする（保存は呼び出し側で行う）。
+        トークンの iat は秒単位なので、秒未満を切り捨てて同じ秒に発行し直したトークンは通す
+        """
+        self.tokens_valid_after = timezone.now().replace(microsecond=0)
+
 class Notification(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
     message = models.CharField(max_length=255)
@@ -17,14 +60,35 @@ class Notification(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     link = models.URLField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # 受信箱のカーソルページング（新しい順）と未読だけの絞り込み用
+            models.Index(fields=['user', '-created_at', '-id'], name='notification_inbox_idx'),
+            models.Index(fields=['user', 'is_read', '-created_at', '-id'], name='notification_unread_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username}: {self.message[:20]}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 既読状態の変化をシグナルで検知するため、読み込み時の値を覚えておく
+        instance._loaded_is_read = instance.__dict__.get('is_read')
+        return instance
+
 class ActivityLog(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activity_logs')
     action = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
     related_task_id = models.IntegerField(blank=True, null=True)
 
+    class Meta:
+        # PostgreSQL では created_at の月別パーティションに分かれる（users/partitions.py）
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='activitylog_user_created_idx'),
+            models.Index(fields=['related_task_id', '-created_at', '-id'], name='activitylog_task_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username}: {self.action[:20]}"
@@ -0,0 +1,41 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+
+from .models import Notification, User
+
+
+def adjust_unread_counts(deltas):
+    """
+    {user_id: 増減数} を未読カウンタに反映する（ユーザーごとに UPDATE 1回）
+    """
+    for user_id, delta in deltas.items():
+        if delta:
+            User.objects.filter(pk=user_id).update(
+                unread_notification_count=Greatest(F('unread_notification_count') + delta, Value(0)),
+            )
+
+
+def count_unread(notifications):
+    return Counter(n.user_id for n in notifications if not n.is_read)
+
+
+def get_unread_count(user):
+    return User.objects.filter(pk=user.pk).values_list('unread_notification_count', flat=True).first() or 0
+
+
+def mark_read(user, ids=None):
+    """
+    指定した（ids が None なら全ての）未読通知を既読にし、カウンタを同じトランザクションで減らす。
+    既読にした件数を返す
+    """
+    with transaction.atomic():
+        notifications = Notification.objects.filter(user=user, is_read=False)
+        if ids is not None:
+            notifications = notifications.filter(id__in=ids)
+        updated = notifications.update(is_read=True)
+        adjust_unread_counts({user.pk: -updated})
+    return updated
+
@@ -0,0 +1,209 @@
+"""
+ActivityLog の月別パーティション管理。
+
+PostgreSQL では users_activitylog を created_at の RANGE で宣言的パーティション化し
+（マイグレーション 0004 で変換）、月ごとに users_activitylog_pYYYYMM を持つ。
+それ以外のDB（テストの SQLite など）では通常のテーブルのまま、同じ期間指定で
+削除する。月の境界は UTC で数える。
+
+パーティションの無い月の行は DEFAULT パーティション（users_activitylog_default）に入る。
+その月のパーティションを後から作るときは DEFAULT から行を移し、アーカイブ・削除の
+対象月にも DEFAULT に残っている月を含める。
+"""
+import gzip
+import json
+import os
+from datetime import date, datetime, timezone as dt_timezone
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from django.db import connection, transaction
+from django.db.models import Min
+
+from .models import ActivityLog
+
+TABLE = ActivityLog._meta.db_table
+DEFAULT_PARTITION = f'{TABLE}_default'
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_bounds(month):
+    """
+    月の [開始, 終了) を UTC の aware datetime で返す
+    """
+    start = datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc)
+    next_month = add_months(month, 1)
+    return start, datetime(next_month.year, next_month.month, 1, tzinfo=dt_timezone.utc)
+
+
+def partition_name(month):
+    return f'{TABLE}_p{month:%Y%m}'
+
+
+def is_partitioned():
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = %s',
+            [TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions():
+    """
+    月別パーティションを [(月, テーブル名)] で古い順に返す（DEFAULT パーティションは含まない）
+    """
+    if not is_partitioned():
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT child.relname FROM pg_inherits i '
+            'JOIN pg_class parent ON parent.oid = i.inhparent '
+            'JOIN pg_class child ON child.oid = i.inhrelid '
+            'WHERE parent.relname = %s',
+            [TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    prefix = f'{TABLE}_p'
+    months = []
+    for name in names:
+        suffix = name[len(prefix):]
+        if name.startswith(prefix) and len(suffix) == 6 and suffix.isdigit():
+            months.append((date(int(suffix[:4]), int(suffix[4:]), 1), name))
+    return sorted(months)
+
+
+def ensure_partitions(months_ahead=2, today=None):
+    """
+    今月から months_ahead か月先までのパーティションを作る。作成したテーブル名を返す
+    """
+    if not is_partitioned():
+        return []
+    current = month_start(today or datetime.now(dt_timezone.utc).date())
+    existing = {month for month, _ in list_partitions()}
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if month not in existing:
+            create_partition(month)
+            created.append(partition_name(month))
+    return created
+
+
+def create_partition(month):
+    """
+    1か月分のパーティションを作る。その月の行がすでに DEFAULT パーティションに入っていると
+    CREATE TABLE ... PARTITION OF が失敗するので、DEFAULT を一旦外して行を移してから付け直す
+    """
+    start, end = month_bounds(month)
+    parent = connection.ops.quote_name(TABLE)
+    quoted = connection.ops.quote_name(partition_name(month))
+    default = connection.ops.quote_name(DEFAULT_PARTITION)
+    with transaction.atomic(), connection.cursor() as cursor:
+        has_default = default_partition_exists(cursor)
+        if has_default:
+            cursor.execute(f'SELECT 1 FROM {default} WHERE created_at >= %s AND created_at < %s LIMIT 1', [start, end])
+            has_default = cursor.fetchone() is not None
+        if has_default:
+            cursor.execute(f'ALTER TABLE {parent} DETACH PARTITION {default}')
+        cursor.execute(f'CREATE TABLE {quoted} PARTITION OF {parent} FOR VALUES FROM (%s) TO (%s)', [start, end])
+        if has_default:
+            # 外している間の DEFAULT は普通のテーブルなので、親を通さず直接移す
+            cursor.execute(
+                f'WITH moved AS (DELETE FROM {default} WHERE created_at >= %s AND created_at < %s RETURNING *) '
+                f'INSERT INTO {quoted} SELECT * FROM moved',
+                [start, end],
+            )
+            cursor.execute(f'ALTER TABLE {parent} ATTACH PARTITION {default} DEFAULT')
+
+
+def default_partition_exists(cursor):
+    cursor.execute(
+        'SELECT 1 FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE c.relname = %s',
+        [DEFAULT_PARTITION],
+    )
+    return cursor.fetchone() is not None
+
+
+def default_partition_months(before):
+    """
+    DEFAULT パーティションに行が残っている before より前の月
+    """
+    with connection.cursor() as cursor:
+        if not default_partition_exists(cursor):
+            return []
+        cursor.execute(
+            f"SELECT DISTINCT date_trunc('month', created_at AT TIME ZONE 'UTC')::date "
+            f'FROM {connection.ops.quote_name(DEFAULT_PARTITION)} WHERE created_at < %s',
+            [month_bounds(before)[0]],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def drop_month(month):
+    """
+    1か月分の行を捨てる。パーティションがあれば DETACH して DROP、無ければ
+    （パーティション化していないDB、または DEFAULT パーティションに入っている月）期間で DELETE
+    """
+    partitions = dict(list_partitions())
+    if month in partitions:
+        quoted = connection.ops.quote_name(partitions[month])
+        with connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE {connection.ops.quote_name(TABLE)} DETACH PARTITION {quoted}')
+            cursor.execute(f'DROP TABLE {quoted}')
+        return
+    start, end = month_bounds(month)
+    # ActivityLog を参照するモデルも削除シグナルも無いので、行を読み込まない1文の DELETE になる
+    ActivityLog.objects.filter(created_at__gte=start, created_at__lt=end).delete()
+
+
+def months_before(cutoff):
+    """
+    cutoff より前で行が残っている月を古い順に返す
+    """
+    if is_partitioned():
+        months = {month for month, _ in list_partitions() if month < cutoff}
+        return sorted(months.union(default_partition_months(cutoff)))
+    oldest = ActivityLog.objects.aggregate(oldest=Min('created_at'))['oldest']
+    if oldest is None:
+        return []
+    months = []
+    month = month_start(oldest.astimezone(dt_timezone.utc))
+    while month < cutoff:
+        months.append(month)
+        month = add_months(month, 1)
+    return months
+
+
+def archive_month(month, directory, chunk_size=2000):
+    """
+    1か月分の行を gzip 圧縮した JSONL に書き出す。書き出したパスと件数を返す。
+    途中で失敗しても壊れたファイルが残らないよう、一時ファイルに書いてから rename する
+    """
+    start, end = month_bounds(month)
+    rows = (
+        ActivityLog.objects.filter(created_at__gte=start, created_at__lt=end)
+        .order_by('created_at', 'id')
+        .values('id', 'user_id', 'action', 'created_at', 'related_task_id')
+    )
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'activity_{month:%Y%m}.jsonl.gz')
+    tmp_path = f'{path}.tmp'
+    count = 0
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as fp:
+        for row in rows.iterator(chunk_size=chunk_size):
+            fp.write(json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False))
+            fp.write('\n')
+            count += 1
+    os.replace(tmp_path, path)
+    return path, count
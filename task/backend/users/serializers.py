@@ -1,5 +1,9 @@
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import UntypedToken
+from .authentication import TOKEN_CLAIMS, check_token_state
 
 User = get_user_model()
 
@@ -34,4 +38,31 @@ class NotificationSerializer(serializers.ModelSerializer):
 class ActivityLogSerializer(serializers.ModelSerializer):
     class Meta:
         model = User.activity_logs.rel.related_model
-        fields = ('id', 'action', 'created_at', 'related_task_id') 
\ No newline at end of file
+        fields = ('id', 'action', 'created_at', 'related_task_id') 
+class TaskActivityLogSerializer(serializers.ModelSerializer):
+    username = serializers.CharField(source='user.username', read_only=True)
+
+    class Meta:
+        model = User.activity_logs.rel.related_model
+        fields = ('id', 'user', 'username', 'action', 'created_at', 'related_task_id')
+
+class TokenObtainPairWithClaimsSerializer(TokenObtainPairSerializer):
+    """
+    StatelessJWTAuthentication が DB を引かずに答えられるよう、表示名などをトークンに載せる。
+    リフレッシュトークンに載せた値はアクセストークンの再発行時にも引き継がれる
+    """
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        for name in TOKEN_CLAIMS:
+            token[name] = getattr(user, name)
+        return token
+
+class TokenRefreshWithRevocationSerializer(TokenRefreshSerializer):
+    """
+    パスワード変更などで失効させたリフレッシュトークンからは再発行しない
+    """
+    def validate(self, attrs):
+        token = UntypedToken(attrs['refresh'])
+        check_token_state(User._meta.pk.to_python(token[api_settings.USER_ID_CLAIM]), token)
+        return super().validate(attrs)
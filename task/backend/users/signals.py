@@ -0,0 +1,101 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from common.cache import read_cache
+from tasks.models import Task
+from .activity import current_actor_id, get_activity_writer, records_flushed
+from .authentication import forget_user_state
+from .models import ActivityLog, Notification
+from .notifications import adjust_unread_counts, count_unread
+
+STATUS_LABELS = dict(Task._meta.get_field('status').choices)
+
+
+def enqueue(entries):
+    # ロールバックされた変更は記録しないよう、コミット後に書き込み待ちへ積む
+    def record():
+        writer = get_activity_writer()
+        for entry in entries:
+            writer.record(entry)
+    transaction.on_commit(record)
+
+
+def _actor_id(instance):
+    return current_actor_id() or instance.creator_id
+
+
+@receiver(post_save, sender=Task)
+def record_task_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    actor_id = _actor_id(instance)
+    previous_status = None if created else instance.loaded_value('status')
+    if created:
+        action = f'タスク「{instance.title}」を作成しました'
+    elif previous_status is not None and previous_status != instance.status:
+        label = STATUS_LABELS.get(instance.status, instance.status)
+        action = f'タスク「{instance.title}」のステータスを「{label}」に変更しました'
+    else:
+        action = f'タスク「{instance.title}」を更新しました'
+    entries = [ActivityLog(user_id=actor_id, action=action[:255], related_task_id=instance.pk)]
+
+    # 自分以外に担当者として割り当てられた人へ通知する
+    previous_assignee = None if created else instance.loaded_value('assignee_id')
+    if instance.assignee_id and instance.assignee_id not in (previous_assignee, actor_id):
+        entries.append(Notification(
+            user_id=instance.assignee_id,
+            message=f'タスク「{instance.title}」の担当者になりました'[:255],
+        ))
+    enqueue(entries)
+
+
+@receiver(post_delete, sender=Task)
+def record_task_deleted(sender, instance, **kwargs):
+    action = f'タスク「{instance.title}」を削除しました'
+    enqueue([ActivityLog(user_id=_actor_id(instance), action=action[:255], related_task_id=instance.pk)])
+
+
+@receiver(post_save, sender=Notification)
+def count_saved_notification(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    was_read = True if created else getattr(instance, '_loaded_is_read', instance.is_read)
+    if was_read != instance.is_read:
+        adjust_unread_counts({instance.user_id: -1 if instance.is_read else 1})
+    instance._loaded_is_read = instance.is_read
+
+
+@receiver(post_delete, sender=Notification)
+def count_deleted_notification(sender, instance, **kwargs):
+    if not instance.is_read:
+        adjust_unread_counts({instance.user_id: -1})
+
+
+@receiver(records_flushed, sender=Notification)
+def count_flushed_notifications(sender, instances, **kwargs):
+    # 一括書き込み分はユーザーごとにまとめて加算する
+    adjust_unread_counts(count_unread(instances))
+
+
+# ユーザー一覧（UserListSerializer）に出る列。ログインごとの last_login 更新などでは消さない
+USER_LIST_FIELDS = {'username', 'email'}
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def forget_cached_user_state(sender, instance, **kwargs):
+    # このプロセスの失効判定キャッシュを捨てる（他プロセスは JWT_REVOCATION_CACHE_TTL 以内に追従）
+    forget_user_state(instance.pk)
+
+
+@receiver(post_save, sender=get_user_model())
+def invalidate_user_list_cache(sender, created, update_fields=None, **kwargs):
+    if created or update_fields is None or USER_LIST_FIELDS & set(update_fields):
+        read_cache('users').invalidate_on_commit()
+
+
+@receiver(post_delete, sender=get_user_model())
+def invalidate_user_list_cache_on_delete(sender, **kwargs):
+    read_cache('users').invalidate_on_commit()
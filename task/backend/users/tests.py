@@ -1,8 +1,27 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import tempfile
+import unittest
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from rest_framework.test import APITestCase
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, APITestCase
 from rest_framework import status
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from tasks.models import Task
+from .activity import BufferedWriter, get_activity_writer
+from .authentication import StatelessJWTAuthentication
+from .hashing import get_hasher_pool
+from .models import ActivityLog, Notification
+from .partitions import ensure_partitions, list_partitions
+from .serializers import TokenObtainPairWithClaimsSerializer
 
 User = get_user_model()
 
@@ -34,3 +53,280 @@ class UserAPITests(APITestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['username'], 'profileuser')
+
+    def test_user_list_is_paginated_by_id(self):
+        users = [User.objects.create_user(username=f'listuser{i}', password='listpass123') for i in range(3)]
+        self.client.force_authenticate(user=users[0])
+        response = self.client.get(reverse('user-list') + '?page_size=2')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([u['id'] for u in response.data['results']], [users[0].id, users[1].id])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([u['id'] for u in response.data['results']], [users[2].id])
+        self.assertIsNone(response.data['next'])
+
+    def test_user_list_is_cached_until_listed_fields_change(self):
+        user = User.objects.create_user(username='cached', password='cachedpass123')
+        self.client.force_authenticate(user=user)
+        self.client.get(reverse('user-list'))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('user-list'))
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual([u['username'] for u in response.data['results']], ['cached'])
+
+        # ログイン時の last_login 更新では消さない
+        user.save(update_fields=['last_login'])
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('user-list'))
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        user.username = 'renamed'
+        user.save(update_fields=['username'])
+        response = self.client.get(reverse('user-list'))
+        self.assertEqual([u['username'] for u in response.data['results']], ['renamed'])
+
+
+@override_settings(ACTIVITY_WRITER={'BACKGROUND': False})
+class ActivityWriterTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='writer', password='writerpass123')
+        self.addCleanup(get_activity_writer().flush)
+
+    def test_buffered_writer_flushes_in_batches(self):
+        writer = BufferedWriter(batch_size=3, background=False)
+        for i in range(2):
+            writer.record(ActivityLog(user=self.user, action=f'action{i}'))
+        self.assertEqual(writer.pending(), 2)
+        self.assertFalse(ActivityLog.objects.exists())
+        writer.record(Notification(user=self.user, message='hello'))
+        # 件数しきい値に達したので書き込まれる
+        self.assertEqual(writer.pending(), 0)
+        self.assertEqual(ActivityLog.objects.count(), 2)
+        self.assertEqual(Notification.objects.count(), 1)
+        writer.record(ActivityLog(user=self.user, action='last'))
+        self.assertEqual(writer.close(), 1)
+        self.assertEqual(ActivityLog.objects.count(), 3)
+
+    def test_rows_recorded_after_close_are_written_immediately(self):
+        writer = BufferedWriter(batch_size=10)
+        writer.close()
+        writer.record(ActivityLog(user=self.user, action='late'))
+        self.assertEqual(writer.pending(), 0)
+        self.assertTrue(ActivityLog.objects.filter(action='late').exists())
+
+    def test_changing_writer_settings_flushes_pending_rows(self):
+        get_activity_writer().record(ActivityLog(user=self.user, action='pending'))
+        with override_settings(ACTIVITY_WRITER={'BACKGROUND': False, 'BATCH_SIZE': 10}):
+            self.assertEqual(list(ActivityLog.objects.values_list('action', flat=True)), ['pending'])
+
+    def test_failing_row_is_dropped_and_the_rest_of_the_batch_is_written(self):
+        writer = BufferedWriter(background=False)
+        writer.record(ActivityLog(user=self.user, action='before'))
+        writer.record(ActivityLog(user=self.user, action=None))
+        writer.record(ActivityLog(user=self.user, action='after'))
+        writer.record(Notification(user=self.user, message='unaffected'))
+        with self.assertLogs('users.activity', 'WARNING') as logs:
+            self.assertEqual(writer.flush(), 3)
+        self.assertEqual(sorted(ActivityLog.objects.values_list('action', flat=True)), ['after', 'before'])
+        self.assertEqual(Notification.objects.count(), 1)
+        # 一括2回（初回とやり直し）の失敗と、捨てた1行
+        self.assertEqual([record.levelname for record in logs.records], ['WARNING', 'WARNING', 'ERROR'])
+
+    def test_task_changes_are_logged_and_assignee_notified_after_commit(self):
+        assignee = User.objects.create_user(username='assignee', password='assigneepass123')
+        self.client.force_authenticate(user=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('task-list-create'), {'title': 'Logged', 'assignee': assignee.id}, format='json')
+        task_id = response.data['id']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(reverse('task-detail', args=[task_id]), {'status': 'done'}, format='json')
+        self.assertFalse(ActivityLog.objects.exists())
+        get_activity_writer().flush()
+        actions = list(ActivityLog.objects.filter(related_task_id=task_id).order_by('id').values_list('action', flat=True))
+        self.assertEqual(actions, ['タスク「Logged」を作成しました', 'タスク「Logged」のステータスを「完了」に変更しました'])
+        self.assertEqual(assignee.notifications.count(), 1)
+
+
+class NotificationInboxTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='inbox', password='inboxpass123')
+        self.client.force_authenticate(user=self.user)
+
+    def _unread_count(self):
+        return self.client.get(reverse('notification-unread-count')).data['unread_count']
+
+    def test_unread_counter_follows_create_mark_read_and_delete(self):
+        notifications = [Notification.objects.create(user=self.user, message=f'n{i}') for i in range(4)]
+        self.assertEqual(self._unread_count(), 4)
+        response = self.client.post(reverse('notification-mark-read'), {'ids': [notifications[0].id, notifications[1].id]}, format='json')
+        self.assertEqual(response.data, {'updated': 2, 'unread_count': 2})
+        notifications[2].delete()
+        self.assertEqual(self._unread_count(), 1)
+        self.client.post(reverse('notification-mark-read'), {}, format='json')
+        self.assertEqual(self._unread_count(), 0)
+        self.assertFalse(Notification.objects.filter(user=self.user, is_read=False).exists())
+
+    def test_buffered_notifications_update_counter_in_one_step(self):
+        writer = BufferedWriter(background=False)
+        for i in range(3):
+            writer.record(Notification(user=self.user, message=f'bulk{i}'))
+        writer.flush()
+        self.assertEqual(self._unread_count(), 3)
+
+    def test_inbox_is_cursor_paginated_and_filters_unread(self):
+        notifications = [Notification.objects.create(user=self.user, message=f'n{i}') for i in range(5)]
+        notifications[4].is_read = True
+        notifications[4].save()
+        self.assertEqual(self._unread_count(), 4)
+        response = self.client.get(reverse('notification-list'), {'unread': '1', 'page_size': 3})
+        self.assertEqual([n['id'] for n in response.data['results']], [n.id for n in notifications[3:0:-1]])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([n['id'] for n in response.data['results']], [notifications[0].id])
+        self.assertIsNone(response.data['next'])
+
+
+class ActivityLogHistoryTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='history', password='historypass123')
+        self.other = User.objects.create_user(username='other', password='otherpass123')
+        self.client.force_authenticate(user=self.user)
+        # 履歴を引けるのは見えるタスク（ここでは自分が担当の個人タスク）だけ
+        self.task = Task.objects.create(title='Shared', creator=self.other, assignee=self.user)
+        self.second_task = Task.objects.create(title='Second', creator=self.other, assignee=self.user)
+        ActivityLog.objects.all().delete()
+
+    def _log(self, user, action, created_at, task_id=None):
+        log = ActivityLog.objects.create(user=user, action=action, related_task_id=task_id)
+        ActivityLog.objects.filter(pk=log.pk).update(created_at=created_at)
+        return log
+
+    def test_activity_is_cursor_paginated_and_looked_up_per_task(self):
+        logs = [self._log(self.user, f'a{i}', datetime(2024, 5, i + 1, tzinfo=dt_timezone.utc), task_id=self.task.id) for i in range(3)]
+        other = self._log(self.other, 'b', datetime(2024, 5, 10, tzinfo=dt_timezone.utc), task_id=self.task.id)
+        response = self.client.get(reverse('user-activity-log'), {'page_size': 2})
+        self.assertEqual([log['id'] for log in response.data['results']], [logs[2].id, logs[1].id])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([log['id'] for log in response.data['results']], [logs[0].id])
+
+        response = self.client.get(reverse('task-activity-log', args=[self.task.id]))
+        self.assertEqual([log['id'] for log in response.data['results']], [other.id] + [log.id for log in reversed(logs)])
+        self.assertEqual(response.data['results'][0]['username'], 'other')
+
+        hidden = Task.objects.create(title='Hidden', creator=self.other)
+        response = self.client.get(reverse('task-activity-log', args=[hidden.id]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_activity_export_streams_ndjson_newest_first(self):
+        logs = [self._log(self.user, f'a{i}', datetime(2024, 5, i + 1, tzinfo=dt_timezone.utc), task_id=self.task.id) for i in range(3)]
+        self._log(self.other, 'b', datetime(2024, 5, 10, tzinfo=dt_timezone.utc), task_id=self.second_task.id)
+        response = self.client.get(reverse('user-activity-log-export'), {'format': 'ndjson'})
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows], [log.id for log in reversed(logs)])
+        self.assertEqual((rows[0]['username'], rows[0]['created_at']), ('history', '2024-05-03T09:00:00+09:00'))
+
+        response = self.client.get(reverse('task-activity-log-export', args=[self.second_task.id]), {'format': 'ndjson'})
+        self.assertEqual([json.loads(line)['username'] for line in b''.join(response.streaming_content).decode().splitlines()], ['other'])
+
+    def test_archive_writes_gzip_jsonl_and_drops_old_months(self):
+        old = [self._log(self.user, f'old{i}', datetime(2023, 1, 15, 12, i, tzinfo=dt_timezone.utc)) for i in range(2)]
+        self._log(self.user, 'older', datetime(2022, 12, 31, 23, 59, tzinfo=dt_timezone.utc))
+        recent = self._log(self.user, 'recent', datetime(2023, 2, 1, tzinfo=dt_timezone.utc))
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('archive_activity_logs', before='2023-02', output_dir=directory, stdout=io.StringIO())
+            with gzip.open(f'{directory}/activity_202301.jsonl.gz', 'rt', encoding='utf-8') as fp:
+                rows = [json.loads(line) for line in fp]
+            with gzip.open(f'{directory}/activity_202212.jsonl.gz', 'rt', encoding='utf-8') as fp:
+                self.assertEqual(len(fp.readlines()), 1)
+        self.assertEqual([row['id'] for row in rows], [log.id for log in old])
+        self.assertEqual(rows[0]['user_id'], self.user.id)
+        self.assertEqual(list(ActivityLog.objects.values_list('id', flat=True)), [recent.id])
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', '月別パーティションは PostgreSQL のみ')
+    def test_creating_a_partition_moves_its_month_out_of_the_default_partition(self):
+        # テストDBのパーティションはマイグレーションした月からなので、2023年の行は DEFAULT に入っている
+        logs = [self._log(self.user, f'old{i}', datetime(2023, 3, 10 + i, tzinfo=dt_timezone.utc)) for i in range(2)]
+        self._log(self.user, 'other month', datetime(2023, 4, 1, tzinfo=dt_timezone.utc))
+        self.assertEqual(ensure_partitions(months_ahead=0, today=date(2023, 3, 20)), ['users_activitylog_p202303'])
+        self.assertIn(date(2023, 3, 1), dict(list_partitions()))
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT id FROM users_activitylog_p202303 ORDER BY id')
+            self.assertEqual([row[0] for row in cursor.fetchall()], [log.id for log in logs])
+            cursor.execute('SELECT count(*) FROM users_activitylog_default')
+            self.assertEqual(cursor.fetchone()[0], 1)
+        self.assertEqual(ActivityLog.objects.count(), 3)
+
+
+class StatelessJWTAuthenticationTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='stateless', password='statelesspass123', email='s@example.com')
+        response = self.client.post(reverse('token_obtain_pair'), {'username': 'stateless', 'password': 'statelesspass123'}, format='json')
+        self.access, self.refresh = response.data['access'], response.data['refresh']
+
+    def _authenticate(self, token):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return StatelessJWTAuthentication().authenticate(request)[0]
+
+    def test_user_is_built_from_token_and_loaded_only_on_demand(self):
+        self._authenticate(self.access)
+        with self.assertNumQueries(0):
+            user = self._authenticate(self.access)
+            self.assertEqual((user.id, user.pk, user.username, user.is_staff), (self.user.id, self.user.id, 'stateless', False))
+            self.assertTrue(user.is_authenticated)
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, 's@example.com')
+
+    def test_password_change_revokes_earlier_tokens(self):
+        # iat は秒単位なので、変更より前に発行したトークンとして10秒前の発行時刻にする
+        earlier = TokenObtainPairWithClaimsSerializer.get_token(self.user)
+        earlier.set_iat(at_time=timezone.now() - timedelta(seconds=10))
+        earlier_access = earlier.access_token
+        earlier_access.set_iat(at_time=timezone.now() - timedelta(seconds=10))
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {earlier_access}')
+        response = self.client.post(reverse('user-change-password'), {'current_password': 'statelesspass123', 'new_password': 'Another-pass-456'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(self.client.get(reverse('notification-unread-count')).status_code, status.HTTP_401_UNAUTHORIZED)
+        refreshed = self.client.post(reverse('token_refresh'), {'refresh': str(earlier)}, format='json')
+        self.assertEqual(refreshed.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+        self.assertEqual(self.client.get(reverse('notification-unread-count')).status_code, status.HTTP_200_OK)
+
+
+class PasswordHashingTests(APITestCase):
+    def test_login_moves_legacy_hash_to_preferred_hasher(self):
+        user = User.objects.create(username='legacy', password=make_password('legacypass123', hasher='pbkdf2_sha256'))
+        response = self.client.post(reverse('token_obtain_pair'), {'username': 'legacy', 'password': 'legacypass123'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('argon2$'))
+        self.assertTrue(user.check_password('legacypass123'))
+
+    @override_settings(PASSWORD_HASHER_POOL={'WORKERS': 1, 'MAX_PENDING': 0, 'WAIT': 0, 'RETRY_AFTER': 3})
+    def test_saturated_pool_answers_429(self):
+        User.objects.create_user(username='busy', password='busypass123')
+        pool = get_hasher_pool()
+        pool._slots.acquire()
+        try:
+            response = self.client.post(reverse('token_obtain_pair'), {'username': 'busy', 'password': 'busypass123'}, format='json')
+        finally:
+            pool._slots.release()
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '3')
+        response = self.client.post(reverse('token_obtain_pair'), {'username': 'busy', 'password': 'busypass123'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(PASSWORD_HASHER_POOL={'WORKERS': 1, 'MAX_PENDING': 0, 'WAIT': 0, 'RETRY_AFTER': 3})
+    def test_only_api_requests_go_through_the_pool(self):
+        pool = get_hasher_pool()
+        pool._slots.acquire()
+        try:
+            response = self.client.post(reverse('user-register'), {'username': 'queued', 'password': 'queuedpass123'}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            self.assertEqual(response['Retry-After'], '3')
+            # 管理コマンドやシェルからの作成はプールを通らず、その場で計算する
+            user = User.objects.create_user(username='direct', password='directpass123')
+            self.assertTrue(user.check_password('directpass123'))
+            call_command('createsuperuser', username='root', email='root@example.com', interactive=False, stdout=io.StringIO())
+        finally:
+            pool._slots.release()
+        self.assertFalse(User.objects.filter(username='queued').exists())
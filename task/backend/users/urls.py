@@ -1,12 +1,17 @@
 from django.urls import path
-from .views import UserRegisterView, UserMeView, UserListView, change_password, notification_list, activity_log_list, me
+from .views import ActivityLogExportView, UserRegisterView, UserMeView, UserListView, ChangePasswordView, notification_list, notification_unread_count, notification_mark_read, activity_log_list, task_activity_log_list, me
 
 urlpatterns = [
     path('users/register/', UserRegisterView.as_view(), name='user-register'),
     path('users/me/', UserMeView.as_view(), name='user-me'),
-    path('users/me/change_password/', change_password, name='user-change-password'),
+    path('users/me/change_password/', ChangePasswordView.as_view(), name='user-change-password'),
     path('users/me/activity/', activity_log_list, name='user-activity-log'),
+    path('users/me/activity/export/', ActivityLogExportView.as_view(), name='user-activity-log-export'),
+    path('tasks/<int:task_id>/activity/', task_activity_log_list, name='task-activity-log'),
+    path('tasks/<int:task_id>/activity/export/', ActivityLogExportView.as_view(), name='task-activity-log-export'),
     path('users/', UserListView.as_view(), name='user-list'),
     path('notifications/', notification_list, name='notification-list'),
+    path('notifications/unread_count/', notification_unread_count, name='notification-unread-count'),
+    path('notifications/mark_read/', notification_mark_read, name='notification-mark-read'),
     path('me/', me, name='me'),
 ] 
\ No newline at end of file
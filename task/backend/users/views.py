@@ -1,6 +1,6 @@
 from django.shortcuts import render
 from rest_framework import generics, permissions
-from .serializers import UserRegisterSerializer, UserSerializer, NotificationSerializer, ActivityLogSerializer
+from .serializers import UserRegisterSerializer, UserSerializer, NotificationSerializer, ActivityLogSerializer, TaskActivityLogSerializer, TokenObtainPairWithClaimsSerializer
 from django.contrib.auth import get_user_model
 from rest_framework.response import Response
 from rest_framework.views import APIView
@@ -8,14 +8,44 @@ from rest_framework import serializers
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework import status
 from django.contrib.auth import authenticate
+from django.http import Http404
 from django.contrib.auth.password_validation import validate_password
+from rest_framework.exceptions import Throttled
 from rest_framework.permissions import IsAuthenticated
+from rest_framework_simplejwt import views as jwt_views
+from common.cache import CachedListMixin
+from common.export import StreamingExportMixin
+from common.pagination import KeysetPagination
+from tasks.models import Task
+from tasks.visibility import visible_tasks
+from .hashing import HasherPoolSaturated, pooled_hashing
+from .models import ActivityLog
+from .notifications import get_unread_count, mark_read
 
 User = get_user_model()
 
 # Create your views here.
 
-class UserRegisterView(generics.CreateAPIView):
+BUSY_DETAIL = 'ただいま混み合っています。しばらくしてから再度お試しください。'
+
+class PooledHashingMixin:
+    """
+    パスワードのハッシュ化・照合をプール（users/hashing.py）で行い、混雑時は 429 と Retry-After を返す
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        with pooled_hashing():
+            return super().dispatch(request, *args, **kwargs)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, HasherPoolSaturated):
+            exc = Throttled(wait=exc.retry_after, detail=BUSY_DETAIL, code='hasher_pool_saturated')
+        return super().handle_exception(exc)
+
+class TokenObtainPairView(PooledHashingMixin, jwt_views.TokenObtainPairView):
+    pass
+
+class UserRegisterView(PooledHashingMixin, generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = UserRegisterSerializer
 
@@ -40,42 +70,123 @@ class UserListSerializer(serializers.ModelSerializer):
         model = User
         fields = ('id', 'username', 'email')
 
-class UserListView(generics.ListAPIView):
+class UserListView(CachedListMixin, generics.ListAPIView):
+    # 担当者の選択肢として画面ごとに読まれるので、シリアライズ結果をキャッシュする（users/signals.py で無効化）
+    list_cache_name = 'users'
     queryset = User.objects.all()
     serializer_class = UserListSerializer
     permission_classes = [permissions.IsAuthenticated]
+    # User には updated_at が無いので主キー順でページングする
+    pagination_ordering = ('id',)
 
-@api_view(['POST'])
-@permission_classes([permissions.IsAuthenticated])
-def change_password(request):
-    user = request.user
-    current_password = request.data.get('current_password')
-    new_password = request.data.get('new_password')
-    if not current_password or not new_password:
-        return Response({'detail': '現在のパスワードと新しいパスワードを入力してください。'}, status=status.HTTP_400_BAD_REQUEST)
-    if not user.check_password(current_password):
-        return Response({'detail': '現在のパスワードが正しくありません。'}, status=status.HTTP_400_BAD_REQUEST)
-    try:
-        validate_password(new_password, user)
-    except Exception as e:
-        return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
-    user.set_password(new_password)
-    user.save()
-    return Response({'detail': 'パスワードを変更しました。'})
+class ChangePasswordView(PooledHashingMixin, APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        user = request.user
+        current_password = request.data.get('current_password')
+        new_password = request.data.get('new_password')
+        if not current_password or not new_password:
+            return Response({'detail': '現在のパスワードと新しいパスワードを入力してください。'}, status=status.HTTP_400_BAD_REQUEST)
+        if not user.check_password(current_password):
+            return Response({'detail': '現在のパスワードが正しくありません。'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            validate_password(new_password, user)
+        except Exception as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        user.set_password(new_password)
+        # 変更前に発行したトークンは使えなくし、このクライアントには新しいトークンを返す
+        user.revoke_tokens()
+        user.save()
+        refresh = TokenObtainPairWithClaimsSerializer.get_token(user)
+        return Response({'detail': 'パスワードを変更しました。', 'access': str(refresh.access_token), 'refresh': str(refresh)})
+
+class NotificationPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def notification_list(request):
-    notifications = request.user.notifications.order_by('-created_at')
-    serializer = NotificationSerializer(notifications, many=True)
-    return Response(serializer.data)
+    notifications = request.user.notifications.all()
+    if request.query_params.get('unread') in ('1', 'true'):
+        notifications = notifications.filter(is_read=False)
+    paginator = NotificationPagination()
+    page = paginator.paginate_queryset(notifications, request)
+    serializer = NotificationSerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def notification_unread_count(request):
+    return Response({'unread_count': get_unread_count(request.user)})
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def notification_mark_read(request):
+    # ids を省略するとすべての未読通知を既読にする
+    ids = request.data.get('ids')
+    if ids is not None and (not isinstance(ids, list) or not all(isinstance(i, int) for i in ids)):
+        return Response({'detail': 'ids には通知IDのリストを指定してください。'}, status=status.HTTP_400_BAD_REQUEST)
+    updated = mark_read(request.user, ids)
+    return Response({'updated': updated, 'unread_count': get_unread_count(request.user)})
+
+class ActivityLogPagination(KeysetPagination):
+    # (user, -created_at, -id) / (related_task_id, -created_at, -id) のインデックスに沿って読む
+    ordering = ('-created_at', '-id')
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def activity_log_list(request):
-    logs = request.user.activity_logs.order_by('-created_at')
-    serializer = ActivityLogSerializer(logs, many=True)
-    return Response(serializer.data)
+    logs = request.user.activity_logs.all()
+    paginator = ActivityLogPagination()
+    page = paginator.paginate_queryset(logs, request)
+    serializer = ActivityLogSerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
+
+def check_task_visible(request, task_id):
+    # 見えないタスクの履歴は、タスクが無いときと同じく 404 にする（管理者は削除済みのタスクの履歴も見られる）
+    if not request.user.is_staff and not visible_tasks(Task.objects.filter(pk=task_id), request.user).exists():
+        raise Http404
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def task_activity_log_list(request, task_id):
+    check_task_visible(request, task_id)
+    logs = ActivityLog.objects.filter(related_task_id=task_id).select_related('user')
+    paginator = ActivityLogPagination()
+    page = paginator.paginate_queryset(logs, request)
+    serializer = TaskActivityLogSerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
+
+class ActivityLogExportView(StreamingExportMixin, APIView):
+    """
+    活動履歴を新しい順に ?format=csv|ndjson でストリーミングする。
+    task_id があればそのタスクの履歴、無ければ自分の履歴
+    """
+    permission_classes = [IsAuthenticated]
+    export_filename = 'activity'
+
+    def get_export_columns(self):
+        return [
+            ('id', 'id'),
+            ('user_id', 'user_id'),
+            ('username', 'user__username'),
+            ('action', 'action'),
+            ('related_task_id', 'related_task_id'),
+            ('created_at', 'created_at'),
+        ]
+
+    def get_export_queryset(self):
+        task_id = self.kwargs.get('task_id')
+        if task_id is not None:
+            check_task_visible(self.request, task_id)
+            logs = ActivityLog.objects.filter(related_task_id=task_id)
+        else:
+            logs = ActivityLog.objects.filter(user_id=self.request.user.id)
+        return logs.order_by(*ActivityLogPagination.ordering)
+
+    def get(self, request, task_id=None):
+        return self.export_response(request)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
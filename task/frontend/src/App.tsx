@@ -350,7 +350,10 @@ const App: React.FC = () => {
     const token = localStorage.getItem('accessToken');
     if (!token) return;
     try {
-      await changePassword(token, current, newPass);
+      const result = await changePassword(token, current, newPass);
+      // 変更前に発行したトークンは失効するので、返ってきた新しいトークンに差し替える
+      localStorage.setItem('accessToken', result.access);
+      localStorage.setItem('refreshToken', result.refresh);
       alert('パスワードを変更しました');
       setProfileModalOpen(false);
     } catch (e: any) {
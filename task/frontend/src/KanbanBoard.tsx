@@ -16,6 +16,7 @@ type Task = {
   creator_name?: string; // 作成者名（APIで取得できる場合）
   start_date?: string;
   end_date?: string;
+  version?: number; // 楽観的排他制御の版数（If-Match に使う）
 };
 
 interface User {
@@ -164,7 +165,11 @@ const KanbanBoard: React.FC<KanbanBoardProps> = ({ onlyMine, hideAssigneeFilter,
         start_date: task.start_date,
         end_date: task.end_date,
         status: destStatus,
-      });
+      }, task.version);
+      loadTasks();
+    } catch (e: any) {
+      // 他の人が先に動かしていた場合など。最新の状態に戻す
+      alert(e.message || '移動に失敗しました');
       loadTasks();
     } finally {
       setLoading(false);
@@ -181,7 +186,7 @@ const KanbanBoard: React.FC<KanbanBoardProps> = ({ onlyMine, hideAssigneeFilter,
     }
     setLoading(true);
     try {
-      await deleteTask(token, task.id);
+      await deleteTask(token, task.id, task.version);
       loadTasks();
     } catch (e: any) {
       alert(e.message || '削除に失敗しました');
@@ -238,7 +243,7 @@ const KanbanBoard: React.FC<KanbanBoardProps> = ({ onlyMine, hideAssigneeFilter,
         start_date: editForm.start_date || null,
         end_date: editForm.end_date || null,
         status: editForm.status,
-      });
+      }, editTask.version);
       closeEditModal();
       loadTasks();
     } catch (e: any) {
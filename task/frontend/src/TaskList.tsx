@@ -15,6 +15,7 @@ type Task = {
   creator?: number;
   creator_name?: string;
   project?: number;
+  version?: number; // 楽観的排他制御の版数（If-Match に使う）
 };
 
 type User = {
@@ -158,7 +159,7 @@ const TaskList: React.FC<TaskListProps> = ({ onlyMine, hideAssigneeFilter, userI
         start_date: editStartDate || undefined,
         end_date: editEndDate || undefined,
         project: editProject || undefined,
-      });
+      }, tasks.find(task => task.id === editId)?.version);
       setEditId(null);
       setEditTitle('');
       setEditDescription('');
@@ -167,8 +168,9 @@ const TaskList: React.FC<TaskListProps> = ({ onlyMine, hideAssigneeFilter, userI
       setEditEndDate('');
       setEditProject('');
       loadTasks();
-    } catch {
-      setError('タスク編集に失敗しました');
+    } catch (err: any) {
+      setError(err instanceof Error ? err.message : 'タスク編集に失敗しました');
+      loadTasks();
     }
     setLoading(false);
   };
@@ -184,7 +186,7 @@ const TaskList: React.FC<TaskListProps> = ({ onlyMine, hideAssigneeFilter, userI
       return;
     }
     try {
-      await deleteTask(token, id);
+      await deleteTask(token, id, tasks.find(task => task.id === id)?.version);
       loadTasks();
     } catch {
       setError('タスク削除に失敗しました');
@@ -0,0 +1,19 @@
+// カーソルページネーションされた一覧APIを next が無くなるまで辿って結合する
+export async function fetchAllPages(url: string, token: string, errorMessage: string) {
+  const results: any[] = [];
+  let next: string | null = url;
+  while (next) {
+    const response: Response = await fetch(next, {
+      headers: {
+        'Authorization': `Bearer ${token}`,
+      },
+    });
+    if (!response.ok) {
+      throw new Error(errorMessage);
+    }
+    const page = await response.json();
+    results.push(...page.results);
+    next = page.next;
+  }
+  return results;
+}
@@ -1,3 +1,5 @@
+import { fetchAllPages } from './pagination';
+
 const API_BASE_URL = process.env.REACT_APP_API_BASE_URL || 'http://localhost:8000';
 
 export async function fetchTasks(token: string, projectId?: number | '') {
@@ -5,7 +7,120 @@ export async function fetchTasks(token: string, projectId?: number | '') {
   if (projectId) {
     url += `?project=${projectId}`;
   }
-  const response = await fetch(url, {
+  return fetchAllPages(url, token, 'タスク取得に失敗しました');
+}
+
+// ボード表示用に必要なフィールドだけを列名＋配列の配列（?format=compact）で取得し、オブジェクトに戻す
+export async function fetchTaskCards(token: string, fields: string[] = ['id', 'title', 'status', 'assignee_name'], projectId?: number | '') {
+  const params = new URLSearchParams({ fields: fields.join(','), format: 'compact', fast: '1' });
+  if (projectId) {
+    params.set('project', String(projectId));
+  }
+  const cards: any[] = [];
+  let next: string | null = `${API_BASE_URL}/api/tasks/?${params.toString()}`;
+  while (next) {
+    const response: Response = await fetch(next, {
+      headers: {
+        'Authorization': `Bearer ${token}`,
+      },
+    });
+    if (!response.ok) {
+      throw new Error('タスク取得に失敗しました');
+    }
+    const page = await response.json();
+    for (const row of page.rows) {
+      cards.push(Object.fromEntries(page.columns.map((column: string, index: number) => [column, row[index]])));
+    }
+    next = page.next;
+  }
+  return cards;
+}
+
+// 他ツールから書き出したタスク（CSV / JSON / NDJSON）を取り込む。
+// complete が false なら同じファイルを offset に next_offset を渡して再送する
+export async function importTasks(token: string, file: File, options: { dryRun?: boolean; offset?: number } = {}) {
+  const body = new FormData();
+  body.append('file', file);
+  if (options.dryRun) {
+    body.append('dry_run', '1');
+  }
+  if (options.offset) {
+    body.append('offset', String(options.offset));
+  }
+  const response = await fetch(`${API_BASE_URL}/api/tasks/import/`, {
+    method: 'POST',
+    headers: {
+      'Authorization': `Bearer ${token}`,
+    },
+    body,
+  });
+  if (!response.ok) {
+    throw new Error('タスクの取り込みに失敗しました');
+  }
+  return response.json(); // { rows, created, skipped, failed, complete, next_offset, errors }
+}
+
+// タスクを CSV / NDJSON でまとめてダウンロードする（サーバー側はストリーミング）
+export async function exportTasks(token: string, format: 'csv' | 'ndjson' = 'csv', projectId?: number | '') {
+  const params = new URLSearchParams({ format });
+  if (projectId) {
+    params.set('project', String(projectId));
+  }
+  const response = await fetch(`${API_BASE_URL}/api/tasks/export/?${params.toString()}`, {
+    headers: {
+      'Authorization': `Bearer ${token}`,
+    },
+  });
+  if (!response.ok) {
+    throw new Error('タスクのエクスポートに失敗しました');
+  }
+  return response.blob();
+}
+
+// タイトル・説明文の全文検索（関連度順）。次ページは戻り値の next を渡す
+export async function searchTasks(token: string, q: string, options: { projectId?: number | ''; next?: string } = {}) {
+  const params = new URLSearchParams({ q });
+  if (options.projectId) {
+    params.set('project', String(options.projectId));
+  }
+  const response = await fetch(options.next || `${API_BASE_URL}/api/tasks/search/?${params.toString()}`, {
+    headers: {
+      'Authorization': `Bearer ${token}`,
+    },
+  });
+  if (!response.ok) {
+    throw new Error('タスク検索に失敗しました');
+  }
+  return response.json(); // { next, results }
+}
+
+// since トークン以降の変更分だけを取得する（初回は token 無しで全件 + reset: true）
+export async function fetchTaskChanges(token: string, since?: string, projectId?: number | '') {
+  const params = new URLSearchParams();
+  if (since) {
+    params.set('since', since);
+  }
+  if (projectId) {
+    params.set('project', String(projectId));
+  }
+  const response = await fetch(`${API_BASE_URL}/api/tasks/changes/?${params.toString()}`, {
+    headers: {
+      'Authorization': `Bearer ${token}`,
+    },
+  });
+  if (!response.ok) {
+    throw new Error('タスク差分取得に失敗しました');
+  }
+  return response.json(); // { token, reset, changed, deleted }
+}
+
+// ガントチャート表示期間と重なるタスクを列指向形式で取得する（日付は origin からの日数）
+export async function fetchTaskTimeline(token: string, from: string, to: string, projectId?: number | '') {
+  const params = new URLSearchParams({ from, to });
+  if (projectId) {
+    params.set('project', String(projectId));
+  }
+  const response = await fetch(`${API_BASE_URL}/api/tasks/?${params.toString()}`, {
     headers: {
       'Authorization': `Bearer ${token}`,
     },
@@ -13,9 +128,34 @@ export async function fetchTasks(token: string, projectId?: number | '') {
   if (!response.ok) {
     throw new Error('タスク取得に失敗しました');
   }
+  return response.json(); // { origin, count, ids, titles, statuses, starts, ends, assignees, projects }
+}
+
+// ダッシュボード用の集計（ステータス別・プロジェクト別・担当者別・期限切れ件数）
+export async function fetchTaskStats(token: string) {
+  const response = await fetch(`${API_BASE_URL}/api/tasks/stats/`, {
+    headers: {
+      'Authorization': `Bearer ${token}`,
+    },
+  });
+  if (!response.ok) {
+    throw new Error('タスク集計取得に失敗しました');
+  }
   return response.json();
 }
 
+// タスク・プロジェクト・通知の変更イベントを Server-Sent Events で購読する。戻り値の close() で切断
+export function subscribeTaskEvents(token: string, onEvent: (event: { type: string; id?: number; project?: number | null }) => void, projectId?: number | '') {
+  const params = new URLSearchParams({ token });
+  if (projectId) {
+    params.set('project', String(projectId));
+  }
+  const source = new EventSource(`${API_BASE_URL}/api/stream/?${params.toString()}`);
+  const types = ['task.created', 'task.updated', 'task.deleted', 'project.created', 'project.updated', 'project.deleted', 'notification.created', 'membership.created', 'membership.deleted', 'resync'];
+  types.forEach(type => source.addEventListener(type, (e: MessageEvent) => onEvent(JSON.parse(e.data))));
+  return source;
+}
+
 export async function createTask(token: string, data: { title: string; description?: string; assignee?: number; project?: number }) {
   const response = await fetch(`${API_BASE_URL}/api/tasks/`, {
     method: 'POST',
@@ -32,28 +172,61 @@ export async function createTask(token: string, data: { title: string; descripti
   return response.json();
 }
 
-export async function updateTask(token: string, id: number, data: { title: string; description?: string; status?: string; assignee?: number; start_date?: string; end_date?: string; project?: number }) {
+export const TASK_CONFLICT_MESSAGE = '他の人が先にこのタスクを変更しました。最新の内容を読み込み直してから編集してください。';
+
+// タスクの ETag は版数（version）そのもの。If-Match に付けると、読み込んだ後に他の人が変更していれば 412 になる
+function ifMatch(version?: number): Record<string, string> {
+  return version === undefined ? {} : { 'If-Match': `"${version}"` };
+}
+
+// version には一覧・詳細で受け取った task.version を渡す（省略すると上書きの確認をしない）
+export async function updateTask(token: string, id: number, data: { title: string; description?: string; status?: string; assignee?: number; start_date?: string; end_date?: string; project?: number }, version?: number) {
   const response = await fetch(`${API_BASE_URL}/api/tasks/${id}/`, {
     method: 'PUT',
     headers: {
       'Authorization': `Bearer ${token}`,
       'Content-Type': 'application/json',
+      ...ifMatch(version),
     },
     body: JSON.stringify(data),
   });
+  if (response.status === 412 || response.status === 409) {
+    throw new Error(TASK_CONFLICT_MESSAGE);
+  }
   if (!response.ok) {
     throw new Error('タスク編集に失敗しました');
   }
   return response.json();
 }
 
-export async function deleteTask(token: string, id: number) {
+// 作成・部分更新・削除をまとめて送る（カンバンで複数カードを動かした時など）
+export async function bulkTasks(token: string, operations: { op: 'create' | 'update' | 'delete'; id?: number; version?: number; data?: any }[]) {
+  const response = await fetch(`${API_BASE_URL}/api/tasks/bulk/`, {
+    method: 'POST',
+    headers: {
+      'Authorization': `Bearer ${token}`,
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({ operations }),
+  });
+  const body = await response.json().catch(() => ({}));
+  if (!response.ok) {
+    throw new Error(JSON.stringify(body.results || body) || 'タスク一括更新に失敗しました');
+  }
+  return body.results;
+}
+
+export async function deleteTask(token: string, id: number, version?: number) {
   const response = await fetch(`${API_BASE_URL}/api/tasks/${id}/`, {
     method: 'DELETE',
     headers: {
       'Authorization': `Bearer ${token}`,
+      ...ifMatch(version),
     },
   });
+  if (response.status === 412 || response.status === 409) {
+    throw new Error(TASK_CONFLICT_MESSAGE);
+  }
   if (!response.ok) {
     throw new Error('タスク削除に失敗しました');
   }
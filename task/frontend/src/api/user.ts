@@ -1,3 +1,5 @@
+import { fetchAllPages } from './pagination';
+
 const API_BASE_URL = process.env.REACT_APP_API_BASE_URL || 'http://localhost:8000' ;
 
 export async function fetchUserMe(token: string) {
@@ -13,15 +15,7 @@ export async function fetchUserMe(token: string) {
 }
 
 export async function getUsers(token: string) {
-  const response = await fetch(`${API_BASE_URL}/api/users/`, {
-    headers: {
-      'Authorization': `Bearer ${token}`,
-    },
-  });
-  if (!response.ok) {
-    throw new Error('ユーザー一覧取得に失敗しました');
-  }
-  return response.json();
+  return fetchAllPages(`${API_BASE_URL}/api/users/`, token, 'ユーザー一覧取得に失敗しました');
 }
 
 export async function fetchUserProfile(token: string) {
@@ -63,11 +57,16 @@ export async function changePassword(token: string, current_password: string, ne
     const errorData = await response.json().catch(() => ({}));
     throw new Error(errorData.detail || 'パスワード変更に失敗しました');
   }
-  return response.json();
+  return response.json(); // { detail, access, refresh }
 }
 
-export async function fetchNotifications(token: string) {
-  const response = await fetch(`${API_BASE_URL}/api/notifications/`, {
+// 通知は新しい順にカーソルでページングされる。次ページは戻り値の next を cursor に渡す
+export async function fetchNotifications(token: string, options: { unread?: boolean; next?: string } = {}) {
+  let url = options.next || `${API_BASE_URL}/api/notifications/`;
+  if (!options.next && options.unread) {
+    url += '?unread=1';
+  }
+  const response = await fetch(url, {
     headers: {
       'Authorization': `Bearer ${token}`,
     },
@@ -75,11 +74,40 @@ export async function fetchNotifications(token: string) {
   if (!response.ok) {
     throw new Error('通知一覧取得に失敗しました');
   }
-  return response.json();
+  return response.json(); // { next, results }
+}
+
+export async function fetchUnreadNotificationCount(token: string) {
+  const response = await fetch(`${API_BASE_URL}/api/notifications/unread_count/`, {
+    headers: {
+      'Authorization': `Bearer ${token}`,
+    },
+  });
+  if (!response.ok) {
+    throw new Error('未読件数取得に失敗しました');
+  }
+  return (await response.json()).unread_count as number;
 }
 
-export async function fetchActivityLogs(token: string) {
-  const response = await fetch(`${API_BASE_URL}/api/users/me/activity/`, {
+// ids を省略するとすべて既読にする
+export async function markNotificationsRead(token: string, ids?: number[]) {
+  const response = await fetch(`${API_BASE_URL}/api/notifications/mark_read/`, {
+    method: 'POST',
+    headers: {
+      'Authorization': `Bearer ${token}`,
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify(ids ? { ids } : {}),
+  });
+  if (!response.ok) {
+    throw new Error('通知の既読化に失敗しました');
+  }
+  return response.json(); // { updated, unread_count }
+}
+
+// 活動履歴は新しい順にカーソルでページングされる。次ページは戻り値の next を渡す
+export async function fetchActivityLogs(token: string, next?: string) {
+  const response = await fetch(next || `${API_BASE_URL}/api/users/me/activity/`, {
     headers: {
       'Authorization': `Bearer ${token}`,
     },
@@ -87,5 +115,17 @@ export async function fetchActivityLogs(token: string) {
   if (!response.ok) {
     throw new Error('活動履歴取得に失敗しました');
   }
-  return response.json();
+  return response.json(); // { next, results }
+}
+
+export async function fetchTaskActivityLogs(token: string, taskId: number, next?: string) {
+  const response = await fetch(next || `${API_BASE_URL}/api/tasks/${taskId}/activity/`, {
+    headers: {
+      'Authorization': `Bearer ${token}`,
+    },
+  });
+  if (!response.ok) {
+    throw new Error('タスクの活動履歴取得に失敗しました');
+  }
+  return response.json(); // { next, results }
 } 
\ No newline at end of file